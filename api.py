@@ -1,86 +1,362 @@
 from datetime import datetime, timezone
-import requests
+import hashlib
+import threading
 import time
-from config import BATCH_SIZE, API_DELAY, MAX_RETRIES, REQUEST_TIMEOUT, CONNECT_TIMEOUT, CHECK_FROM_DATE
+import budget
+import cassette
+import codec
+import metrics
+import profiling
+from config import BATCH_SIZE, API_DELAY, MAX_RETRIES, REQUEST_TIMEOUT, CONNECT_TIMEOUT, CHECK_FROM_DATE, HTTP_CACHE_FILE, OPENDOTA_API_URL
 
-# Add session for connection pooling
-session = requests.Session()
-session.headers.update({'User-Agent': 'ChallengeChecker/1.0'})
+# Session for connection pooling, built on the first request so commands
+# that never touch the network don't pay for importing requests.
+session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    global session
+    if session is None:
+        with _session_lock:
+            if session is None:
+                import requests
+                s = requests.Session()
+                s.headers.update({'User-Agent': 'ChallengeChecker/1.0'})
+                session = s
+    return session
+
+# Recording or replaying a cassette (cassette.py), decided on the first request
+_tape = None
+_tape_ready = False
+_no_wait = False
+
+def _send(method, endpoint, url, **kwargs):
+    global _tape, _tape_ready, _no_wait
+    if not _tape_ready:
+        with _session_lock:
+            if not _tape_ready:
+                _tape = cassette.from_config()
+                if isinstance(_tape, cassette.Player) and _tape.fast:
+                    _no_wait = True  # Recorded 429s and timeouts come back at once
+                    set_pacing(0)
+                _tape_ready = True
+    if _tape is None:
+        return get_session().request(method, url, **kwargs)
+    return _tape.request(method, endpoint, url, lambda: get_session().request(method, url, **kwargs))
+
+def http_request(method, endpoint, url, **kwargs):
+    """session.request, counted per endpoint (requests, status, bytes, latency) when metrics are on."""
+    if not metrics.enabled:
+        return _send(method, endpoint, url, **kwargs)
+    import requests
+    t0 = time.perf_counter()
+    try:
+        r = _send(method, endpoint, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        metrics.incr("http_errors_total", endpoint=endpoint, error=type(e).__name__)
+        raise
+    finally:
+        metrics.observe("http_request_seconds", time.perf_counter() - t0, endpoint=endpoint)
+    metrics.incr("http_requests_total", endpoint=endpoint, status=r.status_code)
+    metrics.incr("http_response_bytes_total", len(r.content), endpoint=endpoint)
+    return r
+
+def _checked(r):
+    """Note OpenDota's remaining per-minute allowance (see _pace) and hand the response back."""
+    global _remaining
+    remaining = r.headers.get("X-Rate-Limit-Remaining-Minute")
+    if remaining is not None and remaining.isdigit():
+        _remaining = int(remaining)
+    return r
+
+# ---------------- CONDITIONAL REQUEST CACHE ---------------- #
+# Validators (ETag / Last-Modified / body hash) per match-list URL, so an
+# unchanged listing costs a 304 or a hash compare instead of a JSON parse.
+http_cache = None
+cache_stats = {"requests": 0, "not_modified": 0, "hash_hits": 0}
+
+def load_http_cache(path=HTTP_CACHE_FILE):
+    global http_cache
+    try:
+        with open(path, "r") as f:
+            http_cache = codec.load(f)
+    except FileNotFoundError:
+        http_cache = {}
+    except Exception as e:
+        print(f"[WARN] Ignoring unreadable {path}: {e}")
+        http_cache = {}
+    return http_cache
+
+def save_http_cache(path=HTTP_CACHE_FILE):
+    if http_cache is None:
+        return
+    with open(path, "w") as f:
+        codec.dump(http_cache, f, indent=2, sort_keys=True)
+
+def discard_validators(url):
+    """Forget a listing's validators so the next run re-reads it in full."""
+    (http_cache if http_cache is not None else load_http_cache()).pop(url, None)
+
+def cache_report():
+    total = cache_stats["requests"]
+    hits = cache_stats["not_modified"] + cache_stats["hash_hits"]
+    rate = (hits / total * 100) if total else 0.0
+    return (f"{hits}/{total} listings unchanged ({rate:.0f}%): "
+            f"{cache_stats['not_modified']} x 304, {cache_stats['hash_hits']} x hash match")
+
+def _conditional_headers(url):
+    entry = (http_cache if http_cache is not None else load_http_cache()).get(url, {})
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def _is_unchanged(url, r):
+    """True if the listing matches what we saw last run (304 or same body hash)."""
+    cache_stats["requests"] += 1
+    if r.status_code == 304:
+        cache_stats["not_modified"] += 1
+        metrics.incr("listing_cache_total", result="not_modified")
+        return True
+    if http_cache.get(url, {}).get("sha1") == hashlib.sha1(r.content).hexdigest():
+        cache_stats["hash_hits"] += 1
+        metrics.incr("listing_cache_total", result="hash_hit")
+        return True
+    metrics.incr("listing_cache_total", result="changed")
+    return False
+
+def _remember_validators(url, r):
+    http_cache[url] = {
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "sha1": hashlib.sha1(r.content).hexdigest(),
+    }
+
+# ---------------- SHARED PACING ---------------- #
+# Requests are spaced API_DELAY apart across all threads, so adding pipeline
+# workers overlaps waiting on responses without raising our request rate.
+# A 429 pushes the next slot out for every thread, not just the one that hit it.
+#
+# When OpenDota reports how many requests are left this minute, spacing
+# stretches to spread them over the minute as the allowance runs low, so a
+# backfill (set_pacing(BACKFILL_API_DELAY)) can go flat out until then.
+RATE_LIMIT_RESERVE = 10  # below this many requests left in the minute, slow down
+_pace_lock = threading.Lock()
+_next_slot = 0.0
+_delay = API_DELAY
+_remaining = None  # X-Rate-Limit-Remaining-Minute from the last response that had it
+
+def set_pacing(delay):
+    global _delay
+    _delay = delay
+
+def _pace():
+    global _next_slot
+    with _pace_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        delay = _delay
+        if _remaining is not None and _remaining < RATE_LIMIT_RESERVE:
+            delay = max(delay, 60 / (_remaining + 1))
+        _next_slot = slot + delay
+    budget.sleep(slot - now, reason="pacing")
+
+def _backoff(wait):
+    """Retry wait; skipped when replaying a cassette as fast as possible."""
+    if not _no_wait:
+        budget.sleep(wait)
+
+def _hold_off(wait):
+    global _next_slot
+    if _no_wait:
+        return
+    with _pace_lock:
+        _next_slot = max(_next_slot, time.monotonic() + wait)
+
+# ---------------- SHARED RESPONSES ---------------- #
+# With several friend groups in one process (groups.py) every group asks for
+# the listings of its players and the matches they played. share_responses()
+# keeps what this process already fetched, so a match is downloaded once,
+# and a listing is requested again only when a group sends other validators
+# than the group that fetched it (after the first run their validators
+# agree). Bodies are kept as bytes, parsed per use, so groups never share a
+# mutable dict. Lives for the process: one cron run.
+_shared = None
+_shared_lock = threading.Lock()
+shared_stats = {"hits": 0, "misses": 0}
+
+def share_responses():
+    global _shared
+    _shared = {"listing": {}, "match": {}}
+
+def _shared_get(kind, key):
+    if _shared is None:
+        return None
+    with _shared_lock:
+        value = _shared[kind].get(key)
+        shared_stats["hits" if value is not None else "misses"] += 1
+    if value is not None:
+        metrics.incr("shared_responses_total", kind=kind)
+    return value
+
+def _shared_put(kind, key, value):
+    if _shared is not None:
+        with _shared_lock:
+            _shared[kind][key] = value
+
+def shared_report():
+    total = shared_stats["hits"] + shared_stats["misses"]
+    return f"{shared_stats['hits']}/{total} listing/match requests answered from another group's fetch"
 
 # ---------------- API CALLS WITH EXPONENTIAL BACKOFF ---------------- #
-def fetch_recent_match_ids(account_id, limit=BATCH_SIZE, offset=0):
-    """Fetch recent matches with optimized error handling and backoff."""
-    url = f"https://api.opendota.com/api/players/{account_id}/matches?limit={limit}&offset={offset}"
+# Match ids OpenDota answered 404 for in this process. fetch_full_match
+# returns None either way; callers that need to tell "gone" from "failed
+# this time" (pipeline.py) look here.
+missing_matches = set()
+
+def match_list_url(account_id, limit=BATCH_SIZE, offset=0):
+    return f"{OPENDOTA_API_URL}/players/{account_id}/matches?limit={limit}&offset={offset}"
+
+def fetch_recent_match_ids(account_id, limit=BATCH_SIZE, offset=0, use_cache=True, since=CHECK_FROM_DATE):
+    """
+    Fetch recent matches with optimized error handling and backoff.
+    With use_cache, an unchanged listing (304 or identical body) returns []
+    without parsing, i.e. "no new matches".
+    """
+    matches = fetch_match_listing(account_id, limit, offset, use_cache) or []
+    filtered = []
+    for m in matches:
+        start_time = datetime.fromtimestamp(m.get("start_time", 0), tz=timezone.utc)
+        if start_time >= since:
+            filtered.append(m.get("match_id"))
+    return filtered
+
+def fetch_match_listing(account_id, limit=BATCH_SIZE, offset=0, use_cache=True):
+    """
+    One page of a player's match list, newest first, as OpenDota returns it.
+    [] when unchanged (use_cache) or past the end, None if it couldn't be fetched.
+    """
+    import requests
+    url = match_list_url(account_id, limit, offset)
     
     for attempt in range(MAX_RETRIES):
+        if budget.expired():
+            break
+        if attempt:
+            metrics.incr("http_retries_total", endpoint="player_matches")
         try:
-            r = session.get(url, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT))
-            r.raise_for_status()
-            matches = r.json()
+            headers = _conditional_headers(url) if use_cache else {}
+            key = (url, tuple(sorted(headers.items())))
+            r = _shared_get("listing", key)
+            if r is None:
+                _pace()
+                r = _checked(http_request("GET", "player_matches", url, headers=headers, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT)))
+                if r.status_code in (200, 304):
+                    _shared_put("listing", key, r)
+            if r.status_code == 429:
+                metrics.incr("http_rate_limited_total", endpoint="player_matches")
+                wait = min(30, 5 * (attempt + 1))
+                print(f"[WARN] Rate limited on matches of {account_id}, waiting {wait}s...")
+                _hold_off(wait)
+                continue
+            if r.status_code != 304:
+                r.raise_for_status()
+            if use_cache and _is_unchanged(url, r):
+                return []
+            matches = codec.loads(r.content)
             if not isinstance(matches, list):
                 raise ValueError(f"Unexpected response format: {type(matches)}")
-
-            filtered = []
-            for m in matches:
-                start_time = datetime.fromtimestamp(m.get("start_time", 0), tz=timezone.utc)
-                if start_time >= CHECK_FROM_DATE:
-                    filtered.append(m.get("match_id"))
-            
-            time.sleep(API_DELAY)
-            return filtered
+            if use_cache:
+                _remember_validators(url, r)
+            return matches
             
         except requests.exceptions.Timeout:
             wait = min(10, 2 ** attempt)  # 1s, 2s, 4s max
             print(f"[WARN] Timeout for {account_id} (attempt {attempt+1}/{MAX_RETRIES}), waiting {wait}s...")
-            time.sleep(wait)
+            _backoff(wait)
             
         except requests.exceptions.ConnectionError as e:
             wait = min(10, 2 ** attempt)
             print(f"[WARN] Connection error for {account_id}, waiting {wait}s...")
-            time.sleep(wait)
+            _backoff(wait)
             
         except Exception as e:
             if attempt == MAX_RETRIES - 1:
                 print(f"[ERROR] Fetch matches for {account_id}: {e}")
-            time.sleep(min(5, 2 ** attempt))
+            _backoff(min(5, 2 ** attempt))
     
-    return []
+    return None
 
 def fetch_full_match(match_id):
     """Fetch full match data with exponential backoff."""
-    url = f"https://api.opendota.com/api/matches/{match_id}"
-    
+    import requests
+    url = f"{OPENDOTA_API_URL}/matches/{match_id}"
+    shared = _shared_get("match", str(match_id))
+    if shared is not None:
+        return codec.loads(shared)
+
     for attempt in range(MAX_RETRIES):
+        if budget.expired():
+            break
+        if attempt:
+            metrics.incr("http_retries_total", endpoint="match")
         try:
-            r = session.get(url, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT))
+            _pace()
+            r = _checked(http_request("GET", "match", url, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT)))
             
             if r.status_code == 429:
+                metrics.incr("http_rate_limited_total", endpoint="match")
                 wait = min(30, 5 * (attempt + 1))  # 5s, 10s, 15s... up to 30s
                 print(f"[WARN] Rate limited on match {match_id}, waiting {wait}s...")
-                time.sleep(wait)
+                _hold_off(wait)
                 continue
             
             if r.status_code == 404:
                 print(f"[WARN] Match {match_id} not found (deleted/private)")
+                missing_matches.add(match_id)
                 return None
             
             r.raise_for_status()
-            time.sleep(API_DELAY)
-            return r.json()
+            match_data = codec.loads(r.content)
+            _shared_put("match", str(match_id), r.content)
+            profiling.memory_checkpoint("after fetch_full_match", snapshot=False)
+            return match_data
             
         except requests.exceptions.Timeout:
             wait = min(10, 2 ** attempt)
             print(f"[WARN] Timeout fetching match {match_id} (attempt {attempt+1}/{MAX_RETRIES}), waiting {wait}s...")
-            time.sleep(wait)
+            _backoff(wait)
             
         except requests.exceptions.ConnectionError:
             wait = min(10, 2 ** attempt)
             print(f"[WARN] Connection error on match {match_id}, retrying in {wait}s...")
-            time.sleep(wait)
+            _backoff(wait)
             
         except Exception as e:
             if attempt == MAX_RETRIES - 1:
                 print(f"[ERROR] Fetch match {match_id}: {e}")
-            time.sleep(min(5, 2 ** attempt))
+            _backoff(min(5, 2 ** attempt))
     
     return None
+
+def fetch_hero_constants():
+    """OpenDota's hero constants {id: hero}, or None if unchanged since last time or unreachable."""
+    import requests
+    url = f"{OPENDOTA_API_URL}/constants/heroes"
+    _pace()
+    try:
+        r = http_request("GET", "constants", url, headers=_conditional_headers(url),
+                         timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT))
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        constants = codec.loads(r.content)
+        if not isinstance(constants, dict):
+            raise ValueError(f"Unexpected response format: {type(constants)}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"[WARN] Hero constants refresh failed, keeping local heroes.json: {e}")
+        return None
+    _remember_validators(url, r)
+    return constants
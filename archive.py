@@ -0,0 +1,273 @@
+import argparse
+import glob
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timezone
+import codec
+from config import ARCHIVE_DIR
+
+# ---------------- SEASON ARCHIVES ---------------- #
+# A finished season frozen into one read-only file (archive/<slug>.season)
+# that is opened with mmap, so a query only touches the pages it reads:
+# lifetime points read just the player table, "worst KDA" streams the match
+# table, and nothing here is imported by a normal run.
+#
+#   python archive.py build Season1store.json --name "Season 1"
+#   python archive.py lifetime [--current]
+#   python archive.py worst-kda -n 10
+#   python archive.py player Dreamer
+#
+# Layout (little endian), every section is a packed array of fixed-size rows:
+#   header    MAGIC, version, row counts, section offsets
+#   meta      JSON {"name", "source", "built"}
+#   strings   (offset, length) per string id, then the UTF-8 bytes
+#   players   sorted by steam id; each owns a contiguous run of matches
+#   matches   per player, oldest first; each owns runs of awards and friends
+#   awards    (challenge string id, points)
+#   friends   string ids of the tracked friends in the match
+#
+# Both store schemas are accepted: Season 1 keeps `total_points_in_match`
+# and has no `win`, later seasons keep `points` and `win`.
+
+MAGIC = b"SMKSEASN"
+VERSION = 1
+HEADER = struct.Struct("<8sH6x7I7I")   # magic, version, 7 counts, 7 offsets
+STRING = struct.Struct("<II")          # offset into the string bytes, length
+PLAYER = struct.Struct("<QIiII")       # steam_id, name, total_points, first_match, n_matches
+MATCH = struct.Struct("<QIiHHHIIIHIBB") # match_id, minute, points, k, d, a, damage, hero, first_award, n_awards, first_friend, n_friends, win
+AWARD = struct.Struct("<Ii")           # challenge name, points
+FRIEND = struct.Struct("<I")
+WIN_UNKNOWN = 2
+
+SECTIONS = ("meta", "string_index", "string_bytes", "players", "matches", "awards", "friends")
+
+# ---------------- BUILD ---------------- #
+
+def _minute(date):
+    return int(datetime.strptime(date, "%Y-%m-%d %H:%M UTC").replace(tzinfo=timezone.utc).timestamp()) // 60
+
+def _kda(text):
+    try:
+        k, d, a = (int(x) for x in (text or "").split("/"))
+        return k, d, a
+    except ValueError:
+        return 0, 0, 0
+
+def build(store, name, source=""):
+    """Serialise a store dict into archive bytes."""
+    strings = {}
+
+    def sid_of(text):
+        return strings.setdefault(text or "", len(strings))
+
+    players, matches, awards, friends = [], [], [], []
+    for steam_id, player in sorted(store.get("leaderboard", {}).items(), key=lambda x: int(x[0])):
+        records = sorted(player.get("matches", {}).items(), key=lambda x: (x[1].get("date", ""), x[0]))
+        first_match = len(matches)
+        total = 0
+        for match_id, record in records:
+            points = record.get("points", record.get("total_points_in_match", 0))
+            total += points
+            k, d, a = _kda(record.get("kda"))
+            win = WIN_UNKNOWN if "win" not in record else int(bool(record["win"]))
+            matches.append(MATCH.pack(
+                int(match_id), _minute(record["date"]), points, k, d, a, int(record.get("damage") or 0),
+                sid_of(record.get("hero")), len(awards), len(record.get("challenges", [])),
+                len(friends), len(record.get("friends_in_match", [])), win))
+            awards.extend(AWARD.pack(sid_of(c["name"]), c["points"]) for c in record.get("challenges", []))
+            friends.extend(FRIEND.pack(sid_of(f)) for f in record.get("friends_in_match", []))
+        players.append(PLAYER.pack(int(steam_id), sid_of(player.get("name")), total, first_match, len(records)))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_index, offset = [], 0
+    for blob in encoded:
+        string_index.append(STRING.pack(offset, len(blob)))
+        offset += len(blob)
+
+    meta = codec.dumps({"name": name, "source": source,
+                       "built": datetime.now(timezone.utc).isoformat(timespec="seconds")}).encode("utf-8")
+    sections = [meta, b"".join(string_index), b"".join(encoded), b"".join(players),
+                b"".join(matches), b"".join(awards), b"".join(friends)]
+    counts = [len(meta), len(strings), len(sections[2]), len(players), len(matches), len(awards), len(friends)]
+    offsets, position = [], HEADER.size
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+    return HEADER.pack(MAGIC, VERSION, *counts, *offsets) + b"".join(sections)
+
+# ---------------- READ ---------------- #
+
+class SeasonArchive:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(self._mm, 0)
+        if fields[0] != MAGIC or fields[1] != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} season archive")
+        self.counts = dict(zip(SECTIONS, fields[2:9]))
+        self.offsets = dict(zip(SECTIONS, fields[9:16]))
+        self._strings = {}
+        start = self.offsets["meta"]
+        self.meta = codec.loads(self._mm[start:start + self.counts["meta"]])
+        self.name = self.meta["name"]
+
+    def close(self):
+        self._mm.close()
+
+    def string(self, string_id):
+        text = self._strings.get(string_id)
+        if text is None:
+            offset, length = STRING.unpack_from(self._mm, self.offsets["string_index"] + string_id * STRING.size)
+            start = self.offsets["string_bytes"] + offset
+            text = self._strings[string_id] = self._mm[start:start + length].decode("utf-8")
+        return text
+
+    def _rows(self, row, section, first=0, count=None):
+        count = self.counts[section] - first if count is None else count
+        start = self.offsets[section] + first * row.size
+        return row.iter_unpack(self._mm[start:start + count * row.size])
+
+    def players(self):
+        """[(steam_id, name, total_points, first_match, n_matches)] from the player table alone."""
+        return [(sid, self.string(name), total, first, n) for sid, name, total, first, n in self._rows(PLAYER, "players")]
+
+    def find_player(self, steam_id):
+        """Binary search of the player table by steam id."""
+        lo, hi = 0, self.counts["players"]
+        base = self.offsets["players"]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = PLAYER.unpack_from(self._mm, base + mid * PLAYER.size)
+            if row[0] < steam_id:
+                lo = mid + 1
+            elif row[0] > steam_id:
+                hi = mid
+            else:
+                return row[0], self.string(row[1]), row[2], row[3], row[4]
+        return None
+
+    def matches(self, first=0, count=None):
+        """Match rows as dicts; first/count index into the match table (a player's run)."""
+        for (match_id, minute, points, k, d, a, damage, hero,
+             first_award, n_awards, first_friend, n_friends, win) in self._rows(MATCH, "matches", first, count):
+            yield {
+                "match_id": match_id,
+                "date": datetime.fromtimestamp(minute * 60, tz=timezone.utc).strftime("%Y-%m-%d %H:%M UTC"),
+                "points": points, "kills": k, "deaths": d, "assists": a, "damage": damage,
+                "hero": self.string(hero),
+                "win": None if win == WIN_UNKNOWN else bool(win),
+                "first_award": first_award, "n_awards": n_awards,
+                "first_friend": first_friend, "n_friends": n_friends,
+            }
+
+    def awards(self, match):
+        return [(self.string(name), points) for name, points in self._rows(AWARD, "awards", match["first_award"], match["n_awards"])]
+
+    def friends(self, match):
+        return [self.string(s) for (s,) in self._rows(FRIEND, "friends", match["first_friend"], match["n_friends"])]
+
+def open_archives(directory=ARCHIVE_DIR):
+    return [SeasonArchive(path) for path in sorted(glob.glob(os.path.join(directory, "*.season")))]
+
+# ---------------- CROSS-SEASON QUERIES ---------------- #
+
+def lifetime_points(archives, current=None):
+    """{steam_id: (name, total, {season: points})} over archives and, optionally, the live store."""
+    totals = {}
+    seasons = [(a.name, [(sid, name, total) for sid, name, total, _, _ in a.players()]) for a in archives]
+    if current is not None:
+        seasons.append(("current", [(int(sid), p.get("name"), p.get("total_points", 0))
+                                    for sid, p in current.get("leaderboard", {}).items()]))
+    for season, players in seasons:
+        for sid, name, total in players:
+            entry = totals.setdefault(sid, [name, 0, {}])
+            entry[0] = name or entry[0]
+            entry[1] += total
+            entry[2][season] = total
+    return {sid: tuple(entry) for sid, entry in totals.items()}
+
+def _kda_ratio(match):
+    return (match["kills"] + match["assists"]) / max(1, match["deaths"])
+
+def worst_kda(archives, n=10):
+    """Lowest (K+A)/D single matches across every archived season."""
+    rows = []
+    for archive in archives:
+        for sid, name, _, first, count in archive.players():
+            for match in archive.matches(first, count):
+                rows.append((_kda_ratio(match), archive.name, name, match))
+    rows.sort(key=lambda r: (r[0], -r[3]["deaths"]))
+    return rows[:n]
+
+def _player_id(archives, query):
+    if query.isdigit():
+        return int(query)
+    for archive in archives:
+        for sid, name, *_ in archive.players():
+            if name.lower() == query.lower():
+                return sid
+    raise SystemExit(f"[ERROR] Unknown player: {query}")
+
+# ---------------- CLI ---------------- #
+
+def _slug(name):
+    return "".join(ch for ch in name.lower() if ch.isalnum()) or "season"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query archives of finished seasons.")
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="freeze a store file into <dir>/<name>.season")
+    b.add_argument("store")
+    b.add_argument("--name", required=True)
+    lt = sub.add_parser("lifetime", help="points per player across seasons")
+    lt.add_argument("--current", action="store_true", help="include the live store.json")
+    wk = sub.add_parser("worst-kda", help="worst single-match KDA across archived seasons")
+    wk.add_argument("-n", type=int, default=10)
+    pl = sub.add_parser("player", help="one player's record per archived season")
+    pl.add_argument("name")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.store, "r") as f:
+            store = codec.load(f)
+        blob = build(store, args.name, os.path.basename(args.store))
+        os.makedirs(args.dir, exist_ok=True)
+        out = os.path.join(args.dir, _slug(args.name) + ".season")
+        with open(out, "wb") as f:
+            f.write(blob)
+        print(f"[SUCCESS] {out}: {len(blob):,} bytes from {os.path.getsize(args.store):,} bytes of JSON")
+        sys.exit(0)
+
+    archives = open_archives(args.dir)
+    if not archives:
+        print(f"[WARN] No archives in {args.dir}/")
+    if args.command == "lifetime":
+        current = None
+        if args.current:
+            from data import load_store
+            current = load_store()
+        ranked = sorted(lifetime_points(archives, current).values(), key=lambda x: x[1], reverse=True)
+        for rank, (name, total, per_season) in enumerate(ranked, 1):
+            breakdown = ", ".join(f"{season} {points:+}" for season, points in per_season.items())
+            print(f"{rank:>2}. {name:<20} {total:+} pts  ({breakdown})")
+    elif args.command == "worst-kda":
+        for ratio, season, name, match in worst_kda(archives, args.n):
+            print(f"{ratio:5.2f}  {name:<20} {match['kills']}/{match['deaths']}/{match['assists']} "
+                  f"{match['hero']:<16} {season}, {match['date']} (match {match['match_id']})")
+    elif args.command == "player":
+        steam_id = _player_id(archives, args.name)
+        for archive in archives:
+            found = archive.find_player(steam_id)
+            if not found:
+                continue
+            _, name, total, first, count = found
+            games = list(archive.matches(first, count))
+            best = max(games, key=lambda m: m["points"], default=None)
+            print(f"{archive.name}: {name} {total:+} pts over {count} scored matches")
+            if best:
+                awards = ", ".join(f"{n} ({p:+})" for n, p in archive.awards(best))
+                print(f"  best match {best['date']} {best['hero']} {best['points']:+}: {awards}")
@@ -0,0 +1,239 @@
+import gzip
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import api
+import codec
+import duos
+import windows
+from challenges import score_rules
+from config import BACKFILL_DIR, BACKFILL_API_DELAY, BACKFILL_WORKERS, BACKFILL_PAGE_SIZE
+from data import steam_names, load_store, save_store, acquire_store_lease, release_store_lease
+from processor import is_already_checked, defer_match, commit_match, triage, scored_rules
+
+# ---------------- HISTORICAL BACKFILL ---------------- #
+# `main.py backfill --from 2026-01-16 --to 2026-03-01` loads a date range of
+# history (a new season, a re-scored one) without the cron run's pacing:
+#
+#   1. discover  walk every friend's match list (BACKFILL_PAGE_SIZE per page)
+#                until it is older than --from
+#   2. fetch     download every match in range, BACKFILL_WORKERS at a time,
+#                paced by BACKFILL_API_DELAY and OpenDota's per-minute allowance
+#   3. commit    score them in start_time order into one store write at the
+#                end; no Discord messages, unparsed matches and ones that
+#                failed to download go to the retry queue
+#
+# Progress lives in BACKFILL_DIR: cursor.json (range, next page per friend,
+# matches found) and matches/<id>.json.gz (each downloaded match). An
+# interrupted backfill picks up where it stopped when run again with the
+# same range; the directory is removed once the store is written.
+
+PROGRESS_EVERY = 10  # seconds between progress lines
+
+def _cursor_path():
+    return os.path.join(BACKFILL_DIR, "cursor.json")
+
+def _match_path(match_id):
+    return os.path.join(BACKFILL_DIR, "matches", f"{match_id}.json.gz")
+
+def _write_atomic(path, data, opener=open):
+    tmp = path + ".tmp"
+    with opener(tmp, "wt", encoding="utf-8") as f:
+        codec.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+class Cursor:
+    """What a backfill has done so far; saved after every listing page."""
+
+    def __init__(self, start, end):
+        self.state = {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "friends": {},   # steam id -> next listing offset, or null once past --from
+            "matches": {},   # match id -> [start_time, expected friend]
+            "lost": [],      # match ids whose download failed (retried by the cron run)
+            "missing": [],   # match ids OpenDota answered 404 for
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, start, end):
+        cursor = cls(start, end)
+        try:
+            with open(_cursor_path(), "r") as f:
+                saved = codec.load(f)
+        except FileNotFoundError:
+            return cursor
+        except ValueError as e:
+            print(f"[WARN] Unreadable {_cursor_path()} ({e}), starting the backfill over")
+            return cursor
+        if (saved.get("from"), saved.get("to")) != (cursor.state["from"], cursor.state["to"]):
+            print(f"[WARN] {BACKFILL_DIR} holds a backfill of {saved.get('from')} - {saved.get('to')}, starting over")
+            shutil.rmtree(BACKFILL_DIR, ignore_errors=True)
+            return cursor
+        cursor.state = saved
+        print(f"[INFO] Resuming backfill: {len(saved['matches'])} matches found so far")
+        return cursor
+
+    def save(self):
+        with self._lock:
+            _write_atomic(_cursor_path(), self.state)
+
+    def offset(self, friend_id):
+        return self.state["friends"].get(str(friend_id), 0)
+
+    def page_done(self, friend_id, next_offset, found):
+        with self._lock:
+            self.state["friends"][str(friend_id)] = next_offset
+            for match_id, start_time in found:
+                self.state["matches"].setdefault(str(match_id), [start_time, friend_id])
+
+    def lose(self, match_id):
+        with self._lock:
+            key = "missing" if match_id in api.missing_matches else "lost"
+            self.state.setdefault(key, []).append(str(match_id))
+
+class Progress:
+    """Rate and ETA for one phase, printed at most every PROGRESS_EVERY seconds."""
+
+    def __init__(self, label, total, unit):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.started = time.monotonic()
+        self._last = self.started
+        self._lock = threading.Lock()
+
+    def tick(self, force=False):
+        with self._lock:
+            self.done += 0 if force else 1
+            now = time.monotonic()
+            if not force and now - self._last < PROGRESS_EVERY:
+                return
+            self._last = now
+            elapsed = now - self.started
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            eta = (self.total - self.done) / rate if rate > 0 else 0
+            pct = self.done / self.total * 100 if self.total else 100
+            print(f"[INFO] Backfill {self.label}: {self.done}/{self.total} {self.unit} ({pct:.0f}%), "
+                  f"{rate:.1f}/s, ETA {int(eta) // 60}m{int(eta) % 60:02d}s")
+
+# ---------------- PHASES ---------------- #
+
+def _discover_friend(friend_id, start, end, cursor, seen, progress):
+    """Walk one friend's listing from the cursor's offset back to `start`."""
+    offset = cursor.offset(friend_id)
+    while offset is not None:
+        page = api.fetch_match_listing(friend_id, limit=BACKFILL_PAGE_SIZE, offset=offset, use_cache=False)
+        if page is None:
+            print(f"[WARN] Listing of {steam_names.get(friend_id, friend_id)} failed at offset {offset}, "
+                  "run the backfill again to resume")
+            return
+        found = [(m["match_id"], m.get("start_time", 0)) for m in page
+                 if start <= m.get("start_time", 0) < end and m["match_id"] not in seen]
+        oldest = min((m.get("start_time", 0) for m in page), default=0)
+        offset = offset + BACKFILL_PAGE_SIZE if len(page) == BACKFILL_PAGE_SIZE and oldest >= start else None
+        cursor.page_done(friend_id, offset, found)
+        cursor.save()
+    progress.tick()
+
+def _fetch(match_id, cursor, progress):
+    match_data = api.fetch_full_match(match_id)
+    if match_data is None:
+        cursor.lose(match_id)
+    else:
+        _write_atomic(_match_path(match_id), match_data, opener=gzip.open)
+    progress.tick()
+
+def _commit(cursor):
+    """Score every downloaded match into the store in one write. Returns the store, or None if leased."""
+    if not acquire_store_lease():
+        print("[WARN] Another run holds the store, not committing; run the backfill again to retry")
+        return None
+    try:
+        store = load_store()
+        ordered = sorted(cursor.state["matches"].items(), key=lambda kv: (kv[1][0], int(kv[0])))
+        missing = set(cursor.state.get("missing", []))
+        progress = Progress("commit", len(ordered), "matches")
+        committed = deferred = retried = 0
+        for match_id, (_, expected_friend) in ordered:
+            progress.tick()
+            path = _match_path(match_id)
+            if is_already_checked(int(match_id), store, ()):
+                continue
+            if match_id in missing:
+                store.setdefault("lost_matches", {})[match_id] = {
+                    "first_seen": datetime.now(timezone.utc).isoformat(),
+                    "expected_friend": expected_friend,
+                }
+                continue
+            if not os.path.exists(path):
+                defer_match(int(match_id), store, expected_friend, "download failed during backfill")
+                retried += 1
+                continue
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                match_data = codec.load(f)
+            state, reason = triage(match_data, expected_friend)
+            if state == "defer":
+                defer_match(int(match_id), store, expected_friend, reason)
+                deferred += 1
+                continue
+            triggers, match_time, scored = score_rules(match_data, scored_rules(match_id, store))
+            provisional = (expected_friend, reason, scored) if state == "partial" else None
+            commit_match(int(match_id), match_data, triggers, match_time, store, provisional)  # Message dropped: no Discord
+            committed += provisional is None
+            deferred += provisional is not None
+        windows.expire(store)
+        save_store(store)
+    finally:
+        release_store_lease()
+    print(f"[SUCCESS] Backfill committed {committed} matches, {deferred} waiting for parse, "
+          f"{retried} queued to download again, {len(missing)} not on OpenDota")
+    return store
+
+def run(start, end, workers=BACKFILL_WORKERS):
+    """Backfill matches with start <= start_time < end (aware datetimes). Returns the store once written."""
+    os.makedirs(os.path.join(BACKFILL_DIR, "matches"), exist_ok=True)
+    cursor = Cursor.load(start, end)
+    cursor.save()
+    api.set_pacing(BACKFILL_API_DELAY)
+    duos.journal = False  # Under the store lease alone: no other run merges with what it commits
+    t_start, t_end = int(start.timestamp()), int(end.timestamp())
+    print(f"[INFO] Backfilling {start:%Y-%m-%d} - {end:%Y-%m-%d} for {len(steam_names)} friends, {workers} workers")
+
+    # Only skip what's already scored; the store itself is read again (under the lease) to commit
+    seen = load_store()["checked_matches"]
+    friends = [fid for fid in steam_names if cursor.offset(fid) is not None]
+    progress = Progress("discover", len(friends), "friends")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(_discover_friend, fid, t_start, t_end, cursor, seen, progress) for fid in friends]:
+            future.result()
+    progress.tick(force=True)
+
+    missing = set(cursor.state.get("missing", []))
+    cursor.state["lost"] = []  # A resumed backfill tries failed downloads again
+    todo = [m for m in cursor.state["matches"] if m not in missing and not os.path.exists(_match_path(m))]
+    print(f"[INFO] {len(cursor.state['matches'])} matches in range, {len(todo)} left to download")
+    progress = Progress("fetch", len(todo), "matches")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(_fetch, int(m), cursor, progress) for m in todo]:
+            future.result()
+    progress.tick(force=True)
+    cursor.save()
+
+    unfinished = [fid for fid in steam_names if cursor.offset(fid) is not None]
+    if unfinished:
+        print(f"[WARN] {len(unfinished)} listing(s) incomplete; committing what was found, "
+              "run the same backfill again for the rest")
+    store = _commit(cursor)
+    if store is not None and not unfinished:
+        shutil.rmtree(BACKFILL_DIR, ignore_errors=True)
+    return store
+
+def parse_date(value):
+    """ISO date (or datetime) from the command line, as UTC."""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
@@ -0,0 +1,444 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# ---------------- BENCHMARKS ---------------- #
+# End-to-end and per-component timings against simulator.py, so a change
+# can be checked for speed before it ships:
+#
+#   python main.py bench run --out bench_results.json          # quick set
+#   python main.py bench run --full --out bench_results.json   # up to 1000 friends / 100k matches
+#   python main.py bench compare bench_baseline.json bench_results.json
+#   python main.py bench replay incident.cassette.gz --inputs incident/ --out after.json
+#   python main.py bench codec --store store.json --cassette incident.cassette.gz
+#   python main.py bench conditional
+#
+# `compare` exits 1 if any timing got slower than the tolerance allows.
+# Every scenario runs in a fresh subprocess and temp directory (config
+# reads its paths at import time), with the simulator in this process.
+# The startup scenarios time fresh interpreters running main.py commands
+# that should stay cheap, and record whether `requests` got imported.
+# `replay` times run_check on a recorded cassette (cassette.py) instead of
+# the simulator: --inputs holds the steam_names.json / store.json (+ .seen) /
+# http_cache.json / heroes.json the recorded run started from.
+# `codec` times each installed JSON backend (codec.py) on a real store and
+# on the match payloads of a cassette (synthetic matches without one), and
+# exits 1 if a fast backend doesn't write the store byte for byte as json does.
+# `conditional` is a check rather than a timing: consecutive runs against the
+# simulator must answer unchanged listings with 304s (or body hashes when the
+# server sends no ETag), including pages with a match OpenDota 404s, and
+# re-read only the listings a new match landed on. Exits 1 otherwise.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RUN_SCENARIOS = {
+    "quick": [(17, 1000), (100, 1000)],
+    "full": [(17, 1000), (100, 10000), (1000, 100000)],
+}
+STORE_SCENARIOS = {
+    "quick": [(17, 1000), (17, 10000)],
+    "full": [(17, 1000), (100, 10000), (1000, 100000)],
+}
+PER_CALL_SAMPLE = 2000  # matches timed for check_challenges / is_match_fully_parsed
+# name -> main.py arguments, timed from interpreter start to exit
+STARTUP_COMMANDS = {
+    "import": None,  # `import main` alone
+    "help": ["--help"],
+    "stats": ["stats", "top"],
+}
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+# ---------------- CHILD PROCESSES ---------------- #
+# Run inside the scenario's temp dir with env pointing at its roster/simulator.
+
+def _child_run_check(params):
+    import main
+    results = {}
+    for label in ("cold", "warm"):  # warm: second run, listings mostly 304
+        t0 = time.perf_counter()
+        main.run_check()
+        results[f"run_check.{label}"] = time.perf_counter() - t0
+    return results
+
+def _child_store(params):
+    from simulator import SyntheticWorld
+    from data import load_steam_names, load_store, save_store
+    from challenges import check_challenges
+    from validation import is_match_fully_parsed
+    from processor import commit_match
+    from seen import SeenIndex
+    from main import write_leaderboard_txt
+
+    world = SyntheticWorld(load_steam_names(), params["matches"], seed=params["seed"])
+    matches = [world.match(match_id) for match_id in sorted(world.rosters)]
+
+    store = {"checked_matches": SeenIndex(), "unparsed_matches": {}, "leaderboard": {}, "daily": {}}
+    for match_data in matches:
+        triggers, match_time = check_challenges(match_data, store)
+        commit_match(match_data["match_id"], match_data, triggers, match_time, store)
+
+    sample = matches[:PER_CALL_SAMPLE]
+    repeat = params["repeat"]
+    results = {
+        "check_challenges.per_call": _best_of(lambda: [check_challenges(m, store) for m in sample], repeat) / len(sample),
+        "is_match_fully_parsed.per_call": _best_of(lambda: [is_match_fully_parsed(m) for m in sample], repeat) / len(sample),
+        "save_store": _best_of(lambda: save_store(store), repeat),
+        "load_store": _best_of(load_store, repeat),
+        "write_leaderboard_txt": _best_of(lambda: write_leaderboard_txt(store, "leaderboard.txt"), repeat),
+    }
+    results["store_bytes"] = os.path.getsize("store.json")
+    return results
+
+def _child_startup(params):
+    results = {}
+    for name, args in STARTUP_COMMANDS.items():
+        cmd = [sys.executable, "-c", "import main"] if args is None else [sys.executable, os.path.join(HERE, "main.py"), *args]
+        results[f"startup.{name}"] = _best_of(
+            lambda: subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True),
+            params["repeat"])
+    probe = "import sys, main; print(int('requests' in sys.modules))"
+    results["requests_imported"] = int(subprocess.run([sys.executable, "-c", probe], capture_output=True,
+                                                      text=True, check=True).stdout.strip())
+    return results
+
+def _child_replay(params):
+    import api
+    import main
+    t0 = time.perf_counter()
+    main.run_check()
+    results = {"replay.run_check": time.perf_counter() - t0}
+    if api._tape is not None:
+        results["http_requests"] = api._tape.hits + api._tape.misses
+        results["replay_misses"] = api._tape.misses
+    return results
+
+def _child_conditional(params):
+    import api
+    import main
+    from data import load_store
+    main.run_check()
+    store = load_store()
+    return {**api.cache_stats, "checked": len(store["checked_matches"]), "lost": len(store.get("lost_matches", {}))}
+
+CHILDREN = {"run_check": _child_run_check, "store": _child_store, "startup": _child_startup, "replay": _child_replay,
+            "conditional": _child_conditional}
+
+# ---------------- SCENARIO DRIVER ---------------- #
+
+def _run_child(kind, params, env_extra, workdir):
+    result_path = os.path.join(workdir, "result.json")
+    env = {
+        **os.environ,
+        "PYTHONPATH": HERE + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        "STEAM_NAMES_FILE": os.path.join(workdir, "steam_names.json"),
+        "STORE_FILE": os.path.join(workdir, "store.json"),
+        "SEASON_END_DATE": "2100-01-01",
+        "RUN_BUDGET_SECONDS": "0",
+        "API_DELAY": "0",
+        "DEBUG_MODE": "false",
+        **env_extra,
+    }
+    cmd = [sys.executable, os.path.join(HERE, "bench.py"), "_child", kind, json.dumps(params), result_path]
+    with open(os.path.join(workdir, "child.log"), "w") as log:
+        proc = subprocess.run(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        with open(os.path.join(workdir, "child.log"), "r") as f:
+            tail = f.read()[-2000:]
+        raise RuntimeError(f"{kind} {params} failed:\n{tail}")
+    with open(result_path, "r") as f:
+        return json.load(f)
+
+def _prepare(workdir, friends, seed):
+    from simulator import synthetic_roster
+    roster = synthetic_roster(friends, seed)
+    with open(os.path.join(workdir, "steam_names.json"), "w") as f:
+        json.dump({str(k): v for k, v in roster.items()}, f)
+    shutil.copy(os.path.join(HERE, "heroes.json"), workdir)
+    return roster
+
+def run_benchmarks(size="quick", repeat=3, seed=0, latency="fixed:0"):
+    from simulator import Simulator, SyntheticWorld, Faults
+    results = {}
+
+    for friends, matches in RUN_SCENARIOS[size]:
+        key = f"friends={friends},matches={matches}"
+        print(f"[INFO] run_check {key}...")
+        with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+            roster = _prepare(workdir, friends, seed)
+            sim = Simulator(SyntheticWorld(roster, matches, seed), Faults(latency=latency, seed=seed)).start()
+            try:
+                timings = _run_child("run_check", {}, {
+                    "OPENDOTA_API_URL": f"{sim.base_url}/api",
+                    "DISCORD_WEBHOOK": f"{sim.base_url}/webhook",
+                }, workdir)
+                timings["http_requests"] = sim.stats["requests"]
+            finally:
+                sim.stop()
+        for name, value in timings.items():
+            results[f"{name}[{key}]"] = value
+
+    for friends, matches in STORE_SCENARIOS[size]:
+        key = f"friends={friends},matches={matches}"
+        print(f"[INFO] store components {key}...")
+        with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+            _prepare(workdir, friends, seed)
+            timings = _run_child("store", {"matches": matches, "seed": seed, "repeat": repeat}, {}, workdir)
+        for name, value in timings.items():
+            results[f"{name}[{key}]"] = value
+
+    print("[INFO] startup...")
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        _prepare(workdir, 17, seed)
+        for name, value in _run_child("startup", {"repeat": max(repeat, 5)}, {}, workdir).items():
+            results[name] = value
+
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "size": size,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+REPLAY_INPUTS = ("steam_names.json", "store.json", "store.seen", "http_cache.json", "heroes.json")
+
+def run_replay(cassette_path, inputs, timing="fast", repeat=1):
+    """Time run_check served from a cassette, starting from the files in `inputs`."""
+    results = {}
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+            shutil.copy(os.path.join(HERE, "heroes.json"), workdir)
+            for name in REPLAY_INPUTS:
+                if os.path.exists(os.path.join(inputs, name)):
+                    shutil.copy(os.path.join(inputs, name), workdir)
+            timings = _run_child("replay", {}, {
+                "HTTP_REPLAY": os.path.abspath(cassette_path),
+                "HTTP_REPLAY_TIMING": timing,
+                "DISCORD_WEBHOOK": "http://replay.invalid/webhook",  # Posts are answered from the cassette too
+            }, workdir)
+        for name, value in timings.items():
+            results[name] = min(value, results.get(name, value))
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cassette": os.path.basename(cassette_path),
+            "timing": timing,
+        },
+        "results": results,
+    }
+
+# ---------------- JSON CODEC ---------------- #
+
+def _match_payloads(cassette_path, seed=0):
+    """Match response bodies recorded in a cassette, or synthetic ones."""
+    if cassette_path:
+        import cassette
+        return [e["body"] for e in cassette.read(cassette_path)
+                if e["url"].startswith("{api}/matches/") and e.get("status") == 200 and "body" in e]
+    from simulator import SyntheticWorld
+    world = SyntheticWorld(range(1, 18), 500, seed=seed)
+    return [json.dumps(world.match(match_id)) for match_id in sorted(world.rosters)]
+
+def run_codec(store_path, cassette_path=None, repeat=5):
+    """Time store load/save and match parsing per JSON backend. Returns (report, byte-identical)."""
+    import codec
+    with open(store_path, "r") as f:
+        text = f.read()
+    store = json.loads(text)
+    payloads = _match_payloads(cassette_path)
+    expected = json.dumps(store, indent=2)
+    results = {"codec.store_bytes": len(text.encode("utf-8")), "codec.match_payloads": len(payloads)}
+    identical = True
+    active = codec.BACKEND
+    try:
+        for backend in ["json"] + (["orjson"] if codec.orjson is not None else []):
+            codec.BACKEND = backend
+            print(f"[INFO] codec {backend}...")
+            results[f"codec.store_load[{backend}]"] = _best_of(lambda: codec.loads(text), repeat)
+            results[f"codec.store_save[{backend}]"] = _best_of(lambda: codec.dumps(store, indent=2), repeat)
+            results[f"codec.match_parse[{backend}]"] = _best_of(lambda: [codec.loads(p) for p in payloads], repeat)
+            if codec.dumps(store, indent=2) != expected:
+                print(f"[ERROR] {backend} writes {store_path} differently from json")
+                identical = False
+            if any(codec.loads(p) != json.loads(p) for p in payloads):
+                print(f"[ERROR] {backend} parses a match payload differently from json")
+                identical = False
+    finally:
+        codec.BACKEND = active
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "store": os.path.basename(store_path),
+            "cassette": os.path.basename(cassette_path) if cassette_path else None,
+        },
+        "results": results,
+    }, identical
+
+# ---------------- CONDITIONAL REQUESTS ---------------- #
+
+def run_conditional(friends=30, matches=400, seed=0, missing_rate=0.05):
+    """Check listing validators across consecutive runs against the simulator. Returns the failures."""
+    from simulator import Simulator, SyntheticWorld, SEASON_END
+    failures = []
+
+    def expect(ok, label, stats):
+        print(f"  {label:<48} {stats['requests']:>4} listings, {stats['not_modified']:>4} x 304, "
+              f"{stats['hash_hits']:>4} x hash, {stats['checked']:>4} checked  {'ok' if ok else 'FAILED'}")
+        if not ok:
+            failures.append(label)
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        roster = _prepare(workdir, friends, seed)
+        world = SyntheticWorld(roster, matches, seed, missing_rate=missing_rate)
+        sim = Simulator(world).start()
+        env = {"OPENDOTA_API_URL": f"{sim.base_url}/api", "DISCORD_WEBHOOK": f"{sim.base_url}/webhook"}
+        try:
+            cold = _run_child("conditional", {}, env, workdir)
+            expect(cold["requests"] and not cold["not_modified"] + cold["hash_hits"], "cold: every listing read", cold)
+            warm = _run_child("conditional", {}, env, workdir)
+            expect(warm["not_modified"] == warm["requests"] and warm["checked"] == cold["checked"],
+                   f"warm: all 304 ({cold['lost']} matches 404)", warm)
+
+            players = sorted(roster)[:3]
+            world.add_match(players, int(SEASON_END.timestamp()) - 60)
+            new = _run_child("conditional", {}, env, workdir)
+            changed = new["requests"] - new["not_modified"]
+            expect(changed >= len(players) and new["not_modified"] >= friends - len(players)
+                   and new["checked"] == warm["checked"] + 1, f"new match for {len(players)} friends", new)
+
+            sim.etags = False
+            hashed = _run_child("conditional", {}, env, workdir)
+            expect(hashed["hash_hits"] == hashed["requests"] and hashed["checked"] == new["checked"],
+                   "no ETags: all body-hash hits", hashed)
+        finally:
+            sim.stop()
+    return failures
+
+# ---------------- COMPARISON ---------------- #
+# Keys that count things rather than time: reported, never a regression.
+NON_TIMING = ("http_requests", "store_bytes", "requests_imported", "replay_misses", "codec.store_bytes",
+              "codec.match_payloads")
+
+def compare(baseline, current, tolerance):
+    """Print a table of ratios. Returns the keys that regressed."""
+    regressions = []
+    print(f"{'benchmark':<70} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for key in sorted(set(baseline["results"]) | set(current["results"])):
+        old = baseline["results"].get(key)
+        new = current["results"].get(key)
+        if old is None or new is None:
+            print(f"{key:<70} {old if old is not None else '-':>12} {new if new is not None else '-':>12}")
+            continue
+        ratio = new / old if old else float("inf")
+        timing = not key.startswith(NON_TIMING)
+        flag = ""
+        if timing and ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = "  << REGRESSION"
+        print(f"{key:<70} {old:>12.6g} {new:>12.6g} {ratio:>6.2f}x{flag}")
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="main.py bench",
+                                     description="Benchmark run_check and store I/O against the local simulator or a cassette.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the benchmarks and write results JSON")
+    run.add_argument("--full", action="store_true", help="include the 1000-friend / 100k-match scenarios")
+    run.add_argument("--repeat", type=int, default=3, help="best-of-N for component timings")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--latency", default="fixed:0", help="simulator latency, see simulator.py")
+    run.add_argument("--out", default="bench_results.json")
+
+    replay = sub.add_parser("replay", help="time run_check on a recorded cassette and write results JSON")
+    replay.add_argument("cassette")
+    replay.add_argument("--inputs", required=True, help="directory with the recorded run's starting files")
+    replay.add_argument("--timing", choices=("fast", "original"), default="fast")
+    replay.add_argument("--repeat", type=int, default=3, help="best-of-N")
+    replay.add_argument("--out", default="bench_results.json")
+
+    codec_ = sub.add_parser("codec", help="time the JSON backends on a store and recorded match payloads")
+    codec_.add_argument("--store", default="store.json")
+    codec_.add_argument("--cassette", help="take match payloads from this cassette (default: synthetic matches)")
+    codec_.add_argument("--repeat", type=int, default=5, help="best-of-N")
+    codec_.add_argument("--out", default="bench_results.json")
+
+    cond = sub.add_parser("conditional", help="check listing validators (304 / body hash) across runs")
+    cond.add_argument("--friends", type=int, default=30)
+    cond.add_argument("--matches", type=int, default=400)
+    cond.add_argument("--seed", type=int, default=0)
+
+    cmp_ = sub.add_parser("compare", help="fail if CURRENT is slower than BASELINE")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    cmp_.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        report = run_benchmarks("full" if args.full else "quick", args.repeat, args.seed, args.latency)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"[INFO] Wrote {len(report['results'])} results to {args.out}")
+    elif args.command == "replay":
+        report = run_replay(args.cassette, args.inputs, args.timing, args.repeat)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        if report["results"].get("replay_misses"):
+            print(f"[WARN] {report['results']['replay_misses']} request(s) were not in the cassette; "
+                  "--inputs may not match the recorded run")
+        print(f"[INFO] Wrote {len(report['results'])} results to {args.out}")
+    elif args.command == "codec":
+        report, identical = run_codec(args.store, args.cassette, args.repeat)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        for key, value in sorted(report["results"].items()):
+            print(f"  {key:<40} {value:.6g}")
+        print(f"[INFO] Wrote {len(report['results'])} results to {args.out}")
+        if not identical:
+            sys.exit(1)
+    elif args.command == "conditional":
+        failures = run_conditional(args.friends, args.matches, args.seed)
+        if failures:
+            print(f"[ERROR] Conditional requests: {len(failures)} check(s) failed")
+            sys.exit(1)
+        print("[SUCCESS] Conditional requests: unchanged listings cost a 304 or a hash compare")
+    else:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        with open(args.current, "r") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        if regressions:
+            print(f"[ERROR] {len(regressions)} benchmark(s) regressed beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("[INFO] No regressions")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_child":
+        _, _, kind, params, result_path = sys.argv
+        result = CHILDREN[kind](json.loads(params))
+        with open(result_path, "w") as f:
+            json.dump(result, f)
+        sys.exit(0)
+    main(sys.argv[1:])
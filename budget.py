@@ -0,0 +1,69 @@
+import heapq
+import itertools
+import time
+import metrics
+from config import RUN_BUDGET_SECONDS
+
+# ---------------- RUN DEADLINE ---------------- #
+# One global deadline per run. API backoffs sleep through budget.sleep() so a
+# run of retries/429s can never push past it and into the next cron slot.
+_deadline = None
+
+def start(seconds=RUN_BUDGET_SECONDS):
+    """Start the run clock. A falsy budget means no deadline."""
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds else None
+
+def remaining():
+    if _deadline is None:
+        return float("inf")
+    return max(0.0, _deadline - time.monotonic())
+
+def expired():
+    return remaining() <= 0
+
+def sleep(seconds, reason="backoff"):
+    """Sleep, but never past the deadline. Returns False once the budget is spent."""
+    wait = min(seconds, remaining())
+    if wait > 0:
+        metrics.incr("sleep_seconds_total", wait, reason=reason)
+        time.sleep(wait)
+    return not expired()
+
+# ---------------- PRIORITISED WORK QUEUE ---------------- #
+# Lower tier = more valuable. Within a tier, work runs in the order it was queued.
+NEW_MATCHES = 0  # first listing page of each friend, most recently active first
+RETRY = 1        # matches waiting on OpenDota to parse
+DEEP_PAGE = 2    # pagination past the first page (incl. pages resumed from a checkpoint)
+
+TIER_NAMES = {
+    NEW_MATCHES: "new-match listings",
+    RETRY: "unparsed retries",
+    DEEP_PAGE: "deep pages",
+}
+
+class WorkQueue:
+    """Heap of (tier, seq, task). Tasks are hashable tuples, e.g. ("page", friend_id, offset)."""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued = set()
+
+    def push(self, tier, task):
+        if task in self._queued:
+            return
+        self._queued.add(task)
+        heapq.heappush(self._heap, (tier, next(self._seq), task))
+
+    def pop(self):
+        tier, _, task = heapq.heappop(self._heap)
+        self._queued.discard(task)
+        return tier, task
+
+    def __len__(self):
+        return len(self._heap)
+
+    def pending(self):
+        """Remaining (tier, task) pairs in the order they would have run."""
+        return [(tier, task) for tier, _, task in sorted(self._heap)]
@@ -0,0 +1,161 @@
+import atexit
+import base64
+import gzip
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import codec
+from urllib.parse import urlsplit
+from config import HTTP_RECORD, HTTP_REPLAY, HTTP_REPLAY_TIMING, OPENDOTA_API_URL
+
+# ---------------- HTTP CASSETTES ---------------- #
+# Every request api.http_request makes can be written to, or served from, a
+# gzipped JSON-lines cassette, so a slow or broken run can be replayed
+# offline on exactly the responses it saw:
+#
+#   HTTP_RECORD=incident.cassette.gz python main.py run
+#   HTTP_REPLAY=incident.cassette.gz python main.py run                 # original latencies
+#   HTTP_REPLAY=incident.cassette.gz HTTP_REPLAY_TIMING=fast python main.py run
+#   python main.py bench replay incident.cassette.gz --inputs incident/  # timed, see bench.py
+#
+# A line per request: method, url, status, response headers and body,
+# latency, or the requests exception it raised. OpenDota URLs are stored as
+# {api}/..., and every Discord post (whichever group's webhook) as {webhook},
+# so neither a webhook token nor the API host ends up in the file; URLs are
+# also cut out of recorded exception messages. Request bodies are never
+# recorded.
+#
+# Replay serves each (method, url) its recorded responses in order, then
+# keeps repeating the last one. A request the cassette never saw fails
+# like a connection error. The run sees the same responses only if it
+# starts from the same store and http_cache.json as the recorded one.
+
+FORMAT = 1
+
+def _key_url(endpoint, url):
+    if endpoint == "discord":
+        return "{webhook}"  # The path is the webhook's id and token
+    if url.startswith(OPENDOTA_API_URL):
+        return "{api}" + url[len(OPENDOTA_API_URL):]
+    return url
+
+def _scrub(message, endpoint, url):
+    """An exception message without the request's URL or any other."""
+    key = _key_url(endpoint, url)
+    message = message.replace(url, key)
+    path = urlsplit(url).path
+    if len(path) > 1:
+        message = message.replace(path, key)  # urllib3 quotes the path alone ("Max retries exceeded with url: ...")
+    return re.sub(r"https?://\S+", "{url}", message)
+
+class Recorder:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._f = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"cassette": FORMAT, "recorded": datetime.now(timezone.utc).isoformat()})
+        atexit.register(self.close)
+        print(f"[INFO] Recording HTTP to {path}")
+
+    def _write(self, entry):
+        with self._lock:
+            if self._f is None:
+                return
+            self._f.write(codec.dumps(entry, separators=(",", ":")) + "\n")
+            self._f.flush()  # Readable up to here even if the run is killed
+
+    def request(self, method, endpoint, url, send):
+        import requests
+        entry = {"method": method, "url": _key_url(endpoint, url)}
+        t0 = time.perf_counter()
+        try:
+            r = send()
+        except requests.exceptions.RequestException as e:
+            entry.update(latency=round(time.perf_counter() - t0, 6), error=type(e).__name__,
+                         message=_scrub(str(e), endpoint, url))
+            self._write(entry)
+            raise
+        entry.update(latency=round(time.perf_counter() - t0, 6), status=r.status_code, reason=r.reason,
+                     headers=dict(r.headers))
+        try:
+            entry["body"] = r.content.decode("utf-8")
+        except UnicodeDecodeError:
+            entry["body_b64"] = base64.b64encode(r.content).decode("ascii")
+        self._write(entry)
+        self.count += 1
+        return r
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+                print(f"[INFO] {self.count} HTTP responses recorded to {self.path}")
+
+class Player:
+    def __init__(self, path, timing="original"):
+        self.path = path
+        self.fast = timing == "fast"
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._tapes = {}  # (method, url) -> [entry, ...] in recorded order
+        for entry in read(path):
+            self._tapes.setdefault((entry["method"], entry["url"]), []).append(entry)
+        print(f"[INFO] Replaying HTTP from {path} ({'as fast as possible' if self.fast else 'original timings'})")
+
+    def _next(self, method, key):
+        with self._lock:
+            tape = self._tapes.get((method, key))
+            if not tape:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return tape.pop(0) if len(tape) > 1 else tape[0]
+
+    def request(self, method, endpoint, url, send):
+        import requests
+        key = _key_url(endpoint, url)
+        entry = self._next(method, key)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(f"{method} {key} is not in {self.path}")
+        if not self.fast:
+            time.sleep(entry["latency"])
+        if "error" in entry:
+            error = getattr(requests.exceptions, entry["error"], requests.exceptions.RequestException)
+            raise error(entry.get("message", ""))
+        r = requests.models.Response()
+        r.status_code = entry["status"]
+        r.reason = entry.get("reason", "")
+        r.headers = requests.structures.CaseInsensitiveDict(entry.get("headers", {}))
+        r._content = base64.b64decode(entry["body_b64"]) if "body_b64" in entry else entry.get("body", "").encode("utf-8")
+        r.encoding = "utf-8"
+        r.url = url
+        r.elapsed = timedelta(seconds=entry["latency"])
+        return r
+
+def read(path):
+    """Request entries of a cassette, oldest first. A recording cut short ends at its last whole line."""
+    entries = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    entries.append(codec.loads(line))
+        except EOFError:
+            pass
+    if not entries or entries[0].get("cassette") != FORMAT:
+        raise ValueError(f"{path} is not a cassette")
+    return entries[1:]
+
+def from_config():
+    """Recorder or Player as HTTP_RECORD / HTTP_REPLAY ask, else None."""
+    if HTTP_RECORD and HTTP_REPLAY:
+        raise ValueError("Set HTTP_RECORD or HTTP_REPLAY, not both")
+    if HTTP_RECORD:
+        return Recorder(HTTP_RECORD)
+    if HTTP_REPLAY:
+        return Player(HTTP_REPLAY, HTTP_REPLAY_TIMING)
+    return None
@@ -1,102 +1,177 @@
 from datetime import datetime, timezone
-from data import steam_names, get_hero_name
-
-def check_challenges(match_data, store):
-    match_id = match_data.get("match_id")
+from data import steam_names
+import heroes
+
+# ---------------- MATCH RULES ---------------- #
+# One rule per challenge block: (id, inputs, score(v) -> [(name, points)]).
+# `inputs` are the OpenDota fields a rule reads, player fields or the match
+# fields in MATCH_FIELDS. validation.py derives what a match has to wait
+# for from them, and a rule is scored as soon as all of its inputs are
+# there, so a match missing only tower_damage still gets its kill and win
+# rules right away (see processor.commit_match for provisional commits).
+#
+# v holds the friend's inputs (None while missing) plus your_rax/enemy_rax
+# and group (4+ tracked friends in the match). Order = Discord order.
+MATCH_FIELDS = ("duration", "barracks_status_radiant", "barracks_status_dire")
+RAX = ("barracks_status_radiant", "barracks_status_dire")
+
+def _pudge(v):
+    # Pudge's Wet Dream / Literal God / Greedy Bastard
+    if v["kills"] < 15:
+        return []
+    p_val = 5
+    bonus_desc = ""
+    if v["deaths"] == 0:
+        p_val *= 2  # Literal God
+        bonus_desc += " (Literal God x2)"
+    if v["assists"] == 0:
+        p_val *= 3  # Greedy Bastard
+        bonus_desc += " (Greedy Bastard x3)"
+    return [(f"Pudge's Wet Dream{bonus_desc}", p_val)]
+
+def _comeback(v):
+    # Win Logic: Anime Protagonist vs Work Smarter
+    if not v["win"]:
+        return []
+    if v["your_rax"] == 0:
+        return [("The Anime Protagonist: Comeback", 10)]
+    if v["enemy_rax"] > 0:
+        return [("Work Smarter, Not Harder: Efficiency", 1)]
+    return []
+
+def _afk_jungler(v):
+    if v["tower_damage"] >= 100:
+        return []
+    return [("AFK Jungler Syndrome", -3 if v["tower_damage"] == 0 else -1)]
+
+def _killless(v):
+    if v["kills"] != 0:
+        return []
+    if v["assists"] == 0:
+        return [("The Uninstalled Client (0K/0A)", -40)]
+    return [("The Spectator (0 Kills)", -20)]
+
+def _walking_ward(v):
+    # The Walking Ward / Double Taxed
+    if v["deaths"] < 20:
+        return []
+    if v["kills"] == 0:
+        return [("Double Taxed: 0 Kills Feeding", -20)]
+    return [("The Walking Ward: 20+ Deaths", -10)]
+
+RULES = [
+    # --- 🎁 REWARDS ---
+    ("hivemind", ("win",), lambda v: [("The Unstoppable Hivemind", 5)] if v["group"] and v["win"] else []),
+    ("pudge", ("kills", "deaths", "assists"), _pudge),
+    ("speedrunner", ("win", "duration"),
+     lambda v: [("Speedrunner Vibes: <25m Win", 3)] if v["win"] and v["duration"] < 1500 else []),
+    ("comeback", ("win",) + RAX, _comeback),
+    # --- ⚠️ PENALTIES ---
+    ("brain_lag", ("win",), lambda v: [("Collective Brain Lag: 5-Stack Loss", -5)] if v["group"] and not v["win"] else []),
+    ("afk_jungler", ("tower_damage",), _afk_jungler),
+    ("killless", ("kills", "assists"), _killless),
+    ("throw", ("win",) + RAX, lambda v: [("Tactical Throw: Lost with Megas", -5)] if not v["win"] and v["enemy_rax"] == 0 else []),
+    ("stomped", ("win", "duration"),
+     lambda v: [("Sub-20 Minute Trash: Stomped", -5)] if not v["win"] and v["duration"] < 1500 else []),
+    ("walking_ward", ("deaths", "kills"), _walking_ward),
+]
+
+def _inputs(match_data, p, group):
+    v = {field: match_data.get(field) for field in MATCH_FIELDS}
+    for field in ("kills", "deaths", "assists", "tower_damage"):
+        v[field] = int(p[field]) if p.get(field) is not None else None
+    v["win"] = bool(p["win"]) if p.get("win") is not None else None
+    v["duration"] = int(v["duration"]) if v["duration"] is not None else None
+    is_radiant = p.get("player_slot", 0) < 128
+    v["your_rax"] = match_data.get("barracks_status_radiant" if is_radiant else "barracks_status_dire")
+    v["enemy_rax"] = match_data.get("barracks_status_dire" if is_radiant else "barracks_status_radiant")
+    v["group"] = group
+    return v
+
+def score_rules(match_data, scored=None):
+    """
+    Triggers for every rule whose inputs are present, skipping rules already
+    in `scored` ({steam id: [rule id]}, from a provisional commit).
+    Returns (triggers, match_time, scored) with this call's rules added to a copy of `scored`.
+    """
     match_time = datetime.fromtimestamp(match_data.get("start_time", 0), tz=timezone.utc)
-    players = match_data.get("players", [])
-    duration = int(match_data.get("duration", 0))
-
-    friends = [p for p in players if p.get("account_id") in steam_names]
-    if not friends:
-        return [], match_time
-    is_group_game = len(friends) >= 4
+    scored = {sid: list(ids) for sid, ids in (scored or {}).items()}
+    friends = [p for p in match_data.get("players", []) if p.get("account_id") in steam_names]
+    group = len(friends) >= 4
 
     triggers = []
-
     for p in friends:
-        sid = p.get("account_id")
-        hero = get_hero_name(p.get("hero_id"))
-        kills = int(p.get("kills", 0) or 0)
-        deaths = int(p.get("deaths", 0) or 0)
-        assists = int(p.get("assists", 0) or 0)
-        win = bool(p.get("win", 0))
-        tower_dmg = int(p.get("tower_damage", 0) or 0)
-        
-        # Barracks Math
-        is_radiant = p.get("player_slot", 0) < 128
-        your_rax = match_data.get("barracks_status_radiant" if is_radiant else "barracks_status_dire")
-        enemy_rax = match_data.get("barracks_status_dire" if is_radiant else "barracks_status_radiant")
-
-        base = {
-            "steam_id": sid,
-            "match_id": match_id,
-            "hero": hero,
-            "kda": f"{kills}/{deaths}/{assists}",
-        }
-
-        # --- 🎁 REWARDS ---
-        
-        # 5-Stack Win
-        if is_group_game and win:
-            triggers.append({**base, "name": "The Unstoppable Hivemind", "points": 5})
-
-        # Performance: Pudge's Wet Dream / Literal God / Greedy Bastard
-        if kills >= 15:
-            p_val = 5
-            bonus_desc = ""
-            if deaths == 0:
-                p_val *= 2  # Literal God
-                bonus_desc += " (Literal God x2)"
-            if assists == 0:
-                p_val *= 3  # Greedy Bastard
-                bonus_desc += " (Greedy Bastard x3)"
-            
-            triggers.append({**base, "name": f"Pudge's Wet Dream{bonus_desc}", "points": p_val})
-
-        # Speedrunner Vibes
-        if win and duration < 1500:
-            triggers.append({**base, "name": "Speedrunner Vibes: <25m Win", "points": 3})
-
-        # Win Logic: Anime Protagonist vs Work Smarter
-        if win:
-            if your_rax == 0:
-                triggers.append({**base, "name": "The Anime Protagonist: Comeback", "points": 10})
-            elif enemy_rax > 0:
-                triggers.append({**base, "name": "Work Smarter, Not Harder: Efficiency", "points": 1})
-
-        # --- ⚠️ PENALTIES ---
-
-        # 5-Stack Loss
-        if is_group_game and not win:
-            triggers.append({**base, "name": "Collective Brain Lag: 5-Stack Loss", "points": -5})
-
-        # AFK Jungler
-        if tower_dmg < 100:
-            p_val = -3 if tower_dmg == 0 else -1
-            triggers.append({**base, "name": "AFK Jungler Syndrome", "points": p_val})
-
-        # Kill-less Penalties
-        if kills == 0:
-            if assists == 0:
-                triggers.append({**base, "name": "The Uninstalled Client (0K/0A)", "points": -40})
-            else:
-                triggers.append({**base, "name": "The Spectator (0 Kills)", "points": -20})
-
-        # Tactical Throw / Stomped
-        if not win:
-            if enemy_rax == 0:
-                triggers.append({**base, "name": "Tactical Throw: Lost with Megas", "points": -5})
-            if duration < 1500:
-                triggers.append({**base, "name": "Sub-20 Minute Trash: Stomped", "points": -5})
-
-        # The Walking Ward / Double Taxed
-        if deaths >= 20:
-            p_val = -10
-            p_name = "The Walking Ward: 20+ Deaths"
-            if kills == 0:
-                p_val *= 2  # Double Taxed
-                p_name = "Double Taxed: 0 Kills Feeding"
-            triggers.append({**base, "name": p_name, "points": p_val})
+        v = _inputs(match_data, p, group)
+        done = scored.setdefault(str(p.get("account_id")), [])
+        base = None
+        for rule_id, inputs, score in RULES:
+            if rule_id in done or any(v[field] is None for field in inputs):
+                continue
+            done.append(rule_id)
+            for name, points in score(v):
+                base = base or _base(match_data, p)
+                triggers.append({**base, "name": name, "points": points})
+    return triggers, match_time, scored
 
+def check_challenges(match_data, store):
+    """Triggers for every rule that can be scored on match_data, and the match start time."""
+    triggers, match_time, _ = score_rules(match_data)
     return triggers, match_time
+
+# ---------------- STREAK CHALLENGES ---------------- #
+# Rules over the streak state in streaks.py: (name, points, test(before, after)).
+# A rule fires on the match that reaches its threshold, once per streak. Only
+# matches committed in start_time order can fire one; a late match that is
+# replayed into the window updates the streaks silently.
+STREAK_RULES = [
+    ("Heating Up: 5 Wins in a Row", 5, lambda before, after: after["win"] == 5),
+    ("Tilt Queue: 5 Losses in a Row", -5, lambda before, after: after["win"] == -5),
+    ("Pacifist Arc: 3 Games Without a Kill", -10, lambda before, after: after["no_kill"] == 3),
+]
+
+def _base(match_data, p):
+    """Trigger fields for player p, as check_challenges builds them."""
+    return {
+        "steam_id": p.get("account_id"),
+        "match_id": match_data.get("match_id"),
+        "hero": heroes.name(p.get("hero_id")),
+        "kda": f"{int(p.get('kills', 0) or 0)}/{int(p.get('deaths', 0) or 0)}/{int(p.get('assists', 0) or 0)}",
+    }
+
+def check_streak_challenges(match_data, changes):
+    """Triggers for the streak rules, given streaks.record_match's {sid: (before, after)}."""
+    triggers = []
+    for p in match_data.get("players", []):
+        change = changes.get(str(p.get("account_id")))
+        if not change:
+            continue
+        for name, points, test in STREAK_RULES:
+            if test(*change):
+                triggers.append({**_base(match_data, p), "name": name, "points": points})
+    return triggers
+
+# ---------------- DUO CHALLENGES ---------------- #
+# Rules over the duo matrix in duos.py, checked for every pair of friends on
+# the same team once the match is counted: (name, points, test(games, wins, won)).
+# Both players of the pair get the trigger, named after their partner.
+DUO_RULES = [
+    ("Soulmates: 10 Wins Together", 3, lambda games, wins, won: won and wins == 10),
+    ("Cursed Duo: 10 Losses Together", -3, lambda games, wins, won: not won and games - wins == 10),
+]
+
+def check_duo_challenges(match_data, friends, matrix):
+    """Triggers for the duo rules, read from the matrix after this match was recorded."""
+    triggers = []
+    for i, p in enumerate(friends):
+        for q in friends[i + 1:]:
+            if (p.get("player_slot", 0) < 128) != (q.get("player_slot", 0) < 128):
+                continue
+            games, wins, _, _ = matrix.pair(p["account_id"], q["account_id"])
+            won = bool(p.get("win"))
+            for name, points, test in DUO_RULES:
+                if not test(games, wins, won):
+                    continue
+                for player, partner in ((p, q), (q, p)):
+                    triggers.append({**_base(match_data, player), "points": points,
+                                     "name": f"{name} ({steam_names.get(partner['account_id'])})"})
+    return triggers
@@ -0,0 +1,87 @@
+import json
+import re
+from config import JSON_CODEC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ---------------- JSON CODEC ---------------- #
+# Every store, cache and API payload is read and written through here, so a
+# faster backend speeds all of them up at once. With orjson installed (an
+# optional extra: `pip install orjson`) and JSON_CODEC=auto it does the
+# work; without it, or with JSON_CODEC=json, the standard library does.
+#
+# dumps() returns exactly what json.dumps would for the same arguments, so
+# committed files (store.json, heroes.json, http_cache.json) don't change
+# when the backend does:
+#   - non-ASCII is escaped to \uXXXX afterwards (orjson writes UTF-8)
+#   - output orjson would spell differently is redone with json: floats,
+#     non-string keys, ints over 64 bits, and any layout other than
+#     indent=2 or separators=(",", ":")
+# NaN and Infinity are the exception (orjson writes null, json a
+# non-standard literal); nothing we store is a float.
+#
+# loads() hands what orjson rejects (NaN, huge ints) to json, so both
+# backends accept the same documents.
+
+if JSON_CODEC == "orjson" and orjson is None:
+    print("[WARN] JSON_CODEC=orjson but orjson is not installed, using json")
+BACKEND = "orjson" if orjson is not None and JSON_CODEC in ("auto", "orjson") else "json"
+
+# A float in orjson's output is a number token with a fraction or exponent.
+# Tokens follow ": " / ":" / "," / "[" or indentation; _MAYBE_FLOAT is the
+# cheap first pass, and a look-alike inside a string only costs a json redo.
+_MAYBE_FLOAT = re.compile(rb"\d[.eE]")
+_FLOAT = re.compile(rb"[ :\[,]-?\d+[.eE]")
+_NOT_ASCII = re.compile("[^\x00-\x7e]")  # json's ensure_ascii escapes DEL too
+
+def _escape(m):
+    c = ord(m.group())
+    if c > 0xFFFF:
+        c -= 0x10000
+        return "\\u{:04x}\\u{:04x}".format(0xD800 | (c >> 10), 0xDC00 | (c & 0x3FF))
+    return "\\u{:04x}".format(c)
+
+def _orjson_dumps(obj, indent, sort_keys, default, ensure_ascii):
+    """orjson's output when it matches json's byte for byte, else None."""
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS  # To `default`, as json does
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    try:
+        out = orjson.dumps(obj, default=default, option=option)
+    except orjson.JSONEncodeError:
+        return None
+    if out[:1] in b"-0123456789" or _MAYBE_FLOAT.search(out) and _FLOAT.search(out):
+        return None  # A bare number, or a float somewhere
+    text = out.decode("utf-8")
+    if ensure_ascii and (not out.isascii() or b"\x7f" in out):
+        text = _NOT_ASCII.sub(_escape, text)
+    return text
+
+def dumps(obj, indent=None, sort_keys=False, default=None, ensure_ascii=True, separators=None):
+    """json.dumps with the same arguments and output, via orjson where it can."""
+    if BACKEND == "orjson" and (indent == 2 and separators is None or indent is None and separators == (",", ":")):
+        text = _orjson_dumps(obj, indent, sort_keys, default, ensure_ascii)
+        if text is not None:
+            return text
+    return json.dumps(obj, indent=indent, sort_keys=sort_keys, default=default, ensure_ascii=ensure_ascii,
+                      separators=separators)
+
+def dump(obj, f, **kwargs):
+    f.write(dumps(obj, **kwargs))
+
+def loads(data):
+    """json.loads of str or bytes."""
+    if BACKEND == "orjson":
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # NaN, ints over 64 bits, or really invalid: json decides
+    return json.loads(data)
+
+def load(f):
+    return loads(f.read())
@@ -2,19 +2,58 @@ from datetime import datetime, timezone
 import os
 
 # ---------------- CONFIG ---------------- #
-END_DATE = datetime(2026, 3, 1, tzinfo=timezone.utc)
-if datetime.now(timezone.utc) >= END_DATE:
-    print("End date reached, skipping run.")
-    exit(0)
+# Plain values only: importing this module must not read files or exit.
+END_DATE = datetime.fromisoformat(os.environ.get("SEASON_END_DATE", "2026-03-01")).replace(tzinfo=timezone.utc)
+
+def season_over(now=None, end=None):
+    """True once END_DATE (or a group's own `end`) has passed; commands that check for new matches stop there."""
+    return (now or datetime.now(timezone.utc)) >= (end or END_DATE)
 
 WEBHOOK_URL = os.environ.get("DISCORD_WEBHOOK")
+# Point at simulator.py (e.g. http://127.0.0.1:8765/api) for offline runs
+OPENDOTA_API_URL = os.environ.get("OPENDOTA_API_URL", "https://api.opendota.com/api").rstrip("/")
 CHECK_FROM_DATE = datetime(2026, 1, 16, tzinfo=timezone.utc)
-STORE_FILE = "store.json"
+STORE_FILE = os.environ.get("STORE_FILE", "store.json")
 HEROES_FILE = "heroes.json"
 BATCH_SIZE = 20
-API_DELAY = 0.5  # Reduced from 1.0, OpenDota recommends < 1 req/sec
+API_DELAY = float(os.environ.get("API_DELAY", "0.5"))  # Reduced from 1.0, OpenDota recommends < 1 req/sec
 MAX_RETRIES = 3  # Reduced from 5 to fail faster on persistent issues
 REQUEST_TIMEOUT = 20  # Increased from 15 for slower connections
 CONNECT_TIMEOUT = 10  # Add separate connection timeout
+# Hard cap on one run_check, kept under the 30 min cron spacing. 0 disables it.
+RUN_BUDGET_SECONDS = int(os.environ.get("RUN_BUDGET_SECONDS", "1500"))
+# Run pipeline: workers per stage ("fetch=4,score=2" overrides) and queue bound between stages.
+# commit and notify are always single-threaded to keep start_time order.
+PIPELINE_WORKERS = {"discover": 1, "fetch": 2, "validate": 1, "score": 1}
+PIPELINE_WORKERS.update({
+    stage: int(n) for stage, n in
+    (pair.split("=") for pair in os.environ.get("PIPELINE_WORKERS", "").split(",") if pair)
+})
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "32"))
 DEBUG_MODE = os.environ.get("DEBUG_MODE", "false").lower() == "true"
-STEAM_NAMES_FILE = "steam_names.json"
+# Score the streak challenges in challenges.py. Off by default: turning it on mid-season changes the rules.
+STREAK_CHALLENGES = os.environ.get("STREAK_CHALLENGES", "false").lower() == "true"
+DUO_CHALLENGES = os.environ.get("DUO_CHALLENGES", "false").lower() == "true"  # Same, for the duo rules
+# Score and post the rules whose inputs are parsed, finalize the rest later (see processor.triage); false = wait for all
+PROVISIONAL_SCORING = os.environ.get("PROVISIONAL_SCORING", "true").lower() == "true"
+STEAM_NAMES_FILE = os.environ.get("STEAM_NAMES_FILE", "steam_names.json")
+HTTP_CACHE_FILE = "http_cache.json"  # ETag/Last-Modified/hash validators per match-list URL
+LEADERBOARD_FILE = "smooo_king_bot_leaderboard.txt"
+# Serve several friend groups from one run (see groups.py); unset = the single group configured above
+GROUPS_FILE = os.environ.get("GROUPS_FILE", "")
+# Directory for run_report.json + run_report.prom (Prometheus textfile). Unset disables metrics.
+RUN_REPORT_DIR = os.environ.get("RUN_REPORT_DIR", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profile")  # Output of main.py --profile / --trace-memory
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")  # Frozen past seasons, see archive.py
+# Write every HTTP exchange to a cassette, or serve a run from one (see cassette.py). Timing: original | fast
+HTTP_RECORD = os.environ.get("HTTP_RECORD", "")
+HTTP_REPLAY = os.environ.get("HTTP_REPLAY", "")
+HTTP_REPLAY_TIMING = os.environ.get("HTTP_REPLAY_TIMING", "original")
+# main.py backfill: cursor + downloaded matches (see backfill.py), request spacing, parallel requests, listing page size.
+# OpenDota's X-Rate-Limit-Remaining-Minute slows the pacing down before it would 429.
+BACKFILL_DIR = os.environ.get("BACKFILL_DIR", "backfill")
+BACKFILL_API_DELAY = float(os.environ.get("BACKFILL_API_DELAY", "0.1"))
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", "4"))
+BACKFILL_PAGE_SIZE = 100
+# JSON backend for stores, caches and API payloads (see codec.py): auto = orjson if installed, json = stdlib only
+JSON_CODEC = os.environ.get("JSON_CODEC", "auto")
@@ -1,51 +1,177 @@
-import json
-from config import STORE_FILE, HEROES_FILE, STEAM_NAMES_FILE
+import os
+import socket
+import time
+import codec
+import duos
+import metrics
+import seen
+from store_schema import SCHEMA_VERSION, upgrade
+from config import STORE_FILE, STEAM_NAMES_FILE, RUN_BUDGET_SECONDS
 
 # ---------------- STEAM NAMES LOADING ---------------- #
-def load_steam_names():
+# Filled by load_steam_names() when a command starts (see main.py), in place,
+# so modules that did `from data import steam_names` see the roster.
+steam_names = {}
+
+def load_steam_names(path=STEAM_NAMES_FILE):
     """Load steam names from JSON file, converting string keys to integers."""
     try:
-        with open(STEAM_NAMES_FILE, "r") as f:
-            names_dict = json.load(f)
+        with open(path, "r") as f:
+            names_dict = codec.load(f)
             # Convert string keys to integers
-            return {int(k): v for k, v in names_dict.items()}
+            names = {int(k): v for k, v in names_dict.items()}
     except FileNotFoundError:
-        print(f"[WARN] {STEAM_NAMES_FILE} not found, using empty steam_names")
-        return {}
+        print(f"[WARN] {path} not found, using empty steam_names")
+        names = {}
     except Exception as e:
-        print(f"[ERROR] Failed to load {STEAM_NAMES_FILE}: {e}")
-        return {}
-
-steam_names = load_steam_names()
+        print(f"[ERROR] Failed to load {path}: {e}")
+        names = {}
+    steam_names.clear()
+    steam_names.update(names)
+    return steam_names
 
 # ---------------- STORE MANAGEMENT ---------------- #
-def load_store():
+def load_store(path=STORE_FILE):
+    with metrics.timer("store_load_seconds"):
+        return _load_store(path)
+
+def _load_store(path):
     try:
-        with open(STORE_FILE, "r") as f:
-            store = json.load(f)
+        with open(path, "r") as f:
+            store = codec.load(f)
             if "unparsed_matches" not in store:
                 store["unparsed_matches"] = {}
             if "leaderboard" not in store:
                 store["leaderboard"] = {}
-            if "checked_matches" not in store:
-                store["checked_matches"] = {}
             if "daily" not in store:
                 store["daily"] = {}
-            return store
     except:
-        return {"checked_matches": {}, "unparsed_matches": {}, "leaderboard": {}, "daily": {}}
+        return {"schema_version": SCHEMA_VERSION, "checked_matches": seen.SeenIndex(), "unparsed_matches": {}, "leaderboard": {}, "daily": {}}
+    if "checked_matches" not in store:
+        # Schema 3 keeps checked matches only in <store>.seen; loading without it would re-score the season
+        seen_path = seen.path_for(path)
+        if store.get("schema_version", 0) >= 3 and not os.path.exists(seen_path):
+            raise FileNotFoundError(f"{seen_path} is missing; {path} has no record of checked matches without it")
+        store["checked_matches"] = seen.SeenIndex.load(seen_path)
+    upgrade(store)  # Older schemas (e.g. Season 1) are migrated in memory
+    if "duos" in store:
+        store["duos"] = duos.DuoMatrix.from_json(store["duos"])
+    return store
+
+def _encode(value):
+    """JSON form of store values kept as objects in memory (duos.DuoMatrix)."""
+    return value.to_json()
+
+def save_store(store, path=STORE_FILE):
+    """Write the store as JSON and its checked matches as <store>.seen (see seen.py)."""
+    with metrics.timer("store_save_seconds"):
+        store.get("checked_matches", seen.SeenIndex()).save(seen.path_for(path))
+        with open(path, "w") as f:
+            codec.dump({k: v for k, v in store.items() if k != "checked_matches"}, f, indent=2, default=_encode)
+    if metrics.enabled:
+        metrics.gauge("store_bytes", os.path.getsize(path))
+
+# ---------------- STORE LEASE ---------------- #
+# Guards a store file against two runs on the same machine. The lease expires
+# on its own (a run can't outlive RUN_BUDGET_SECONDS), so a crashed run never
+# blocks the next one for long; nor does one from a dead process on this
+# host. The lease file is written in full and hard-linked into place, so a
+# reader never sees it half-written. Overlapping CI runs are serialised by the
+# workflow's concurrency group and reconciled with store_merge.py on push.
+LEASE_GRACE_SECONDS = 120
 
-def save_store(store):
-    with open(STORE_FILE, "w") as f:
-        json.dump(store, f, indent=2)
+def _lease_path(path):
+    return path + ".lock"
+
+def _holder_alive(owner):
+    """A lease from a dead process on this host is stale even before it expires."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _identity(stat):
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+def _read_lease(path, ttl):
+    """(lease, file identity) of the lease file, or (None, None) if there is none."""
+    try:
+        with open(_lease_path(path), "rb") as f:
+            stat = os.fstat(f.fileno())
+            text = f.read()
+    except FileNotFoundError:
+        return None, None
+    try:
+        held = codec.loads(text)
+    except ValueError:
+        held = None
+    if not isinstance(held, dict) or not isinstance(held.get("expires"), (int, float)):
+        # Not written by this code: assume a live holder until a full ttl has passed
+        held = {"owner": "unknown", "expires": stat.st_mtime + ttl}
+    return held, _identity(stat)
 
-# ---------------- HERO LOOKUP ---------------- #
-def get_hero_name(hero_id):
-    if not hasattr(get_hero_name, 'hero_map'):
+def _break_lease(path, identity):
+    """
+    Remove a stale lease if it is still the file that was judged stale.
+    Contenders take turns through <lease>.break, so one can't remove the
+    lease another has just taken in its place.
+    """
+    lock = _lease_path(path)
+    guard = lock + ".break"
+    try:
+        os.close(os.open(guard, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
         try:
-            with open(HEROES_FILE, "r") as f:
-                heroes = json.load(f)
-                get_hero_name.hero_map = {str(h['id']): h['localized_name'] for h in heroes}
-        except:
-            get_hero_name.hero_map = {}
-    return get_hero_name.hero_map.get(str(hero_id), f"Hero {hero_id}")
+            if time.time() - os.stat(guard).st_mtime > LEASE_GRACE_SECONDS:
+                os.remove(guard)  # Left by a run that died mid-break
+        except FileNotFoundError:
+            pass
+        return
+    try:
+        if _identity(os.stat(lock)) == identity:
+            os.remove(lock)
+    except FileNotFoundError:
+        pass
+    finally:
+        os.remove(guard)
+
+def acquire_store_lease(path=STORE_FILE, ttl=None):
+    """Take the lease on a store file. Returns False if another live run holds it."""
+    ttl = ttl or (RUN_BUDGET_SECONDS or 3600) + LEASE_GRACE_SECONDS
+    lease = {"owner": f"{socket.gethostname()}:{os.getpid()}", "expires": time.time() + ttl}
+
+    # Written in full first and linked into place, so nobody ever reads a half-written lease
+    tmp = f"{_lease_path(path)}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        codec.dump(lease, f)
+    try:
+        for _ in range(2):
+            try:
+                os.link(tmp, _lease_path(path))
+                return True
+            except FileExistsError:
+                pass
+            held, identity = _read_lease(path, ttl)
+            if held is None:
+                continue  # Released in the meantime
+            if held["expires"] > time.time() and _holder_alive(held.get("owner", "")):
+                print(f"[WARN] {path} is leased by {held.get('owner')} until "
+                      f"{time.strftime('%H:%M:%S', time.localtime(held['expires']))}")
+                return False
+            print(f"[WARN] Breaking stale lease on {path} held by {held.get('owner')}")
+            _break_lease(path, identity)
+        return False
+    finally:
+        os.remove(tmp)
+
+def release_store_lease(path=STORE_FILE):
+    try:
+        os.remove(_lease_path(path))
+    except FileNotFoundError:
+        pass
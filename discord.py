@@ -1,9 +1,11 @@
 import time
-import requests
+import metrics
 from config import WEBHOOK_URL, DEBUG_MODE
-from api import session
+from api import http_request
 
 # ---------------- DISCORD ---------------- #
+webhook_url = WEBHOOK_URL  # Swapped per group by groups.activate
+
 def send_discord(message):
     """Send to Discord. Always prints locally for testing."""
     print("\n" + "="*80)
@@ -12,16 +14,21 @@ def send_discord(message):
     print(message)
     print("="*80 + "\n")
 
-    if not WEBHOOK_URL or DEBUG_MODE:
+    if not webhook_url or DEBUG_MODE:
         print("[INFO] Skipping actual Discord send (no webhook or debug mode)")
         return
 
     for attempt in range(3):
+        if attempt:
+            metrics.incr("http_retries_total", endpoint="discord")
         try:
-            r = session.post(WEBHOOK_URL, json={"content": message}, timeout=10)
+            r = http_request("POST", "discord", webhook_url, json={"content": message}, timeout=10)
             r.raise_for_status()
+            metrics.incr("discord_messages_total", result="sent")
             return
         except Exception as e:
             if attempt == 2:
                 print(f"[ERROR] Discord send failed: {e}")
+                metrics.incr("discord_messages_total", result="failed")
+            metrics.incr("sleep_seconds_total", 2, reason="discord")
             time.sleep(2)
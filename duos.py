@@ -0,0 +1,215 @@
+import base64
+import sys
+from array import array
+
+# ---------------- DUO MATRIX ---------------- #
+# Who plays with whom, as dense N x N tables over interned player indexes:
+#
+#   games[a][b]   matches a and b played on the same team (games[a][a]: all of a's)
+#   wins[a][b]    of those, won
+#   points[a][b]  points a scored in them (not symmetric: "who drags whom down")
+#
+# commit_match adds one match in O(k^2) for k tracked friends in it, so
+# "best duo" or "a's points with b vs without" never rescans match history.
+#
+# Persisted in store["duos"] as the player list plus each table as
+# base64 of little-endian int32s, row-major.
+#
+# Two runs can commit the same match: shards each score every friend in what
+# they fetch, and overlapping runs both start from the same store. A run
+# journals what it committed in
+# store["duo_log"] = {match id: [[team, win, points], ...]}
+# and merge() takes the matches both sides journalled since base back out
+# once. The journal only covers the run that wrote the store: the next run
+# drops it on load (begin_run), as the stores it could merge with are merged
+# by then. Backfill holds the store alone and doesn't journal (journal=False).
+
+TABLES = ("games", "wins", "points")
+journal = True
+
+class DuoMatrix:
+    def __init__(self, players=()):
+        self.players = []   # index -> steam id (str)
+        self.index = {}     # steam id -> index
+        self.tables = {name: array("i") for name in TABLES}
+        for sid in players:
+            self.intern(sid)
+
+    def __len__(self):
+        return len(self.players)
+
+    def intern(self, sid):
+        """Index for a player, growing every table by a row and a column if new."""
+        sid = str(sid)
+        i = self.index.get(sid)
+        if i is not None:
+            return i
+        n = len(self.players)
+        for name, old in self.tables.items():
+            grown = array("i", bytes(4 * (n + 1) * (n + 1)))
+            for row in range(n):
+                grown[row * (n + 1):row * (n + 1) + n] = old[row * n:(row + 1) * n]
+            self.tables[name] = grown
+        self.players.append(sid)
+        self.index[sid] = n
+        return n
+
+    def cell(self, name, a, b):
+        n = len(self.players)
+        return self.tables[name][self.index[str(a)] * n + self.index[str(b)]]
+
+    # ---- updates ----
+
+    def record(self, team, win, points_by_player, sign=1):
+        """
+        One match for friends on the same team: team = [steam id], points_by_player = {steam id: points}.
+        sign=-1 takes a recorded match back out.
+        """
+        rows = [(self.intern(sid), points_by_player.get(str(sid), 0)) for sid in team]
+        n = len(self.players)
+        games, wins, points = (self.tables[name] for name in TABLES)
+        for a, pts in rows:
+            for b, _ in rows:
+                games[a * n + b] += sign
+                wins[a * n + b] += sign * win
+                points[a * n + b] += sign * pts
+
+    def drop(self, sid):
+        """Remove a player's row and column (a friend taken off the roster)."""
+        if str(sid) not in self.index:
+            return
+        n = len(self.players)
+        keep = [s for s in self.players if s != str(sid)]
+        rows = [self.index[s] for s in keep]
+        for name in TABLES:
+            table = self.tables[name]
+            self.tables[name] = array("i", (table[a * n + b] for a in rows for b in rows))
+        self.players = keep
+        self.index = {s: i for i, s in enumerate(keep)}
+
+    # ---- queries ----
+
+    def pair(self, a, b):
+        """(games, wins, a's points, b's points) for two players on the same team."""
+        if str(a) not in self.index or str(b) not in self.index:
+            return 0, 0, 0, 0
+        return self.cell("games", a, b), self.cell("wins", a, b), self.cell("points", a, b), self.cell("points", b, a)
+
+    def duos(self, min_games=1):
+        """[(a, b, games, wins, points a, points b)] for every pair that played together, a before b."""
+        rows = []
+        n = len(self.players)
+        games, wins, points = (self.tables[name] for name in TABLES)
+        for a in range(n):
+            for b in range(a + 1, n):
+                g = games[a * n + b]
+                if g >= min_games:
+                    rows.append((self.players[a], self.players[b], g, wins[a * n + b],
+                                 points[a * n + b], points[b * n + a]))
+        return rows
+
+    def partners(self, sid):
+        """[(partner, games, wins, points with them)] plus, first, sid's own totals as partner sid."""
+        a = self.index[str(sid)]
+        n = len(self.players)
+        games, wins, points = (self.tables[name] for name in TABLES)
+        return [(self.players[b], games[a * n + b], wins[a * n + b], points[a * n + b])
+                for b in sorted(range(n), key=lambda b: b != a) if games[a * n + b]]
+
+    # ---- persistence / merge ----
+
+    def to_json(self):
+        encoded = {"players": list(self.players)}
+        for name, table in self.tables.items():
+            data = array("i", table)
+            if sys.byteorder == "big":
+                data.byteswap()
+            encoded[name] = base64.b64encode(data.tobytes()).decode("ascii")
+        return encoded
+
+    @classmethod
+    def from_json(cls, encoded):
+        matrix = cls()
+        matrix.players = list(encoded.get("players", []))
+        matrix.index = {sid: i for i, sid in enumerate(matrix.players)}
+        for name in TABLES:
+            table = array("i", base64.b64decode(encoded.get(name, "")))
+            if sys.byteorder == "big":
+                table.byteswap()
+            if len(table) != len(matrix.players) ** 2:
+                raise ValueError(f"duos.{name} has {len(table)} cells for {len(matrix.players)} players")
+            matrix.tables[name] = table
+        return matrix
+
+    def combine(self, other, op):
+        """Fold another matrix into this one cell by cell, matched by steam id: mine = op(mine, theirs)."""
+        for sid in other.players:
+            self.intern(sid)
+        n, m = len(self.players), len(other.players)
+        mapping = [self.index[sid] for sid in other.players]
+        for name in TABLES:
+            mine, theirs = self.tables[name], other.tables[name]
+            for a in range(m):
+                row = mapping[a] * n
+                for b in range(m):
+                    cell = row + mapping[b]
+                    mine[cell] = op(mine[cell], theirs[a * m + b])
+        return self
+
+def of(value):
+    """A DuoMatrix from a store value: already one, its JSON form, or None."""
+    if value is None:
+        return DuoMatrix()
+    return value if isinstance(value, DuoMatrix) else DuoMatrix.from_json(value)
+
+def for_store(store):
+    matrix = store.get("duos")
+    if not isinstance(matrix, DuoMatrix):
+        matrix = store["duos"] = of(matrix)
+    return matrix
+
+def _teams(friends, points_by_player):
+    """[[team steam ids, win, {steam id: points}]] for each side of a match with tracked friends on it."""
+    entry = []
+    for radiant in (True, False):
+        team = [p for p in friends if (p.get("player_slot", 0) < 128) == radiant]
+        if team:
+            sids = [str(p["account_id"]) for p in team]
+            entry.append([sids, int(bool(team[0].get("win"))), {s: points_by_player.get(s, 0) for s in sids}])
+    return entry
+
+def record_match(store, match_data, friends, points_by_player):
+    """Count a committed match for every team that had tracked friends on it, and journal it."""
+    matrix = for_store(store)
+    entry = _teams(friends, points_by_player)
+    for team, win, points in entry:
+        matrix.record(team, win, points)
+    if journal and entry:
+        store.setdefault("duo_log", {})[str(match_data.get("match_id"))] = entry
+
+def begin_run(store):
+    """Drop the journal of the run that wrote a freshly loaded store."""
+    store.pop("duo_log", None)
+
+def recount_match(store, old_friends, old_points, friends, points_by_player):
+    """Replace a counted match's teams with a rescored version (friends added to the roster, see roster.py)."""
+    matrix = for_store(store)
+    for team, win, points in _teams(old_friends, old_points):
+        matrix.record(team, win, points, sign=-1)
+    for team, win, points in _teams(friends, points_by_player):
+        matrix.record(team, win, points)
+
+def merge(ours, theirs, base=None, shared=()):
+    """
+    ours + theirs - base, so matches either side added since base count once,
+    minus the journalled teams in `shared` that both sides added.
+    Without base, the larger count per cell (exact when one side contains the other).
+    """
+    if base is None:
+        return DuoMatrix().combine(of(ours), max).combine(of(theirs), max)
+    twice = DuoMatrix()
+    for entry in shared:
+        for team, win, points in entry:
+            twice.record(team, win, points)
+    merged = DuoMatrix().combine(of(ours), int.__add__).combine(of(theirs), int.__add__)
+    return merged.combine(of(base), int.__sub__).combine(twice, int.__sub__)
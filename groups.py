@@ -0,0 +1,69 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+import api
+import codec
+import discord
+from config import STEAM_NAMES_FILE, STORE_FILE, HTTP_CACHE_FILE, LEADERBOARD_FILE, WEBHOOK_URL, CHECK_FROM_DATE, END_DATE
+from data import load_steam_names
+
+# ---------------- FRIEND GROUPS ---------------- #
+# One process can serve several friend groups, each with its own roster,
+# store, season and Discord webhook, listed in GROUPS_FILE:
+#
+#   {"groups": [
+#     {"name": "smooo", "steam_names": "steam_names.json", "store": "store.json",
+#      "leaderboard": "smooo_king_bot_leaderboard.txt", "webhook_env": "DISCORD_WEBHOOK"},
+#     {"name": "tuesday", "steam_names": "tuesday/steam_names.json", "store": "tuesday/store.json",
+#      "webhook_env": "TUESDAY_WEBHOOK", "season_start": "2026-02-01", "season_end": "2026-05-01"}
+#   ]}
+#
+# `main.py run --groups groups.json` checks the groups one after another
+# with api.share_responses() on: a player in two groups has each listing
+# page fetched once, and a match two groups played is downloaded once.
+# Scoring, stores, validators, leaderboards and Discord stay per group.
+# Webhooks are named by environment variable so the file can be committed.
+#
+# http_cache and leaderboard default to files next to the group's store
+# (tuesday/store.json -> tuesday/store.http_cache.json, tuesday/store_leaderboard.txt).
+
+Group = namedtuple("Group", "name roster store http_cache leaderboard webhook start end")
+
+# What a plain `main.py run` uses, from config.py
+DEFAULT = Group("default", STEAM_NAMES_FILE, STORE_FILE, HTTP_CACHE_FILE, LEADERBOARD_FILE,
+                WEBHOOK_URL, CHECK_FROM_DATE, END_DATE)
+
+def _date(value, default):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc) if value else default
+
+def load(path):
+    """Groups from a GROUPS_FILE. Raises ValueError on a file that would make groups share a store."""
+    with open(path, "r") as f:
+        entries = codec.load(f)["groups"]
+    groups = []
+    for entry in entries:
+        base = os.path.splitext(entry["store"])[0]
+        webhook_env = entry.get("webhook_env")
+        groups.append(Group(
+            name=entry["name"],
+            roster=entry["steam_names"],
+            store=entry["store"],
+            http_cache=entry.get("http_cache", f"{base}.http_cache.json"),
+            leaderboard=entry.get("leaderboard", f"{base}_leaderboard.txt"),
+            webhook=os.environ.get(webhook_env) if webhook_env else None,
+            start=_date(entry.get("season_start"), CHECK_FROM_DATE),
+            end=_date(entry.get("season_end"), END_DATE),
+        ))
+    for field in ("name", "store", "http_cache", "leaderboard"):
+        values = [getattr(g, field) for g in groups]
+        if len(set(values)) != len(values):
+            raise ValueError(f"Groups in {path} must not share a {field}")
+    return groups
+
+def activate(group):
+    """Point the module-level roster, webhook and validator cache at one group."""
+    load_steam_names(group.roster)
+    discord.webhook_url = group.webhook
+    api.load_http_cache(group.http_cache)
+    for key in api.cache_stats:
+        api.cache_stats[key] = 0
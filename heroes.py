@@ -0,0 +1,106 @@
+import threading
+from collections import namedtuple
+import codec
+import metrics
+from api import fetch_hero_constants
+from config import HEROES_FILE
+
+# ---------------- HERO REGISTRY ---------------- #
+# heroes.json parsed once into a list indexed by hero id, so a lookup is a
+# list index instead of a str() + dict probe per player per match:
+#
+#   heroes.name(p["hero_id"])          "Anti-Mage"
+#   heroes.get(1).roles                ("Carry", "Escape", "Nuker")
+#   heroes.with_role("Support")        [Hero, ...] for role-based challenges
+#
+# heroes.json is the local copy of OpenDota's /constants/heroes. refresh()
+# re-downloads it with the ETag from http_cache.json, so an unchanged list
+# costs a 304; if OpenDota is unreachable the local copy is used as is.
+
+Hero = namedtuple("Hero", "id name localized_name primary_attr attack_type roles")
+FIELDS = ("id", "name", "localized_name", "primary_attr", "attack_type", "roles", "legs")  # heroes.json entry
+
+_by_id = None          # hero id -> Hero or None, dense
+_unknown = set()       # ids we have already warned about
+_lock = threading.Lock()
+
+def _build(entries):
+    by_id = [None] * (max((h["id"] for h in entries), default=0) + 1)
+    for h in entries:
+        by_id[h["id"]] = Hero(h["id"], h.get("name"), h.get("localized_name") or f"Hero {h['id']}",
+                              h.get("primary_attr"), h.get("attack_type"), tuple(h.get("roles") or ()))
+    return by_id
+
+def load(path=HEROES_FILE):
+    """(Re)read heroes.json. A missing or broken file leaves an empty registry, loudly."""
+    global _by_id
+    try:
+        with open(path, "r") as f:
+            entries = codec.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Failed to load {path}: {e}")
+        entries = []
+    with _lock:
+        _by_id = _build(entries)
+        _unknown.clear()
+    return _by_id
+
+def _registry():
+    return _by_id if _by_id is not None else load()
+
+def get(hero_id):
+    """Hero for an id from match data, or None if heroes.json doesn't know it."""
+    by_id = _registry()
+    try:
+        hero_id = int(hero_id)
+    except (TypeError, ValueError):
+        return None
+    return by_id[hero_id] if 0 <= hero_id < len(by_id) else None
+
+def name(hero_id):
+    """Display name; called per friend per match, so plain int ids take the short path."""
+    try:
+        hero = (_by_id if _by_id is not None else load())[hero_id]
+    except (IndexError, TypeError):
+        hero = get(hero_id)  # "14" from a stored record, None, or an id newer than heroes.json
+    if hero is not None:
+        return hero.localized_name
+    with _lock:
+        first = hero_id not in _unknown
+        _unknown.add(hero_id)
+    if first:
+        print(f"[WARN] Hero {hero_id} is not in {HEROES_FILE}; it may be new (run refreshes it)")
+        metrics.incr("heroes_unknown_total")
+    return f"Hero {hero_id}"
+
+def all_heroes():
+    return [h for h in _registry() if h is not None]
+
+def with_role(role):
+    return [h for h in all_heroes() if role in h.roles]
+
+def with_attr(attr):
+    return [h for h in all_heroes() if h.primary_attr == attr]
+
+# ---------------- REFRESH ---------------- #
+
+def refresh(path=HEROES_FILE):
+    """Update heroes.json from OpenDota if it changed. Returns True if the file was rewritten."""
+    constants = fetch_hero_constants()
+    if constants is None:
+        return False
+    entries = sorted(({k: h[k] for k in FIELDS if k in h} for h in constants.values()), key=lambda h: h["id"])
+    if entries == _read_entries(path):
+        return False
+    with open(path, "w") as f:
+        codec.dump(entries, f, indent=2)
+    load(path)
+    print(f"[INFO] {path} updated from OpenDota constants ({len(entries)} heroes)")
+    return True
+
+def _read_entries(path):
+    try:
+        with open(path, "r") as f:
+            return codec.load(f)
+    except (OSError, ValueError):
+        return None
@@ -1,89 +1,217 @@
 from datetime import datetime, timezone
+import argparse
+import os
 import sys
-from config import BATCH_SIZE
-from data import steam_names, load_store, save_store
-from api import fetch_recent_match_ids
+import budget
+import codec
+import duos
+import groups
+import heroes
+import metrics
+import profiling
+import roster
+import sharding
+import standings
+import store_schema
+import streaks
+import windows
+from config import (STORE_FILE, HTTP_CACHE_FILE, LEADERBOARD_FILE, PROFILE_DIR, RUN_REPORT_DIR,
+                    CHECK_FROM_DATE, END_DATE, BACKFILL_WORKERS, GROUPS_FILE, season_over)
+from data import steam_names, load_steam_names, load_store, save_store, acquire_store_lease, release_store_lease
+from api import save_http_cache, cache_report, cache_stats, share_responses, shared_report
 from processor import process_match
+from discord import send_discord
+from pipeline import RunPipeline
+from store_merge import merge_stores
 
 
-def write_leaderboard_txt(store, filepath="smooo_king_bot_leaderboard.txt"):
+def write_leaderboard_txt(store, filepath=LEADERBOARD_FILE):
     """
     Writes the full leaderboard (sorted by total_points desc)
     to a text file. Overwrites every run.
     """
     leaderboard = store.get("leaderboard", {})
 
-    sorted_players = sorted(
-        leaderboard.items(),
-        key=lambda x: x[1].get("total_points", 0),
-        reverse=True
-    )
-
     with open(filepath, "w", encoding="utf-8") as f:
         f.write("KING-SASSLY LEADERBOARD\n")
         f.write("=" * 40 + "\n\n")
 
-        for rank, (sid, data) in enumerate(sorted_players, 1):
+        for rank, (sid, points) in enumerate(standings.for_store(store).ranked(), 1):
             try:
                 sid_int = int(sid)
             except ValueError:
                 sid_int = None
 
-            name = steam_names.get(sid_int, data.get("name", sid))
-            points = data.get("total_points", 0)
+            name = steam_names.get(sid_int, leaderboard[sid].get("name", sid))
 
             f.write(f"{rank:>2}. {name:<20} {points:+} pts\n")
 
-def run_check():
-    """Main check routine."""
-    print(f"\n{'='*80}")
-    print(f"Starting check at {datetime.now(timezone.utc).isoformat()}")
-    print(f"{'='*80}\n")
+        for window in windows.WINDOWS:
+            f.write(f"\n{windows.title(window)}\n")
+            f.write("-" * 40 + "\n")
+            ranked = windows.totals(store, window)
+            if not ranked:
+                f.write("No points yet\n")
+            for rank, (name, points) in enumerate(ranked, 1):
+                f.write(f"{rank:>2}. {name:<20} {points:+} pts\n")
+
+def build_work_queue(store):
+    """
+    Orders the run by value: first listing page of recently active friends,
+    then unparsed retries, then deep pagination (incl. pages checkpointed
+    by a previous run that ran out of budget).
+    """
+    queue = budget.WorkQueue()
+    activity = store.get("friend_activity", {})
+    friends = [fid for fid in steam_names if sharding.owns(fid)]
+
+    by_recency = sorted(friends, key=lambda fid: activity.get(str(fid), 0), reverse=True)
+    for friend_id in by_recency:
+        queue.push(budget.NEW_MATCHES, ("page", friend_id, 0))
+
+    for match_id_str, unparsed_data in store.get("unparsed_matches", {}).items():
+        if sharding.owns(unparsed_data.get("expected_friend") or match_id_str):
+            queue.push(budget.RETRY, ("retry", int(match_id_str)))
 
-    store = load_store()
-    processed_this_run = set()  # Tracks match IDs processed this run to avoid duplicates
+    for friend_id, offset in store.pop("checkpoint", {}).get("pages", []):
+        if friend_id in friends:
+            queue.push(budget.DEEP_PAGE if offset else budget.NEW_MATCHES, ("page", friend_id, offset))
 
-    # Retry unparsed matches first
-    unparsed = list(store.get("unparsed_matches", {}).keys())
-    print(f"[INFO] Retrying {len(unparsed)} unparsed matches...")
+    return queue
 
-    for match_id_str in unparsed:
-        match_id = int(match_id_str)
-        unparsed_data = store["unparsed_matches"][match_id_str]
-        expected_friend = unparsed_data.get("expected_friend")
+def run_check(shard=None):
+    """Main check routine. With shard=(i, N), checks one partition of friends into a partial store."""
+    if season_over():
+        print("End date reached, skipping run.")
+        return
+    load_steam_names()
+    print(f"\n{'='*80}")
+    print(f"Starting check at {datetime.now(timezone.utc).isoformat()}")
+    if shard:
+        print(f"Shard {shard[0]}/{shard[1]}")
+    print(f"{'='*80}\n")
 
-        if process_match(match_id, store, processed_this_run, expected_friend):
-            print(f"[SUCCESS] Match {match_id} now parsed!")
-            processed_this_run.add(match_id)
+    out_path = STORE_FILE
+    if shard:
+        sharding.activate(*shard)
+        out_path = sharding.store_path(*shard)
 
-    # Check each friend for new matches
-    print(f"\n[INFO] Checking for new matches...")
+    if not acquire_store_lease(out_path):
+        print("[WARN] Another run holds the store, skipping this one.")
+        return
+    try:
+        budget.start()
+        if not sharding.active:
+            heroes.refresh()  # Shards use the committed heroes.json; one conditional GET per run
+        _run_check(out_path)
+    finally:
+        release_store_lease(out_path)
 
-    for friend_id, friend_name in steam_names.items():
-        print(f"\n[INFO] Checking {friend_name}...")
-        offset = 0
+def run_groups(path):
+    """Check every friend group in a GROUPS_FILE in one process, sharing fetches (see groups.py)."""
+    group_list = groups.load(path)
+    share_responses()
+    budget.start()  # One deadline for all groups: together they must fit the cron slot
+    refreshed = False
+    for group in group_list:
+        print(f"\n{'#'*80}\nGroup {group.name}\n{'#'*80}")
+        if season_over(end=group.end):
+            print(f"[INFO] Season of {group.name} ended {group.end:%Y-%m-%d}, skipping")
+            continue
+        if budget.expired():
+            print(f"[WARN] Run budget exhausted before {group.name}")
+            continue
+        groups.activate(group)
+        if not acquire_store_lease(group.store):
+            print(f"[WARN] Another run holds {group.store}, skipping {group.name}.")
+            continue
+        try:
+            if not refreshed:
+                heroes.refresh()  # Its validators are saved with this group's http cache
+                refreshed = True
+            _run_check(group.store, group)
+        finally:
+            release_store_lease(group.store)
+        metrics.reset()  # Each group's run report covers that group only
+    print(f"[INFO] Shared fetches: {shared_report()}")
 
-        while True:
-            match_ids = fetch_recent_match_ids(friend_id, limit=BATCH_SIZE, offset=offset)
-            if not match_ids:
-                break
+def _run_check(out_path, group=groups.DEFAULT):
+    started = datetime.now(timezone.utc)
+    with metrics.phase("load"):
+        store = load_store(group.store)  # Shards start from the canonical store and write a partial copy
+    duos.begin_run(store)
+    profiling.memory_checkpoint("after load_store")
+    if store["leaderboard"] and "hourly" not in store:
+        windows.rebuild(store)  # Stores from before rolling windows: backfill the buckets once
+    if store["leaderboard"] and "streaks" not in store:
+        streaks.rebuild(store)  # Likewise for streaks, from the scored matches we have
+    issues = store_schema.check(store)
+    metrics.gauge("store_integrity_issues", len(issues))
+    if issues:
+        for issue in issues[:5]:
+            print(f"[WARN] Store integrity: {issue}")
+        print(f"[WARN] {len(issues)} integrity issue(s), recomputing derived data from match records")
+        store_schema.repair(store)
+    if not sharding.active:
+        with metrics.phase("roster"):
+            roster.settle(store, group.start)  # Friends added to / removed from steam_names since the last run
 
-            for match_id in match_ids:
-                # Skip if already processed this run
-                if match_id in processed_this_run:
-                    continue
+    with metrics.phase("queue"):
+        queue = build_work_queue(store)
+    print(f"[INFO] {len(queue)} work items queued, budget {budget.remaining():.0f}s")
 
-                # Pass friend_id so we can verify they're visible in the match
-                if process_match(match_id, store, processed_this_run, friend_id):
-                    processed_this_run.add(match_id)
+    with metrics.phase("pipeline"):
+        run = RunPipeline(store, queue, since=group.start).run()
+    processed_this_run = run.processed
+    profiling.memory_checkpoint("after pipeline")
+    windows.expire(store)
+    if not sharding.active and windows.digest_due(store):  # Shards leave the digest to merge-shards
+        message = windows.digest(store)
+        if message:
+            send_discord(message)
 
-            offset += BATCH_SIZE
+    # Budget exhausted: checkpoint unvisited pages, report what was deferred
+    deferred = {}
+    pages = []
+    for tier, task in run.pending():
+        deferred[tier] = deferred.get(tier, 0) + 1
+        if task[0] == "page":
+            pages.append([task[1], task[2]])
+    if pages:
+        store["checkpoint"] = {
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+            "pages": pages,
+        }
+        print(f"[WARN] Run budget exhausted, checkpointed {len(pages)} listing pages for next run")
 
     # Save and print summary
-    save_store(store)
+    with metrics.phase("save"):
+        save_store(store, out_path)
+        if sharding.active:
+            save_http_cache(sharding.http_cache_path(*sharding.active))
+            print(f"[INFO] Partial store written to {out_path}")
+        else:
+            save_http_cache(group.http_cache)
+            write_leaderboard_txt(store, group.leaderboard)
+            print(f"[INFO] Leaderboard written to {group.leaderboard}")
+    profiling.memory_checkpoint("after save_store")
 
-    write_leaderboard_txt(store)
-    print("[INFO] Leaderboard written to leaderboard.txt")
+    if metrics.enabled:
+        run.record_metrics()
+        report_dir = os.path.join(RUN_REPORT_DIR, group.name) if group is not groups.DEFAULT else None
+        report_path = metrics.write_report({
+            "started": started.isoformat(),
+            "group": group.name,
+            "shard": list(sharding.active) if sharding.active else None,
+            "processed": len(processed_this_run),
+            "checked_total": len(store.get("checked_matches", {})),
+            "unparsed_total": len(store.get("unparsed_matches", {})),
+            "lost_total": len(store.get("lost_matches", {})),
+            "listing_cache": dict(cache_stats),
+            "deferred_by_tier": {budget.TIER_NAMES[tier]: count for tier, count in sorted(deferred.items())},
+            "budget_exhausted": budget.expired(),
+        }, report_dir)
+        print(f"[INFO] Run report written to {report_path}")
 
     print(f"\n{'='*80}")
     print(f"Check complete!")
@@ -91,26 +219,94 @@ def run_check():
     print(f"  Matches processed this run: {len(processed_this_run)}")
     print(f"  Total checked all-time: {len(store.get('checked_matches', {}))}")
     print(f"  Waiting for parse: {len(store.get('unparsed_matches', {}))}")
+    if store.get("lost_matches"):
+        print(f"  Not on OpenDota (404): {len(store['lost_matches'])}")
+    print(f"  Match list cache: {cache_report()}")
+    print("  Pipeline:")
+    print(run.report())
+    if deferred:
+        print("  Deferred (budget): " + ", ".join(
+            f"{count} {budget.TIER_NAMES[tier]}" for tier, count in sorted(deferred.items())))
 
     # Top 3
     if store.get("leaderboard"):
-        sorted_players = sorted(
-            store["leaderboard"].items(),
-            key=lambda x: x[1].get("total_points", 0),
-            reverse=True
-        )[:3]
         print("\n  Top 3:")
-        for i, (sid, data) in enumerate(sorted_players, 1):
+        for i, (sid, points) in enumerate(standings.for_store(store).ranked(3), 1):
             # attempt to use steam_names if possible
             try:
                 sid_int = int(sid)
             except:
                 sid_int = None
-            name = steam_names.get(sid_int, data.get("name", sid))
-            print(f"    {i}. {name}: {data.get('total_points', 0):+} pts")
+            name = steam_names.get(sid_int, store["leaderboard"][sid].get("name", sid))
+            print(f"    {i}. {name}: {points:+} pts")
 
     print(f"{'='*80}\n")
 
+# ---------------- SHARD MERGE ---------------- #
+
+def merge_shards(count):
+    """Fold the partial stores of an N-way sharded run into store.json and the leaderboard."""
+    if season_over():
+        print("End date reached, skipping merge.")
+        return
+    load_steam_names()
+    if not acquire_store_lease():
+        print("[WARN] Another run holds the store, not merging.")
+        return
+    try:
+        _merge_shards(count)
+    finally:
+        release_store_lease()
+
+def _merge_shards(count):
+    base = load_store()
+    # Shards consumed the old checkpoint and wrote their own leftovers; their journals make up this run's
+    merged = {k: v for k, v in base.items() if k not in ("checkpoint", "duo_log")}
+    outbox = {}
+    for index in range(count):
+        path = sharding.store_path(index, count)
+        if not os.path.exists(path):
+            print(f"[WARN] {path} missing, shard {index}/{count} contributes nothing")
+            continue
+        partial = load_store(path)  # Picks up the shard's .seen index alongside
+        for match_id, message in partial.pop("discord_outbox", {}).items():
+            outbox.setdefault(match_id, message)  # Committed by several shards: posted once
+        merged = merge_stores(merged, partial, base)
+
+    for match_id in sorted(outbox, key=int):
+        send_discord(outbox[match_id])
+    if windows.digest_due(merged):
+        message = windows.digest(merged)
+        if message:
+            send_discord(message)
+    save_store(merged)
+    write_leaderboard_txt(merged)
+
+    # Validators: take whatever each shard changed relative to the canonical cache
+    try:
+        with open(HTTP_CACHE_FILE, "r") as f:
+            canonical = codec.load(f)
+    except (FileNotFoundError, ValueError):
+        canonical = {}
+    cache = dict(canonical)
+    for index in range(count):
+        try:
+            with open(sharding.http_cache_path(index, count), "r") as f:
+                partial = codec.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        for url in set(canonical) | set(partial):
+            if partial.get(url) != canonical.get(url):
+                if url in partial:
+                    cache[url] = partial[url]
+                else:
+                    cache.pop(url, None)
+    with open(HTTP_CACHE_FILE, "w") as f:
+        codec.dump(cache, f, indent=2, sort_keys=True)
+
+    print(f"[INFO] Merged {count} shards: {len(merged['checked_matches'])} checked matches, "
+          f"{len(merged['leaderboard'])} players")
+
 # ---------------- SINGLE MATCH TEST FUNCTION ---------------- #
 
 def test_single_match(match_id):
@@ -125,29 +321,170 @@ def test_single_match(match_id):
         print(f"[ERROR] Invalid match ID provided: '{match_id}'. Must be a number.")
         return
 
-    store = load_store()
-    processed_this_run = set()
+    load_steam_names()
+    if not acquire_store_lease():
+        print("[WARN] Another run holds the store, not processing the match.")
+        return
+    try:
+        store = load_store()
+        profiling.memory_checkpoint("after load_store")
+        processed_this_run = set()
+
+        # The single test run does not need an expected_friend_id since we trust the user input
+        # However, if the match wasn't fully parsed, it would still be added to unparsed_matches.
+        process_match(match_id_int, store, processed_this_run)
+        profiling.memory_checkpoint("after process_match")
 
-    # The single test run does not need an expected_friend_id since we trust the user input
-    # However, if the match wasn't fully parsed, it would still be added to unparsed_matches.
-    process_match(match_id_int, store, processed_this_run)
+        save_store(store)
+        profiling.memory_checkpoint("after save_store")
+    finally:
+        release_store_lease()
 
-    save_store(store)
-    
     if match_id_int in processed_this_run:
         print(f"\n[SUCCESS] Test match {match_id} successfully processed and challenges checked.")
     else:
         print(f"\n[INFO] Test match {match_id} completed. Check logs for results/warnings.")
 
-# ---------------- MAIN ---------------- #
-if __name__ == "__main__":
+# ---------------- REBUILD ---------------- #
+
+def rebuild():
+    """Recompute totals, time buckets and the leaderboard file from the per-match records."""
+    load_steam_names()
+    if not acquire_store_lease():
+        print("[WARN] Another run holds the store, not rebuilding.")
+        return
+    try:
+        store = load_store()
+        issues = store_schema.check(store)
+        store_schema.repair(store)
+        windows.rebuild(store)
+        save_store(store)
+        write_leaderboard_txt(store)
+        print(f"[SUCCESS] Rebuilt {STORE_FILE} ({len(issues)} issue(s) fixed) and leaderboard")
+    finally:
+        release_store_lease()
+
+# ---------------- ROSTER ---------------- #
+
+def settle_roster():
+    """Catch up friends added to steam_names.json and drop removed ones, without a full run (see roster.py)."""
+    load_steam_names()
+    if not acquire_store_lease():
+        print("[WARN] Another run holds the store, not settling the roster.")
+        return
     try:
-        if len(sys.argv) > 1:
-            # If an argument is provided, treat it as the match ID for testing
-            test_single_match(sys.argv[1])
+        budget.start()
+        store = load_store()
+        duos.begin_run(store)
+        added, removed = roster.settle(store)
+        save_store(store)
+        save_http_cache()
+        write_leaderboard_txt(store)
+        print(f"[SUCCESS] Roster settled: {len(added)} added, {len(removed)} removed")
+    finally:
+        release_store_lease()
+
+# ---------------- BACKFILL ---------------- #
+
+def backfill(start, end, workers):
+    """Load a date range (ISO dates) of history at full speed, without Discord messages (see backfill.py)."""
+    import backfill as history
+    load_steam_names()
+    store = history.run(history.parse_date(start), history.parse_date(end), workers)
+    if store is not None:
+        write_leaderboard_txt(store)
+        print(f"[INFO] Leaderboard written, {len(store.get('checked_matches', {}))} checked matches in total")
+
+# ---------------- CLI ---------------- #
+# python main.py [run] [--shard i/N]      check for new matches (the cron job)
+# python main.py run --groups groups.json  the same for several friend groups (groups.py)
+# python main.py match 8123456789         process one match, for testing
+# python main.py privacy                  report friends with hidden matches
+# python main.py rebuild                  recompute derived data from match records
+# python main.py roster                   settle steam_names.json changes now (run does it too)
+# python main.py merge-shards N           fold a sharded run's partial stores
+# python main.py backfill --from 2026-01-16 --to 2026-03-01   load history, resumable
+# python main.py stats ... / bench ...    see stats.py / bench.py
+#
+# --profile / --trace-memory wrap any command (see profiling.py). Commands
+# that don't need them never import stats, bench or requests.
+
+PROFILE_FLAGS = ("--profile", "--trace-memory")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Dota challenge checker.")
+    parser.add_argument("--profile", action="store_true", help="write a CPU profile to PROFILE_DIR")
+    parser.add_argument("--trace-memory", action="store_true", help="write a tracemalloc report to PROFILE_DIR")
+    sub = parser.add_subparsers(dest="command", metavar="command")
+
+    run = sub.add_parser("run", help="check friends' matches for challenges (default)")
+    scope = run.add_mutually_exclusive_group()
+    scope.add_argument("--shard", metavar="I/N", type=sharding.parse_spec, help="check one partition into a partial store")
+    scope.add_argument("--groups", metavar="FILE", help="check every friend group in FILE (default: GROUPS_FILE)")
+    match = sub.add_parser("match", help="process a single match id, for testing")
+    match.add_argument("match_id")
+    sub.add_parser("privacy", help="flag friends whose matches are hidden")
+    sub.add_parser("rebuild", help="recompute totals, time buckets and the leaderboard file")
+    sub.add_parser("roster", help="catch up added friends and drop removed ones from the store")
+    merge = sub.add_parser("merge-shards", help="merge the partial stores of a sharded run")
+    merge.add_argument("count", type=int)
+    history = sub.add_parser("backfill", help="load a date range of matches quickly and quietly, resumable")
+    history.add_argument("--from", dest="start", metavar="DATE", default=CHECK_FROM_DATE.date().isoformat(),
+                         help="first day (default: CHECK_FROM_DATE)")
+    history.add_argument("--to", dest="end", metavar="DATE", default=END_DATE.date().isoformat(),
+                         help="day after the last one (default: season end)")
+    history.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="parallel requests")
+    sub.add_parser("stats", help="query the leaderboard (see stats.py)", add_help=False)
+    sub.add_parser("bench", help="run benchmarks (see bench.py)", add_help=False)
+    return parser
+
+def parse_args(argv):
+    # Profiling flags may appear anywhere, e.g. `main.py match 8123456789 --profile`
+    flags = [a for a in argv if a in PROFILE_FLAGS]
+    argv = [a for a in argv if a not in PROFILE_FLAGS]
+    # Forms from before subcommands: `main.py 8123456789`, `main.py --shard 0/4`
+    if argv and argv[0].isdigit():
+        argv = ["match"] + argv
+    elif argv and argv[0] == "--shard":
+        argv = ["run"] + argv
+    if argv and argv[0] in ("stats", "bench"):
+        # The rest goes to their own parsers untouched, `stats --help` included
+        args = build_parser().parse_args(flags + argv[:1])
+        args.args = argv[1:]
+        return args
+    return build_parser().parse_args(flags + argv)
+
+def dispatch(args):
+    if args.command in (None, "run"):
+        groups_file = getattr(args, "groups", None) or (GROUPS_FILE if not getattr(args, "shard", None) else None)
+        if groups_file:
+            run_groups(groups_file)
         else:
-            # Otherwise, run the normal check routine
-            run_check()
+            run_check(getattr(args, "shard", None))
+    elif args.command == "match":
+        test_single_match(args.match_id)
+    elif args.command == "privacy":
+        import privacy_check
+        privacy_check.main()
+    elif args.command == "rebuild":
+        rebuild()
+    elif args.command == "roster":
+        settle_roster()
+    elif args.command == "merge-shards":
+        merge_shards(args.count)
+    elif args.command == "backfill":
+        backfill(args.start, args.end, args.workers)
+    elif args.command == "stats":
+        import stats
+        stats.main(args.args)
+    elif args.command == "bench":
+        import bench
+        bench.main(args.args)
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    try:
+        profiling.run(lambda: dispatch(args), PROFILE_DIR, profile=args.profile, trace_memory=args.trace_memory)
     except KeyboardInterrupt:
         print("\n[INFO] Interrupted by user")
     except Exception as e:
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import codec
+from config import RUN_REPORT_DIR
+
+# ---------------- RUN METRICS ---------------- #
+# Counters, timers and latency histograms for one run, written at the end as
+# run_report.json plus a Prometheus textfile (run_report.prom) in
+# RUN_REPORT_DIR. With RUN_REPORT_DIR unset every call returns immediately,
+# so instrumenting a hot path costs one attribute check.
+#
+# Names follow Prometheus conventions (snake_case, _total / _seconds / _bytes
+# suffixes); labels are keyword arguments.
+
+enabled = bool(RUN_REPORT_DIR)
+
+# Upper bounds in seconds, shared by every histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> number
+_gauges = {}      # (name, labels) -> number
+_histograms = {}  # (name, labels) -> {"buckets": [...], "sum": s, "count": n}
+_phases = {}      # phase -> wall seconds, in the order phases ran
+_NULL = nullcontext()
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def enable(flag=True):
+    global enabled
+    enabled = flag
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+        _phases.clear()
+
+def incr(name, value=1, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def gauge(name, value, **labels):
+    if not enabled:
+        return
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name, seconds, **labels):
+    """Add one sample to a latency histogram."""
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                h["buckets"][i] += 1
+                break
+        h["sum"] += seconds
+        h["count"] += 1
+
+@contextmanager
+def _timed(name, labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+def timer(name, **labels):
+    """`with metrics.timer("store_save_seconds"):` records one histogram sample."""
+    return _timed(name, labels) if enabled else _NULL
+
+@contextmanager
+def _phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases[name] = _phases.get(name, 0.0) + time.perf_counter() - t0
+
+def phase(name):
+    """Wall time of a run phase (load, queue, pipeline, save, ...)."""
+    return _phase(name) if enabled else _NULL
+
+# ---------------- REPORT ---------------- #
+
+def snapshot():
+    """Everything recorded so far, JSON-ready."""
+    with _lock:
+        return {
+            "phases": dict(_phases),
+            "counters": [{"name": n, "labels": dict(l), "value": v}
+                         for (n, l), v in sorted(_counters.items())],
+            "gauges": [{"name": n, "labels": dict(l), "value": v}
+                       for (n, l), v in sorted(_gauges.items())],
+            "histograms": [{"name": n, "labels": dict(l), "buckets": list(LATENCY_BUCKETS),
+                            "counts": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                           for (n, l), h in sorted(_histograms.items())],
+        }
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _prom_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+def prometheus_text(prefix="dota_challenges_"):
+    """Prometheus text exposition format, for node_exporter's textfile collector."""
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        for phase_name, seconds in _phases.items():
+            header(f"{prefix}phase_seconds", "gauge")
+            lines.append(f"{prefix}phase_seconds{_prom_labels((('phase', phase_name),))} {seconds:.6f}")
+        for (name, labels), value in sorted(_counters.items()):
+            header(prefix + name, "counter")
+            lines.append(f"{prefix}{name}{_prom_labels(labels)} {value}")
+        for (name, labels), value in sorted(_gauges.items()):
+            header(prefix + name, "gauge")
+            lines.append(f"{prefix}{name}{_prom_labels(labels)} {value}")
+        for (name, labels), h in sorted(_histograms.items()):
+            header(prefix + name, "histogram")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, h["buckets"]):
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{_prom_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{prefix}{name}_bucket{_prom_labels(labels, (('le', '+Inf'),))} {h['count']}")
+            lines.append(f"{prefix}{name}_sum{_prom_labels(labels)} {h['sum']:.6f}")
+            lines.append(f"{prefix}{name}_count{_prom_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_report(summary=None, directory=None):
+    """Write run_report.json and run_report.prom. `summary` is merged into the JSON as-is."""
+    if not enabled:
+        return None
+    directory = directory or RUN_REPORT_DIR
+    os.makedirs(directory, exist_ok=True)
+    report = {"summary": summary or {}, **snapshot()}
+    json_path = os.path.join(directory, "run_report.json")
+    with open(json_path, "w") as f:
+        codec.dump(report, f, indent=2)
+    # Write-then-rename so the textfile collector never reads half a file
+    prom_path = os.path.join(directory, "run_report.prom")
+    with open(prom_path + ".tmp", "w") as f:
+        f.write(prometheus_text())
+    os.replace(prom_path + ".tmp", prom_path)
+    return json_path
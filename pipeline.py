@@ -0,0 +1,405 @@
+from datetime import datetime, timezone
+import heapq
+import itertools
+import queue
+import threading
+import time
+import budget
+import metrics
+import sharding
+from api import fetch_match_listing, fetch_full_match, match_list_url, discard_validators, missing_matches
+from challenges import score_rules
+from config import BATCH_SIZE, PIPELINE_WORKERS, PIPELINE_QUEUE_SIZE, CHECK_FROM_DATE
+from data import steam_names
+from discord import send_discord
+from processor import is_already_checked, defer_match, commit_match, triage, scored_rules
+
+# ---------------- RUN PIPELINE ---------------- #
+# discover -> fetch -> validate -> score -> commit -> notify
+#
+# Stages run in their own threads and hand work over bounded queues, so a
+# stage that falls behind blocks its producers instead of buffering the run.
+# Listing requests, match downloads, validation and scoring all overlap;
+# api.py paces requests globally so extra fetch workers don't raise the
+# request rate.
+#
+# Only the store is order-sensitive. Scoring (score_rules) is pure, but
+# commit applies results in match start_time order, so the running totals
+# in each Discord message are correct. Listings are read newest first, so
+# any pending page can still turn up an older match: commit holds what
+# arrives until discovery is done, then releases each match once no older
+# one is still being fetched, validated or scored (the watermark). The
+# fetch queue hands out the oldest match first to keep that hold short.
+# commit and notify are single-threaded; everything before them only reads
+# the store.
+
+_DONE = object()
+_TICK = object()  # Discovery finished: commit re-checks its watermark
+
+class StageQueue:
+    """Bounded queue that samples its depth on every put. With `key`, get() returns the lowest key first."""
+
+    def __init__(self, maxsize, key=None):
+        self._q = queue.PriorityQueue(maxsize=maxsize) if key else queue.Queue(maxsize=maxsize)
+        self._key = key
+        self._seq = itertools.count()  # Ties (and end-of-input, which sorts last) keep put order
+        self.max_depth = 0
+        self._depth_total = 0
+        self._puts = 0
+
+    def put(self, item):
+        if self._key:
+            self._q.put((float("inf") if item is _DONE else self._key(item), next(self._seq), item))
+        else:
+            self._q.put(item)
+        depth = self._q.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_total += depth
+        self._puts += 1
+
+    def get(self):
+        item = self._q.get()
+        return item[2] if self._key else item
+
+    @property
+    def mean_depth(self):
+        return self._depth_total / self._puts if self._puts else 0.0
+
+class Stage:
+    """
+    `workers` threads calling fn(item, emit) for each inbox item. If fn
+    raises, on_error(item, emit) runs, if given. When the last worker sees
+    end-of-input it runs drain(emit), if given, then passes end-of-input
+    downstream.
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox=None, drain=None, on_error=None):
+        self.name = name
+        self.fn = fn
+        self.drain = drain
+        self.on_error = on_error
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.downstream = None
+        self.items = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self._live = workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started = time.monotonic()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+    def _emit(self, item):
+        self.outbox.put(item)
+
+    def _next(self):
+        return self.inbox.get()
+
+    def _work(self):
+        try:
+            while True:
+                item = self._next()
+                if item is _DONE:
+                    break
+                t0 = time.monotonic()
+                try:
+                    self.fn(item, self._emit)
+                except Exception as e:
+                    label = item.get("match_id") if isinstance(item, dict) else item
+                    print(f"[ERROR] {self.name} stage failed on {label}: {e}")
+                    if self.on_error:
+                        self.on_error(item, self._emit)
+                with self._lock:
+                    self.busy += time.monotonic() - t0
+                    self.items += 1
+        finally:
+            with self._lock:
+                self._live -= 1
+                last = self._live == 0
+            if last:
+                if self.drain:
+                    t0 = time.monotonic()
+                    try:
+                        self.drain(self._emit)
+                    except Exception as e:
+                        print(f"[ERROR] {self.name} stage failed while draining: {e}")
+                    self.busy += time.monotonic() - t0
+                self.finished = time.monotonic()
+                if self.downstream:
+                    for _ in range(self.downstream.workers):
+                        self.outbox.put(_DONE)
+
+class DiscoverStage(Stage):
+    """Pulls from the prioritised budget.WorkQueue instead of an inbox; may feed it new pages."""
+
+    def __init__(self, fn, workers, work_queue, outbox, drain=None):
+        super().__init__("discover", self._tracked(fn), workers, None, outbox, drain)
+        self.work_queue = work_queue
+        self._cond = threading.Condition()
+        self._in_flight = 0
+
+    def _tracked(self, fn):
+        """Count a task as in flight until fn returns, even if it raised."""
+        def tracked(item, emit):
+            try:
+                fn(item, emit)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+        return tracked
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if budget.expired():
+                    return _DONE
+                if self.work_queue:
+                    self._in_flight += 1
+                    return self.work_queue.pop()
+                if self._in_flight == 0:
+                    self._cond.notify_all()
+                    return _DONE
+                self._cond.wait(timeout=0.5)
+
+    def push(self, tier, task):
+        with self._cond:
+            self.work_queue.push(tier, task)
+            self._cond.notify()
+
+class RunPipeline:
+    def __init__(self, store, work_queue, workers=None, queue_size=PIPELINE_QUEUE_SIZE, since=CHECK_FROM_DATE):
+        self.store = store
+        self.since = since       # season start: older matches in listings are ignored
+        workers = {**PIPELINE_WORKERS, **(workers or {})}
+
+        self.processed = set()   # match ids committed this run
+        self.leftover = []       # (tier, task) pages to checkpoint: budget ran out mid-page
+        self._emitted = set()
+        self._lock = threading.Lock()
+        # Commit's reorder buffer: matches between discovery and commit, and those held at commit
+        self._in_flight = {}     # match id -> start_time (0 until fetched if the listing didn't say)
+        self._watermark = []     # heap of (start_time, match id) over _in_flight, stale entries skipped
+        self._discovered = False
+        self._held = []          # heap of (start_time, match id, item) waiting for the watermark
+
+        q = {name: StageQueue(queue_size) for name in ("validate", "score", "commit", "notify")}
+        q["fetch"] = StageQueue(queue_size, key=lambda item: item["start_time"])
+        self.queues = q
+        self.stages = [
+            DiscoverStage(self._discover, workers["discover"], work_queue, q["fetch"], drain=self._discovery_done),
+            Stage("fetch", self._fetch, workers["fetch"], q["fetch"], q["validate"], on_error=self._failed),
+            Stage("validate", self._validate, workers["validate"], q["validate"], q["score"], on_error=self._failed),
+            Stage("score", self._score, workers["score"], q["score"], q["commit"], on_error=self._failed),
+            Stage("commit", self._commit, 1, q["commit"], q["notify"], drain=self._flush_commits),
+            Stage("notify", self._notify, 1, q["notify"]),
+        ]
+        for stage, nxt in zip(self.stages, self.stages[1:]):
+            stage.downstream = nxt
+
+    def run(self):
+        for stage in self.stages:
+            stage.start()
+        for stage in self.stages:
+            stage.join()
+        return self
+
+    # ---- stages ----
+
+    def _candidate(self, match_id, expected_friend, page, start_time=0):
+        with self._lock:
+            if (match_id in self._emitted or is_already_checked(match_id, self.store, ())
+                    or str(match_id) in self.store.get("lost_matches", {})):
+                return None
+            self._emitted.add(match_id)
+            self._track(match_id, start_time)
+        return {"match_id": match_id, "expected_friend": expected_friend, "page": page, "start_time": start_time}
+
+    def _discover(self, work, emit):
+        tier, task = work
+        if task[0] == "retry":
+            match_id = task[1]
+            unparsed_data = self.store["unparsed_matches"].get(str(match_id))
+            if unparsed_data is not None:
+                candidate = self._candidate(match_id, unparsed_data.get("expected_friend"), None)
+                if candidate:
+                    emit(candidate)
+            return
+
+        _, friend_id, offset = task
+        print(f"[INFO] Checking {steam_names[friend_id]} (offset {offset})...")
+        since = self.since.timestamp()
+        listing = fetch_match_listing(friend_id, limit=BATCH_SIZE, offset=offset) or []
+        matches = [(m["match_id"], m.get("start_time", 0)) for m in listing if m.get("start_time", 0) >= since]
+        if not matches:
+            if budget.expired():
+                self._requeue(work)  # Ran out mid-request, not end of history
+            return
+
+        if offset == 0:
+            activity = self.store.setdefault("friend_activity", {})
+            activity[str(friend_id)] = max(max(m for m, _ in matches), activity.get(str(friend_id), 0))
+
+        # Deeper pages are low priority: queue now, they run once better work is done
+        self.stages[0].push(budget.DEEP_PAGE, ("page", friend_id, offset + BATCH_SIZE))
+        for match_id, start_time in matches:
+            candidate = self._candidate(match_id, friend_id, work, start_time)
+            if candidate:
+                emit(candidate)
+
+    def _fetch(self, item, emit):
+        match_data = None if budget.expired() else fetch_full_match(item["match_id"])
+        if not match_data:
+            item["lost"] = True  # Commit still has to see it, to move the watermark past it
+        else:
+            item["match_data"] = match_data
+            if not item["start_time"]:
+                with self._lock:  # A retry: the listing didn't tell us when it was played
+                    item["start_time"] = match_data.get("start_time", 0)
+                    self._track(item["match_id"], item["start_time"])
+        emit(item)
+
+    def _validate(self, item, emit):
+        if "lost" in item:
+            emit(item)
+            return
+        state, reason = triage(item["match_data"], item["expected_friend"])
+        if state == "defer":
+            item["deferred"] = reason
+        elif state == "partial":
+            item["partial"] = reason
+        emit(item)
+
+    def _score(self, item, emit):
+        if "deferred" not in item and "lost" not in item:
+            item["triggers"], item["match_time"], item["scored"] = score_rules(
+                item["match_data"], scored_rules(item["match_id"], self.store))
+        emit(item)
+
+    def _failed(self, item, emit):
+        item["lost"] = True  # Commit drops its listing's validators and moves the watermark past it
+        emit(item)
+
+    def _commit(self, item, emit):
+        if item is not _TICK:
+            with self._lock:
+                self._in_flight.pop(item["match_id"], None)
+            heapq.heappush(self._held, (item["start_time"], item["match_id"], item))
+        self._release(emit, self._oldest_in_flight())
+
+    def _flush_commits(self, emit):
+        self._release(emit, None)  # Upstream drained: nothing older can arrive
+
+    def _release(self, emit, watermark):
+        """Apply held matches older than `watermark` ((start_time, match id), None for all), oldest first."""
+        while self._held and (watermark is None or self._held[0][:2] < watermark):
+            item = heapq.heappop(self._held)[2]
+            try:
+                self._apply(item, emit)
+            except Exception as e:
+                print(f"[ERROR] commit stage failed on {item['match_id']}: {e}")
+                self._lost(item)  # Its listing is read in full again next run
+
+    def _apply(self, item, emit):
+        if "lost" in item:
+            self._lost(item)
+            return
+        if "deferred" in item:
+            defer_match(item["match_id"], self.store, item["expected_friend"], item["deferred"])
+            return
+        provisional = (item["expected_friend"], item["partial"], item["scored"]) if "partial" in item else None
+        message = commit_match(item["match_id"], item["match_data"], item["triggers"],
+                               item["match_time"], self.store, provisional)
+        if provisional is None:
+            self.processed.add(item["match_id"])
+        if message and sharding.active:
+            sharding.hold_message(self.store, item["match_id"], message)  # merge-shards posts it
+        elif message:
+            emit(message)
+
+    def _notify(self, message, emit):
+        send_discord(message)
+
+    # ---- bookkeeping ----
+
+    def _track(self, match_id, start_time):
+        """(Re)register a match between discovery and commit. Caller holds self._lock."""
+        self._in_flight[match_id] = start_time
+        heapq.heappush(self._watermark, (start_time, match_id))
+
+    def _oldest_in_flight(self):
+        """(start_time, match id) commit may release up to, or (0, 0) while discovery is still running."""
+        with self._lock:
+            if not self._discovered:
+                return 0, 0
+            while self._watermark and self._in_flight.get(self._watermark[0][1]) != self._watermark[0][0]:
+                heapq.heappop(self._watermark)  # Committed, or re-tracked with its real start_time
+            return self._watermark[0] if self._watermark else None
+
+    def _discovery_done(self, emit):
+        with self._lock:
+            self._discovered = True
+        self.queues["commit"].put(_TICK)
+
+    def _requeue(self, work):
+        with self._lock:
+            if work not in self.leftover:
+                self.leftover.append(work)
+
+    def _lost(self, item):
+        """
+        A match we could not fetch. One OpenDota says doesn't exist goes to
+        store["lost_matches"] and its listing stays cached; after a timeout,
+        error or the budget running out the listing is read again next run.
+        """
+        if item["page"] is None:
+            return  # Retries stay in unparsed_matches
+        if item["match_id"] in missing_matches:
+            self.store.setdefault("lost_matches", {})[str(item["match_id"])] = {
+                "first_seen": datetime.now(timezone.utc).isoformat(),
+                "expected_friend": item["expected_friend"],
+            }
+            return
+        _, (_, friend_id, offset) = item["page"]
+        discard_validators(match_list_url(friend_id, BATCH_SIZE, offset))
+        if budget.expired():
+            self._requeue(item["page"])
+
+    def pending(self):
+        """Work not done this run, as (tier, task), for checkpointing and the summary."""
+        discover = self.stages[0]
+        return sorted(set(self.leftover) | set(discover.work_queue.pending()))
+
+    def record_metrics(self):
+        """Per-stage counters and queue depths into the run report."""
+        for stage in self.stages:
+            wall = (stage.finished or time.monotonic()) - (stage.started or time.monotonic())
+            metrics.gauge("stage_workers", stage.workers, stage=stage.name)
+            metrics.gauge("stage_items", stage.items, stage=stage.name)
+            metrics.gauge("stage_busy_seconds", stage.busy, stage=stage.name)
+            metrics.gauge("stage_wall_seconds", wall, stage=stage.name)
+            if stage.inbox:
+                metrics.gauge("stage_queue_max_depth", stage.inbox.max_depth, stage=stage.name)
+                metrics.gauge("stage_queue_mean_depth", stage.inbox.mean_depth, stage=stage.name)
+
+    def report(self):
+        lines = [f"  {'stage':<9} {'workers':>7} {'items':>6} {'busy s':>8} {'items/s':>8} {'queue max/avg':>14}"]
+        for stage in self.stages:
+            wall = (stage.finished or time.monotonic()) - (stage.started or time.monotonic())
+            rate = stage.items / wall if wall > 0 else 0.0
+            inbox = stage.inbox
+            depth = f"{inbox.max_depth}/{inbox.mean_depth:.1f}" if inbox else "-"
+            lines.append(f"  {stage.name:<9} {stage.workers:>7} {stage.items:>6} {stage.busy:>8.2f} {rate:>8.1f} {depth:>14}")
+        return "\n".join(lines)
@@ -1,15 +1,26 @@
-from data import load_store, save_store
-from discord import send_discord
-from privacy_utils import check_friends_privacy, notify_privacy_issues  # we'll put the function there
+from data import load_steam_names, load_store, save_store, acquire_store_lease, release_store_lease
+from privacy_utils import check_friends_privacy, notify_privacy_issues
 
-# Load your current store
-store = load_store()
+def main():
+    """Flag friends whose latest match is hidden and report them on Discord."""
+    load_steam_names()
+    if not acquire_store_lease():
+        print("[WARN] Another run holds the store, not checking privacy.")
+        return
+    try:
+        # Load your current store
+        store = load_store()
 
-# Run the privacy check
-store = check_friends_privacy(store)
+        # Run the privacy check
+        store = check_friends_privacy(store)
 
-# Save updates
-save_store(store)
+        # Save updates
+        save_store(store)
+    finally:
+        release_store_lease()
 
-# Send Discord notification if there are privacy issues
-notify_privacy_issues(store)
+    # Send Discord notification if there are privacy issues
+    notify_privacy_issues(store)
+
+if __name__ == "__main__":
+    main()
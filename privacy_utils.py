@@ -7,7 +7,7 @@ def check_friends_privacy(store):
     store.setdefault("privacy_issues", {})
 
     for friend_id, friend_name in steam_names.items():
-        match_ids = fetch_recent_match_ids(friend_id, limit=1)
+        match_ids = fetch_recent_match_ids(friend_id, limit=1, use_cache=False)
         if not match_ids:
             store["privacy_issues"][str(friend_id)] = {
                 "name": friend_name,
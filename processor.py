@@ -1,22 +1,34 @@
 from datetime import datetime, timezone
 from api import fetch_full_match
-from validation import is_match_fully_parsed
-from challenges import check_challenges
-from data import steam_names, get_hero_name
+from validation import is_match_scorable, missing_fields
+from challenges import score_rules, check_streak_challenges, check_duo_challenges
+from config import STREAK_CHALLENGES, DUO_CHALLENGES, PROVISIONAL_SCORING
+from data import steam_names
+import duos
+import heroes
 from discord import send_discord
+import metrics
+import standings
+import streaks
+import windows
 
 # ---------------- MAIN PROCESSING ---------------- #
+# process_match runs every step for one match. The run pipeline (pipeline.py)
+# calls the same steps as separate stages: fetch -> validate -> score ->
+# commit -> notify.
+#
+# A match OpenDota has only partly parsed is committed provisionally: the
+# rules whose inputs are there are scored and posted, the match stays in
+# unparsed_matches with the rule ids it has scored, and the retry that
+# finds the rest scores only those and posts one follow-up message.
 def process_match(match_id, store, processed_this_run, expected_friend_id=None):
     """
     Handles fetching, validating, and saving match data.
-    All logic/point/streak calculations happen inside check_challenges.
+    Per-match point calculations happen inside score_rules; streaks
+    (and streak challenges) are updated in commit order by commit_match.
     """
-    match_id_str = str(match_id)
-
     # 1. Skip already handled matches
-    if match_id_str in store.get("checked_matches", {}):
-        return True
-    if match_id in processed_this_run:
+    if is_already_checked(match_id, store, processed_this_run):
         return True
 
     # 2. Fetch data from OpenDota
@@ -24,82 +36,122 @@ def process_match(match_id, store, processed_this_run, expected_friend_id=None):
     if not match_data:
         return False
 
-    # 3. Gatekeeper: Ensure match is fully parsed for advanced stats
-    is_parsed, reason = is_match_fully_parsed(match_data, expected_friend_id)
-    if not is_parsed:
+    # 3. Gatekeeper: what can be scored on what OpenDota has parsed so far
+    state, reason = triage(match_data, expected_friend_id)
+    if state == "defer":
+        defer_match(match_id, store, expected_friend_id, reason)
+        return False
+
+    # 4. The Brain: Run all per-match logic not scored by an earlier provisional commit
+    triggers, match_time, scored = score_rules(match_data, scored_rules(match_id, store))
+
+    # 5-6. Record the result in the store
+    provisional = (expected_friend_id, reason, scored) if state == "partial" else None
+    message = commit_match(match_id, match_data, triggers, match_time, store, provisional)
+
+    # 7. Final Notification (ONE MESSAGE PER MATCH, plus one follow-up if it was provisional)
+    if message:
+        send_discord(message)
+    return state == "final"
+
+def triage(match_data, expected_friend_id=None):
+    """
+    ("final", None) when every rule can be scored, ("partial", reason) when
+    some can (PROVISIONAL_SCORING), else ("defer", reason).
+    """
+    scorable, reason = is_match_scorable(match_data, expected_friend_id)
+    if not scorable:
+        return "defer", reason
+    missing = missing_fields(match_data)
+    if not missing:
+        return "final", None
+    reason = f"Waiting for parse: {', '.join(missing[:3])}{' ...' if len(missing) > 3 else ''} null"
+    return ("partial" if PROVISIONAL_SCORING else "defer"), reason
+
+def scored_rules(match_id, store):
+    """Rule ids a provisional commit already scored for a match, {steam id: [rule id]}."""
+    return store.get("unparsed_matches", {}).get(str(match_id), {}).get("scored")
+
+def is_already_checked(match_id, store, processed_this_run):
+    return match_id in store["checked_matches"] or match_id in processed_this_run
+
+def deferral_kind(reason):
+    """Collapse triage's message into a low-cardinality metric label."""
+    if "privacy" in reason:
+        return "privacy"
+    if "incomplete" in reason:
+        return "incomplete"
+    return "unparsed"
+
+def defer_match(match_id, store, expected_friend_id, reason, scored=None):
+    """
+    Park a match until OpenDota has parsed it; run_check retries it next time.
+    `scored` marks a provisional commit: the rule ids already applied.
+    """
+    previous = store.setdefault("unparsed_matches", {}).get(str(match_id), {})
+    scored = scored or previous.get("scored")
+    if scored:
+        print(f"[INFO] Match {match_id} provisional: {reason}")
+    else:
         print(f"[WARN] Match {match_id} deferred: {reason}")
-        store.setdefault("unparsed_matches", {})[str(match_id)] = {
+    metrics.incr("matches_deferred_total", reason="provisional" if scored else deferral_kind(reason))
+    store["unparsed_matches"][str(match_id)] = {
     "first_seen": datetime.now(timezone.utc).isoformat(),
     "expected_friend": expected_friend_id,
-       "retries": store["unparsed_matches"].get(str(match_id), {}).get("retries", 0) + 1
+       "retries": previous.get("retries", 0) + 1
     }
+    if scored:
+        store["unparsed_matches"][str(match_id)].update(provisional=True, scored=scored)
 
-        return False
-
-    # 4. The Brain: Run all logic (including streak updates)
-    # This is where streaks are compared against store["leaderboard"]
-    triggers, match_time = check_challenges(match_data, store)
-    match_log = store.setdefault("challenge_log", {}).setdefault(match_id_str, [])
-
+def points_by_player(triggers):
+    totals = {}
     for t in triggers:
-        match_log.append({
-            **t,
-            "timestamp": match_time.isoformat()
-    })
-    # 5. Clean up tracking lists
-    store.setdefault("checked_matches", {})[match_id_str] = True
-
-    if match_id_str in store.get("unparsed_matches", {}):
-        del store["unparsed_matches"][match_id_str]
+        totals[str(t["steam_id"])] = totals.get(str(t["steam_id"]), 0) + t["points"]
+    return totals
 
-    # 6. Save Match History to Leaderboard
-    # Even if there were no triggers, we record the match so streaks stay accurate
+def commit_match(match_id, match_data, triggers, match_time, store, provisional=None):
+    """
+    Applies a scored match to the store. Must run in match start_time order
+    so running totals are right. Returns the Discord message to post, or None.
+    provisional = (expected friend, reason, scored rule ids) while some rules
+    still wait on OpenDota: the triggers apply now, the match stays queued for
+    a retry, and streaks / duos wait for the final commit.
+    """
+    match_id_str = str(match_id)
     players = match_data.get("players", [])
     friends_in_match = [p for p in players if p.get("account_id") in steam_names.keys()]
-    
-    # Pre-build a list of all tracked friends in this specific match
-    all_friend_names = [steam_names[p['account_id']] for p in friends_in_match]
-
-    for p in friends_in_match:
-        sid_str = str(p.get("account_id"))
-        
-        # Ensure player has a folder in our leaderboard
-        player_entry = store.setdefault("leaderboard", {}).setdefault(sid_str, {
-            "name": steam_names.get(p["account_id"]),
-            "total_points": 0,
-            "matches": {}
-        })
+    follow_up = provisional is None and store.get("unparsed_matches", {}).get(match_id_str, {}).get("provisional")
 
-        # Map triggers to the correct player
-        player_triggers = [t for t in triggers if str(t["steam_id"]) == sid_str]
-
-        # Skip storing match entirely if nothing happened
-        if not player_triggers:
-            continue
+    if provisional is None:
+        # The whole match's points, including what a provisional commit already applied
+        match_points = points_by_player(store.get("challenge_log", {}).get(match_id_str, []) + triggers)
+        # Streaks advance for every friend in the match, scored or not
+        changes = streaks.record_match(store, match_id, match_time, friends_in_match, match_points)
+        if STREAK_CHALLENGES:
+            triggers = triggers + check_streak_challenges(match_data, changes)
+            match_points = points_by_player(store.get("challenge_log", {}).get(match_id_str, []) + triggers)
+        duos.record_match(store, match_data, friends_in_match, match_points)
+        if DUO_CHALLENGES:
+            triggers = triggers + check_duo_challenges(match_data, friends_in_match, duos.for_store(store))
 
-        # Now create the match record (only when needed)
-        match_record = player_entry["matches"].setdefault(match_id_str, {
-            "date": match_time.strftime("%Y-%m-%d %H:%M UTC"),
-            "hero": get_hero_name(p.get("hero_id")),
-            "kda": f"{p.get('kills', 0)}/{p.get('deaths', 0)}/{p.get('assists', 0)}",
-            "win": bool(p.get("win")),
-            "points": 0,
-            "friends_in_match": all_friend_names,
-            "damage": int(p.get("hero_damage", 0) or 0),
-            "challenges": []
+    if triggers:
+        match_log = store.setdefault("challenge_log", {}).setdefault(match_id_str, [])
+        for t in triggers:
+            match_log.append({
+                **t,
+                "timestamp": match_time.isoformat()
         })
+    # 5. Clean up tracking lists
+    if provisional is None:
+        store["checked_matches"].add(match_id)
+        if match_id_str in store.get("unparsed_matches", {}):
+            del store["unparsed_matches"][match_id_str]
+    else:
+        defer_match(match_id, store, *provisional)
 
-        # Apply triggers
-        for t in player_triggers:
-            match_record["challenges"].append({
-                "name": t["name"],
-                "points": t["points"]
-            })
-            match_record["points"] += t["points"]
-            player_entry["total_points"] += t["points"]
-
+    view, overtakes = apply_triggers(match_id, triggers, match_time, store, friends_in_match, final=provisional is None)
 
-    # 7. Final Notification (ONE MESSAGE PER MATCH)
+    # 7. Build the notification (ONE MESSAGE PER MATCH, a follow-up carries only the new triggers)
     if triggers:
         print(f"[SUCCESS] Processed Match {match_id}: {len(triggers)} triggers found.")
 
@@ -110,11 +162,13 @@ def process_match(match_id, store, processed_this_run, expected_friend_id=None):
 
         # Match header
         msg = [
-            "🎮 **Match Challenges Summary**",
+            "✅ **Match Challenges Summary (Final)**" if follow_up else "🎮 **Match Challenges Summary**",
             f"📊 https://www.opendota.com/matches/{match_id}",
             f"🕐 {match_time.strftime('%Y-%m-%d %H:%M UTC')}",
-            ""
         ]
+        if provisional is not None:
+            msg.append(f"⏳ Provisional: {provisional[1]}")
+        msg.append("")
 
         # Build per-player sections
         for sid_str, player_triggers in triggers_by_player.items():
@@ -124,27 +178,111 @@ def process_match(match_id, store, processed_this_run, expected_friend_id=None):
             name = player["name"]
             hero = match_data["hero"]
             kda = match_data["kda"]
-            dmg = match_data["damage"]
+            dmg = match_data.get("damage")  # Absent until OpenDota has parsed it (provisional)
             friends = match_data["friends_in_match"]
 
             msg.append(f"🧑 **{name}**")
-            msg.append(f"🧙 {hero} | 🔪 {kda} | 🔥 {dmg:,} dmg")
+            msg.append(f"🧙 {hero} | 🔪 {kda} | 🔥 {'?' if dmg is None else f'{dmg:,}'} dmg")
 
             other_friends = [f for f in friends if f != name]
 
             if other_friends:
                 msg.append(f"👥 With: {', '.join(other_friends)}")
 
-            match_points = 0
             for t in player_triggers:
                 symbol = "⬆️" if t["points"] > 0 else "⬇️"
                 msg.append(f"{symbol} {t['name']} ({t['points']:+} pts)")
-                match_points += t["points"]
+            match_points = match_data["points"]  # The whole match, provisional triggers included
 
             total_points = player["total_points"]
             msg.append(f"**Match: {match_points:+} pts | Total: {total_points:+} pts**")
+            if overtakes.get(sid_str):
+                names = [store["leaderboard"][s]["name"] for s in overtakes[sid_str]]
+                overtaken = ", ".join(names[:3]) + (f" and {len(names) - 3} more" if len(names) > 3 else "")
+                msg.append(f"📈 {name} overtook {overtaken} (now #{view.rank(sid_str)})")
             msg.append("")
 
-        send_discord("\n".join(msg))
+        return "\n".join(msg)
     else:
         print(f"[INFO] Processed Match {match_id}: No points awarded.")
+    return None
+
+def match_details(p, final=True):
+    """
+    Hero, K/D/A, result and damage for a player's match record. A provisional
+    commit may see them unparsed: K/D/A parts show "?" and win / damage are
+    left out until the final commit fills them in.
+    """
+    details = {
+        "hero": heroes.name(p.get("hero_id")),
+        "kda": "/".join("?" if p.get(k, 0) is None else str(p.get(k, 0)) for k in ("kills", "deaths", "assists")),
+    }
+    if final or p.get("win") is not None:
+        details["win"] = bool(p.get("win"))
+    if final or p.get("hero_damage") is not None:
+        details["damage"] = int(p.get("hero_damage", 0) or 0)
+    return details
+
+def apply_triggers(match_id, triggers, match_time, store, friends_in_match, final=True):
+    """
+    6. Save Match History to Leaderboard: add triggers to the players'
+    match records, totals, time buckets and standings. Returns the
+    standings and {steam id: [players it overtook]} for the message.
+    final=False for a provisional commit; the final one refreshes what
+    it recorded from the full match.
+    """
+    match_id_str = str(match_id)
+    # Pre-build a list of all tracked friends in this specific match
+    all_friend_names = [steam_names[p['account_id']] for p in friends_in_match]
+    # Rankings move with every trigger; remember where everyone started for "X overtook Y"
+    view = standings.for_store(store)
+    points_before = {}
+    passed = {}
+
+    for p in friends_in_match:
+        sid_str = str(p.get("account_id"))
+        
+        # Ensure player has a folder in our leaderboard
+        player_entry = store.setdefault("leaderboard", {}).setdefault(sid_str, {
+            "name": steam_names.get(p["account_id"]),
+            "total_points": 0,
+            "matches": {}
+        })
+        view.ensure(sid_str)
+
+        # Map triggers to the correct player
+        player_triggers = [t for t in triggers if str(t["steam_id"]) == sid_str]
+
+        # A provisional commit recorded the match from partial data
+        match_record = player_entry["matches"].get(match_id_str)
+        if match_record is not None and final:
+            match_record.update(match_details(p))
+
+        # Skip storing match entirely if nothing happened
+        if not player_triggers:
+            continue
+
+        # Now create the match record (only when needed)
+        if match_record is None:
+            match_record = player_entry["matches"][match_id_str] = {
+                "date": match_time.strftime("%Y-%m-%d %H:%M UTC"),
+                **match_details(p, final),
+                "points": 0,
+                "friends_in_match": all_friend_names,
+                "challenges": []
+            }
+
+        # Apply triggers
+        for t in player_triggers:
+            match_record["challenges"].append({
+                "name": t["name"],
+                "points": t["points"]
+            })
+            match_record["points"] += t["points"]
+            points_before.setdefault(sid_str, player_entry["total_points"])
+            player_entry["total_points"] += t["points"]
+            windows.record(store, match_time, player_entry["name"], t["points"])
+            passed.setdefault(sid_str, []).extend(view.apply(sid_str, t["name"], t["points"], match_record["hero"]))
+
+    overtakes = {sid: view.overtaken(sid, others, points_before) for sid, others in passed.items()}
+    return view, overtakes
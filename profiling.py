@@ -0,0 +1,182 @@
+import cProfile
+import io
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# ---------------- PROFILING ---------------- #
+# `python main.py --profile [command]` wraps a run (or one match) in
+# cProfile and a stack sampler and writes to PROFILE_DIR:
+#   profile.prof       raw pstats, for snakeviz / `python -m pstats`
+#   profile.txt        top functions by cumulative and own time
+#   profile.collapsed  "thread;frame;frame count" lines for flamegraph.pl / speedscope
+#
+# cProfile only sees the thread that enabled it, so every thread started
+# during the run (the pipeline stages) gets its own profiler and the stats
+# are merged at the end. The sampler sees wall time, including sleeps and
+# time blocked on sockets, which cProfile folds into whichever call waited.
+#
+# `--trace-memory` runs tracemalloc and takes snapshots at phase boundaries
+# (after load_store, after the pipeline, after save_store) and a lighter
+# current/peak reading after every fetch_full_match, then reports the top
+# allocators at each boundary in memory.txt.
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+TOP_FUNCTIONS = 40
+TOP_ALLOCATORS = 15
+
+tracing_memory = False
+_snapshots = []   # (label, tracemalloc.Snapshot, current, peak)
+_readings = {}    # label -> {"count": n, "max_current": bytes}
+
+# ---------------- CPU ---------------- #
+
+class _ThreadProfilers:
+    """Gives every thread started while installed its own cProfile.Profile."""
+
+    def __init__(self):
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def _hook(self, frame, event, arg):
+        # First profile event in a new thread: swap this hook for a real profiler
+        prof = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(prof)
+        prof.enable()
+
+    def install(self):
+        threading.setprofile(self._hook)
+
+    def uninstall(self):
+        threading.setprofile(None)
+
+class _StackSampler(threading.Thread):
+    """Samples every thread's Python stack into collapsed-stack counts."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def _write_cpu_report(out_dir, main_prof, thread_profs, sampler, elapsed):
+    import pstats  # Slow to import (dataclasses, inspect) and only needed here
+    stats = pstats.Stats(main_prof)
+    for prof in thread_profs:
+        try:
+            stats.add(prof)
+        except TypeError:
+            pass  # Thread never made a profiled call
+    stats.dump_stats(os.path.join(out_dir, "profile.prof"))
+
+    buf = io.StringIO()
+    stats.stream = buf
+    buf.write(f"Wall time {elapsed:.2f}s, {len(thread_profs)} worker thread(s) profiled\n\n")
+    buf.write("==== by cumulative time ====\n")
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    buf.write("\n==== by own time ====\n")
+    stats.sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+    with open(os.path.join(out_dir, "profile.txt"), "w") as f:
+        f.write(buf.getvalue())
+
+    with open(os.path.join(out_dir, "profile.collapsed"), "w") as f:
+        for stack, count in sorted(sampler.counts.items()):
+            f.write(f"{stack} {count}\n")
+
+# ---------------- MEMORY ---------------- #
+
+def memory_checkpoint(label, snapshot=True):
+    """Record memory at a phase boundary. No-op unless --trace-memory is on."""
+    if not tracing_memory:
+        return
+    current, peak = tracemalloc.get_traced_memory()
+    if snapshot:
+        _snapshots.append((label, tracemalloc.take_snapshot(), current, peak))
+        return
+    reading = _readings.setdefault(label, {"count": 0, "max_current": 0})
+    reading["count"] += 1
+    reading["max_current"] = max(reading["max_current"], current)
+
+def _write_memory_report(out_dir):
+    lines = []
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    previous = None
+    for label, snap, current, peak in _snapshots:
+        snap = snap.filter_traces(ignore)
+        lines.append(f"==== {label}: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB ====")
+        if previous is None:
+            top = snap.statistics("lineno")[:TOP_ALLOCATORS]
+            for stat in top:
+                lines.append(f"  {stat}")
+        else:
+            top = snap.compare_to(previous, "lineno")[:TOP_ALLOCATORS]
+            lines.append("  (change since previous checkpoint)")
+            for stat in top:
+                lines.append(f"  {stat}")
+        lines.append("")
+        previous = snap
+    for label, reading in _readings.items():
+        lines.append(f"{label}: {reading['count']} readings, max current {reading['max_current'] / 1e6:.1f} MB")
+    with open(os.path.join(out_dir, "memory.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+# ---------------- ENTRY POINT ---------------- #
+
+def run(fn, out_dir, profile=False, trace_memory=False):
+    """Call fn() under the requested instrumentation and write reports to out_dir."""
+    global tracing_memory
+    if not (profile or trace_memory):
+        return fn()
+    os.makedirs(out_dir, exist_ok=True)
+
+    if trace_memory:
+        tracemalloc.start(10)
+        tracing_memory = True
+    if profile:
+        threads = _ThreadProfilers()
+        sampler = _StackSampler()
+        main_prof = cProfile.Profile()
+        sampler.start()
+        threads.install()
+        main_prof.enable()
+
+    t0 = time.perf_counter()
+    try:
+        return fn()
+    finally:
+        elapsed = time.perf_counter() - t0
+        if profile:
+            main_prof.disable()
+            sampler.stop()
+            threads.uninstall()
+            _write_cpu_report(out_dir, main_prof, threads.profiles, sampler, elapsed)
+            print(f"[INFO] Profile written to {out_dir}/profile.txt (+ .prof, .collapsed)")
+        if trace_memory:
+            memory_checkpoint("end")
+            tracing_memory = False
+            _write_memory_report(out_dir)
+            tracemalloc.stop()
+            print(f"[INFO] Memory report written to {out_dir}/memory.txt")
@@ -0,0 +1,226 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import api
+import budget
+import duos
+import standings
+import streaks
+import windows
+from challenges import score_rules, check_streak_challenges
+from config import BATCH_SIZE, CHECK_FROM_DATE, PIPELINE_WORKERS, STREAK_CHALLENGES
+from data import steam_names
+from validation import missing_fields
+from processor import (commit_match, apply_triggers, defer_match, points_by_player, triage, scored_rules,
+                       is_already_checked)
+
+# ---------------- ROSTER CHANGES ---------------- #
+# store["roster"] = {steam id: name} as of the last run. When steam_names.json
+# differs, run_check settles the difference before its pipeline instead of
+# letting the next run page a new friend's whole history:
+#
+#   added    catch_up reads only the new friend's listing back to the season
+#            start, then goes through their matches in start_time order:
+#            unchecked ones are committed quietly (like a backfill), checked
+#            ones are rescored for the new friend, plus whatever the bigger
+#            group now earns the others ("The Unstoppable Hivemind").
+#            Their streaks and duo pairs come out as if they'd been tracked
+#            all season; the others' streaks take the extra points where the
+#            match is still in their replay window.
+#   removed  drop deletes their leaderboard entry, challenge_log awards,
+#            streaks and duo pairs. Other friends keep what they scored with them.
+#
+# The store keeps no raw matches, so a catch-up downloads each match the new
+# friend played once. It is all or nothing: if a listing fails, the run
+# budget runs out or a checked match comes back unparsed, nothing is applied and the friend stays out of store["roster"]
+# until a later run finishes it. A match already counted for a friend (see
+# streaks.recorded) is never counted again, so settling twice is harmless.
+#
+# Shards skip this (their partial stores can't rescore matches another shard
+# owns); `main.py roster` settles a store on its own.
+
+def changes(store):
+    """(added, removed) steam ids (str) since the last run, or None for a store without a roster yet."""
+    previous = store.get("roster")
+    if previous is None:
+        return None
+    current = {str(sid) for sid in steam_names}
+    return sorted(current - set(previous), key=int), sorted(set(previous) - current, key=int)
+
+def remember(store, pending=()):
+    """Record this run's roster, leaving out friends whose catch-up is still pending."""
+    store["roster"] = {str(sid): name for sid, name in steam_names.items() if str(sid) not in pending}
+
+def settle(store, since=CHECK_FROM_DATE):
+    """Bring the store in line with steam_names.json. Returns (added, removed) steam ids settled."""
+    diff = changes(store)
+    if diff is None:
+        remember(store)
+        if store.get("leaderboard"):
+            print(f"[INFO] Tracking roster changes from now on ({len(steam_names)} friends)")
+        return [], []
+    added, removed = diff
+    for sid in removed:
+        drop(store, sid)
+    if removed and "hourly" in store:
+        windows.rebuild(store)
+    pending = added if added and not catch_up(store, added, since) else []
+    remember(store, pending)
+    return [sid for sid in added if sid not in pending], removed
+
+# ---------------- ADDED FRIENDS ---------------- #
+
+def _history(friend_id, since):
+    """[(match id, start_time)] of a friend's matches since `since`, or None if the listing failed."""
+    since_ts = int(since.timestamp())
+    found, offset = [], 0
+    while True:
+        api.discard_validators(api.match_list_url(friend_id, BATCH_SIZE, offset))  # Stale if they were tracked before
+        page = api.fetch_match_listing(friend_id, BATCH_SIZE, offset)
+        if page is None:
+            return None
+        found += [(m["match_id"], m.get("start_time", 0)) for m in page if m.get("start_time", 0) >= since_ts]
+        if len(page) < BATCH_SIZE or min(m.get("start_time", 0) for m in page) < since_ts:
+            return found
+        offset += BATCH_SIZE
+
+def catch_up(store, added, since=CHECK_FROM_DATE):
+    """Score the season of newly added friends into the store. False (store untouched) if it couldn't finish."""
+    names = ", ".join(steam_names.get(int(sid), sid) for sid in added)
+    print(f"[INFO] Roster: catching up {names}")
+    todo = {}  # match id -> (start_time, friend we found it through)
+    for sid in added:
+        history = _history(int(sid), since)
+        if history is None or budget.expired():
+            print(f"[WARN] Roster: listing of {steam_names.get(int(sid), sid)} incomplete, catching up next run")
+            return False
+        for match_id, start_time in history:
+            if not streaks.recorded(store, sid, match_id, start_time):
+                todo.setdefault(match_id, (start_time, int(sid)))
+
+    ordered = sorted(todo, key=lambda m: (todo[m][0], m))
+    with ThreadPoolExecutor(max_workers=PIPELINE_WORKERS["fetch"]) as pool:
+        fetched = dict(zip(ordered, pool.map(api.fetch_full_match, ordered)))
+    if budget.expired():
+        print(f"[WARN] Roster: run budget spent after {sum(m is not None for m in fetched.values())}/{len(ordered)} "
+              "matches, catching up next run")
+        return False
+    # A rescore must see everything the match was checked with
+    unparsed = [m for m in ordered if fetched[m] is not None and is_already_checked(m, store, ())
+                and missing_fields(fetched[m])]
+    if unparsed:
+        print(f"[WARN] Roster: {len(unparsed)} checked matches came back unparsed, catching up next run")
+        return False
+
+    added_ids = {int(sid) for sid in added}
+    committed = rescored = lost = 0
+    for match_id in ordered:
+        match_data = fetched[match_id]
+        if match_data is None:
+            lost += 1
+        elif is_already_checked(match_id, store, ()):
+            rescored += rescore_match(match_id, match_data, store, added_ids)
+        else:
+            committed += _commit(match_id, match_data, store, todo[match_id][1])
+    print(f"[SUCCESS] Roster: {names} caught up, {committed} new matches, {rescored} checked matches rescored, "
+          f"{lost} not available")
+    return True
+
+def _commit(match_id, match_data, store, expected_friend):
+    """An unchecked match of a new friend, as backfill commits it. Returns 1 if it was committed final."""
+    state, reason = triage(match_data, expected_friend)
+    if state == "defer":
+        defer_match(match_id, store, expected_friend, reason)
+        return 0
+    triggers, match_time, scored = score_rules(match_data, scored_rules(match_id, store))
+    provisional = (expected_friend, reason, scored) if state == "partial" else None
+    commit_match(match_id, match_data, triggers, match_time, store, provisional)  # Message dropped: no Discord
+    return int(provisional is None)
+
+def _key(t):
+    return str(t["steam_id"]), t["name"], t["points"]
+
+def rescore_match(match_id, match_data, store, added_ids):
+    """
+    Add what newly tracked friends change about an already checked match.
+    Returns 1 if it counted anyone new, 0 if they were all counted already.
+    """
+    match_id_str = str(match_id)
+    start_time = match_data.get("start_time", 0)
+    friends = [p for p in match_data.get("players", []) if p.get("account_id") in steam_names]
+    fresh = [p for p in friends if p["account_id"] in added_ids
+             and not streaks.recorded(store, p["account_id"], match_id, start_time)]
+    if not fresh:
+        return 0
+    fresh_ids = {str(p["account_id"]) for p in fresh}
+
+    # Scored without the new friends is what the match got when it was checked
+    masked = {**match_data, "players": [{**p, "account_id": None} if str(p.get("account_id")) in fresh_ids else p
+                                        for p in match_data.get("players", [])]}
+    before = Counter(_key(t) for t in score_rules(masked)[0])
+    log = store.get("challenge_log", {}).get(match_id_str, [])
+    logged = Counter(_key(t) for t in log)
+    triggers, match_time, _ = score_rules(match_data)
+
+    # New friends get everything they haven't been logged for; the others only
+    # what the bigger group adds on top of both their log and the masked score
+    seen = Counter()
+    delta = []
+    for t in triggers:
+        key = _key(t)
+        seen[key] += 1
+        already = logged[key] if key[0] in fresh_ids else max(logged[key], before[key])
+        if seen[key] > already:
+            delta.append(t)
+
+    points = points_by_player(log + delta)
+    changes = {}
+    for p in friends:
+        event = streaks.event_for(match_time, match_id, p, points.get(str(p["account_id"]), 0))
+        if str(p["account_id"]) not in fresh_ids:
+            streaks.amend(store, p["account_id"], event)  # A group award can flip their match to positive
+            continue
+        change = streaks.record(store, p["account_id"], event)
+        if change:
+            changes[str(p["account_id"])] = change
+    if STREAK_CHALLENGES:
+        delta += check_streak_challenges(match_data, changes)
+    old = [p for p in friends if str(p["account_id"]) not in fresh_ids]
+    duos.recount_match(store, old, points_by_player(log), friends, points_by_player(log + delta))
+
+    if delta:
+        match_log = store.setdefault("challenge_log", {}).setdefault(match_id_str, [])
+        for t in delta:
+            match_log.append({**t, "timestamp": match_time.isoformat()})
+    apply_triggers(match_id, delta, match_time, store, friends)
+    # Records from when the match was checked list who was in it; they now include the new friends
+    all_friend_names = [steam_names[p["account_id"]] for p in friends]
+    for p in friends:
+        record = store.get("leaderboard", {}).get(str(p["account_id"]), {}).get("matches", {}).get(match_id_str)
+        if record is not None:
+            record["friends_in_match"] = all_friend_names
+    return 1
+
+# ---------------- REMOVED FRIENDS ---------------- #
+
+def drop(store, sid):
+    """Delete a friend taken off the roster from the store's scoring data."""
+    entry = store.get("leaderboard", {}).pop(sid, None)
+    removed_points = entry.get("total_points", 0) if entry else 0
+    if entry:
+        log = store.get("challenge_log", {})
+        for match_id in entry.get("matches", {}):
+            kept = [t for t in log.get(match_id, []) if str(t["steam_id"]) != sid]
+            if kept:
+                log[match_id] = kept
+            else:
+                log.pop(match_id, None)
+        standings.for_store(store).remove(sid)
+    store.get("streaks", {}).pop(sid, None)
+    store.get("friend_activity", {}).pop(sid, None)
+    if "duos" in store:
+        duos.for_store(store).drop(sid)
+    for pending in store.get("unparsed_matches", {}).values():
+        if str(pending.get("expected_friend")) == sid:
+            pending["expected_friend"] = None  # Otherwise it reads as a privacy block forever
+    name = entry.get("name", sid) if entry else store.get("roster", {}).get(sid, sid)
+    print(f"[INFO] Roster: removed {name} ({removed_points:+} pts)")
@@ -0,0 +1,102 @@
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+# ---------------- SEEN-MATCH INDEX ---------------- #
+# Every match id we have finished with, as a sorted array of uint64 plus a
+# small unsorted buffer for this run's additions. Membership is a set lookup
+# then a bisect; the buffer is merged in when it fills or before saving.
+#
+# Persisted next to the store as <store>.seen (store.json -> store.seen):
+#   MAGIC, count (uint64), then the sorted ids as little-endian uint64
+# so loading is one read + array.frombytes, 8 bytes per match.
+# OpenDota ids are dense and increasing, but at a few thousand matches a
+# season the plain array is already small; no range compression needed.
+
+MAGIC = b"SEENIDX1"
+BUFFER_LIMIT = 4096
+
+def path_for(store_path):
+    return os.path.splitext(store_path)[0] + ".seen"
+
+class SeenIndex:
+    def __init__(self, match_ids=()):
+        self._sorted = array("Q")
+        self._buffer = set()
+        self.update(match_ids)
+
+    def __contains__(self, match_id):
+        match_id = int(match_id)
+        if match_id in self._buffer:
+            return True
+        i = bisect_left(self._sorted, match_id)
+        return i < len(self._sorted) and self._sorted[i] == match_id
+
+    def __len__(self):
+        return len(self._sorted) + len(self._buffer)
+
+    def __iter__(self):
+        self._flush()
+        return iter(self._sorted)
+
+    def add(self, match_id):
+        match_id = int(match_id)
+        if match_id not in self:
+            self._buffer.add(match_id)
+            if len(self._buffer) >= BUFFER_LIMIT:
+                self._flush()
+
+    def update(self, match_ids):
+        for match_id in match_ids:
+            self.add(match_id)
+
+    def _flush(self):
+        if self._buffer:
+            self._sorted = array("Q", merge(self._sorted, sorted(self._buffer)))
+            self._buffer.clear()
+
+    # ---- persistence ----
+
+    def to_bytes(self):
+        self._flush()
+        ids = array("Q", self._sorted)
+        if sys.byteorder == "big":
+            ids.byteswap()
+        return MAGIC + len(ids).to_bytes(8, "little") + ids.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:8] != MAGIC:
+            raise ValueError("Not a seen-match index")
+        count = int.from_bytes(data[8:16], "little")
+        if len(data) != 16 + count * 8:
+            raise ValueError(f"Seen-match index holds {len(data) - 16} bytes of ids, header says {count} ids")
+        index = cls()
+        index._sorted.frombytes(data[16:16 + count * 8])
+        if sys.byteorder == "big":
+            index._sorted.byteswap()
+        return index
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """The index saved at path; empty if there is none yet."""
+        try:
+            with open(path, "rb") as f:
+                return cls.from_bytes(f.read())
+        except FileNotFoundError:
+            return cls()
+
+def union(*indexes):
+    """One index holding every id in the given indexes (or plain id collections)."""
+    merged = SeenIndex()
+    for index in indexes:
+        merged.update(index or ())
+    return merged
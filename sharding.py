@@ -0,0 +1,54 @@
+import os
+import zlib
+from config import STORE_FILE, HTTP_CACHE_FILE
+
+# ---------------- SHARDED RUNS ---------------- #
+# `main.py run --shard i/N` checks only the friends whose account id hashes to
+# shard i and writes a partial store next to store.json. `main.py merge-shards N`
+# folds the N partial stores back into store.json. Every shard still scores
+# every tracked friend in a match it fetches, so a match shared across shards
+# yields identical awards that the merge dedupes: it is scored exactly once.
+# Shards post nothing to Discord themselves: a shard may be the only one to
+# fetch a match, or one of several, so each keeps its match messages in its
+# partial store (store["discord_outbox"]) and merge-shards posts one per match.
+#
+# Locally:
+#   for i in 0 1 2; do python main.py run --shard $i/3 & done; wait
+#   python main.py merge-shards 3
+
+active = None  # (index, count) while this process runs as a shard
+
+def parse_spec(spec):
+    """Parse "i/N" into (i, N)."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got '{spec}'")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index out of range: '{spec}'")
+    return index, count
+
+def activate(index, count):
+    global active
+    active = (index, count)
+
+def shard_of(key, count):
+    """Stable across processes and Python versions, unlike hash()."""
+    return zlib.crc32(str(key).encode()) % count
+
+def owns(key):
+    return active is None or shard_of(key, active[1]) == active[0]
+
+def hold_message(store, match_id, message):
+    """Keep a shard's Discord message for merge-shards; a match another shard also committed is posted once."""
+    store.setdefault("discord_outbox", {}).setdefault(str(match_id), message)
+
+def _shard_path(path, index, count):
+    base, ext = os.path.splitext(path)
+    return f"{base}.shard-{index}-of-{count}{ext}"
+
+def store_path(index, count):
+    return _shard_path(STORE_FILE, index, count)
+
+def http_cache_path(index, count):
+    return _shard_path(HTTP_CACHE_FILE, index, count)
@@ -0,0 +1,394 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# ---------------- LOCAL OPENDOTA + DISCORD SIMULATOR ---------------- #
+# Stand-in for api.opendota.com and a Discord webhook, for offline runs,
+# load tests and benchmarks:
+#
+#   python simulator.py --port 8765 --friends 100 --matches 20000 --write-roster sim_names.json
+#   OPENDOTA_API_URL=http://127.0.0.1:8765/api \
+#   DISCORD_WEBHOOK=http://127.0.0.1:8765/webhook \
+#   STEAM_NAMES_FILE=sim_names.json python main.py
+#
+# Serves GET  /api/players/{id}/matches?limit=&offset=   (ETag / 304 aware)
+#        GET  /api/matches/{id}
+#        GET  /api/constants/heroes                     (heroes.json, ETag aware)
+#        POST /api/request/{id}                         (parse request)
+#        POST /webhook[/...]                            (Discord)
+#        GET  /_stats                                   (counters, JSON)
+#
+# Matches are either synthetic (deterministic from --seed) or read from a
+# fixtures directory: players/{account_id}.json holds a listing and
+# matches/{match_id}.json a full match. Faults are injected per request.
+
+SEASON_START = datetime(2026, 1, 16, tzinfo=timezone.utc)
+SEASON_END = datetime(2026, 3, 1, tzinfo=timezone.utc)
+FIRST_MATCH_ID = 8_650_000_000
+
+def _hero_constants(path="heroes.json"):
+    """heroes.json entries, served back as /api/constants/heroes."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return [{"id": i, "name": f"npc_dota_hero_{i}", "localized_name": f"Hero {i}", "roles": []} for i in range(1, 125)]
+
+def parse_latency(spec):
+    """
+    "fixed:MS", "uniform:LO,HI" or "lognormal:MU,SIGMA" (milliseconds; MU/SIGMA
+    in log space). Returns a function rng -> seconds.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+class SyntheticWorld:
+    """A season of matches between `friends`, generated lazily from a seed."""
+
+    def __init__(self, friends, match_count, seed=0, private_rate=0.0, unparsed_rate=0.0,
+                 missing_rate=0.0, start=SEASON_START, end=SEASON_END):
+        self.friends = list(friends)
+        self.seed = seed
+        self.hero_constants = _hero_constants()
+        self.heroes = [h["id"] for h in self.hero_constants]
+        rng = random.Random(seed)
+        self.private = {f for f in self.friends if rng.random() < private_rate}
+        self.unparsed_rate = unparsed_rate
+        self.missing_rate = missing_rate
+
+        # Index: per friend, newest first, (match_id, start_time). Full matches are built on demand.
+        span = max(1, int((end - start).total_seconds()))
+        base = int(start.timestamp())
+        self.listings = {f: [] for f in self.friends}
+        self.rosters = {}
+        for i in range(match_count):
+            match_id = FIRST_MATCH_ID + i * 7
+            start_time = base + span * i // max(1, match_count)
+            stack = rng.randint(1, min(5, len(self.friends)))
+            roster = rng.sample(self.friends, stack)
+            self.rosters[match_id] = (start_time, roster)
+            for f in roster:
+                self.listings[f].append((match_id, start_time))
+        for entries in self.listings.values():
+            entries.reverse()
+
+    def add_match(self, roster, start_time):
+        """A match played after the season was generated, on top of each roster member's listing."""
+        match_id = FIRST_MATCH_ID + len(self.rosters) * 7
+        self.rosters[match_id] = (start_time, list(roster))
+        for f in roster:
+            self.listings[f].insert(0, (match_id, start_time))
+        return match_id
+
+    def listing(self, account_id):
+        if account_id in self.private:
+            return []
+        return [{"match_id": m, "start_time": t} for m, t in self.listings.get(account_id, [])]
+
+    def is_missing(self, match_id):
+        return random.Random(self.seed * 31 + match_id).random() < self.missing_rate
+
+    def starts_unparsed(self, match_id):
+        return random.Random(self.seed * 17 + match_id).random() < self.unparsed_rate
+
+    def match(self, match_id, parsed=True):
+        if match_id not in self.rosters or self.is_missing(match_id):
+            return None
+        start_time, roster = self.rosters[match_id]
+        rng = random.Random(self.seed * 1_000_003 + match_id)
+        radiant_win = rng.random() < 0.5
+        heroes = rng.sample(self.heroes, 10)
+        slots = [None] * 10
+        for pos, f in zip(rng.sample(range(10), len(roster)), roster):
+            slots[pos] = f
+
+        players = []
+        for pos, account_id in enumerate(slots):
+            radiant = pos < 5
+            players.append({
+                "account_id": None if account_id in self.private else account_id,
+                "player_slot": pos if radiant else 128 + pos - 5,
+                "hero_id": heroes[pos],
+                "kills": rng.randint(0, 22),
+                "deaths": rng.randint(0, 21),
+                "assists": rng.randint(0, 30),
+                "win": int(radiant == radiant_win),
+                "tower_damage": rng.choice([0, rng.randint(1, 99), rng.randint(100, 12000)]),
+                "hero_damage": rng.randint(2000, 60000),
+            })
+        match = {
+            "match_id": match_id,
+            "start_time": start_time,
+            "duration": rng.randint(900, 3600),
+            "radiant_win": radiant_win,
+            "barracks_status_radiant": rng.choice([0, 3, 63]),
+            "barracks_status_dire": rng.choice([0, 3, 63]),
+            "players": players,
+        }
+        if not parsed:
+            match["barracks_status_dire"] = None
+            for p in players:
+                p["tower_damage"] = None
+        return match
+
+class FixtureWorld:
+    """Recorded responses: players/{id}.json and matches/{id}.json under a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.private = set()
+        self.hero_constants = _hero_constants()
+
+    def _read(self, *parts):
+        try:
+            with open(os.path.join(self.directory, *parts), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def listing(self, account_id):
+        return self._read("players", f"{account_id}.json") or []
+
+    def starts_unparsed(self, match_id):
+        return False
+
+    def match(self, match_id, parsed=True):
+        return self._read("matches", f"{match_id}.json")
+
+class Faults:
+    def __init__(self, latency="fixed:0", rate_429=0.0, storm_every=0, storm_length=0,
+                 timeout_rate=0.0, hang_seconds=30.0, parse_after=2, seed=0):
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.storm_every = storm_every
+        self.storm_length = storm_length
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.parse_after = parse_after
+        self.rng = random.Random(seed)
+
+class Simulator:
+    def __init__(self, world, faults=None, etags=True):
+        self.world = world
+        self.faults = faults or Faults()
+        self.etags = etags  # False: no ETag / 304, clients can only compare bodies
+        self.stats = {"requests": 0, "by_endpoint": {}, "status": {}, "bytes": 0,
+                      "hangs": 0, "parse_requests": 0, "webhook_messages": 0}
+        self.fetch_counts = {}   # match_id -> times fetched while unparsed
+        self.parse_requested = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self.messages = []
+
+    # ---- fault decisions ----
+
+    def _next_request(self, endpoint):
+        with self._lock:
+            self.stats["requests"] += 1
+            n = self.stats["requests"]
+            self.stats["by_endpoint"][endpoint] = self.stats["by_endpoint"].get(endpoint, 0) + 1
+            f = self.faults
+            in_storm = f.storm_every and (n % f.storm_every) < f.storm_length
+            throttled = in_storm or f.rng.random() < f.rate_429
+            hang = not throttled and f.rng.random() < f.timeout_rate
+            delay = f.latency(f.rng)
+        return throttled, hang, delay
+
+    def _count(self, status, size):
+        with self._lock:
+            self.stats["status"][str(status)] = self.stats["status"].get(str(status), 0) + 1
+            self.stats["bytes"] += size
+
+    def _is_parsed(self, match_id):
+        if not self.world.starts_unparsed(match_id):
+            return True
+        with self._lock:
+            seen = self.fetch_counts.get(match_id, 0)
+            self.fetch_counts[match_id] = seen + 1
+            needed = 1 if match_id in self.parse_requested else self.faults.parse_after
+            return seen >= needed
+
+    # ---- server ----
+
+    def start(self, host="127.0.0.1", port=0):
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # otherwise delayed ACKs add ~40 ms per keep-alive request
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+                sim._count(status, len(body))
+
+            def _json(self, payload, etag_request=None):
+                body = json.dumps(payload).encode()
+                if not sim.etags:
+                    return self._send(200, body, {"Content-Type": "application/json"})
+                etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+                if etag_request and etag_request == etag:
+                    self._send(304, headers={"ETag": etag})
+                else:
+                    self._send(200, body, {"Content-Type": "application/json", "ETag": etag})
+
+            def _faulted(self, endpoint):
+                throttled, hang, delay = sim._next_request(endpoint)
+                if hang:
+                    with sim._lock:
+                        sim.stats["hangs"] += 1
+                    time.sleep(sim.faults.hang_seconds)
+                    return True  # Client has long given up; drop without answering
+                if delay:
+                    time.sleep(delay)
+                if throttled:
+                    self._send(429, b'{"error":"rate limit exceeded"}', {"Retry-After": "1"})
+                    return True
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [p for p in url.path.split("/") if p]
+                if parts == ["_stats"]:
+                    with sim._lock:
+                        body = json.dumps(sim.stats).encode()
+                    return self._send(200, body, {"Content-Type": "application/json"})
+
+                if len(parts) == 4 and parts[:2] == ["api", "players"] and parts[3] == "matches":
+                    if self._faulted("players"):
+                        return
+                    query = parse_qs(url.query)
+                    limit = int(query.get("limit", ["20"])[0])
+                    offset = int(query.get("offset", ["0"])[0])
+                    listing = sim.world.listing(int(parts[2]))[offset:offset + limit]
+                    return self._json(listing, self.headers.get("If-None-Match"))
+
+                if parts == ["api", "constants", "heroes"]:
+                    return self._json({str(h["id"]): h for h in sim.world.hero_constants}, self.headers.get("If-None-Match"))
+
+                if len(parts) == 3 and parts[:2] == ["api", "matches"]:
+                    if self._faulted("matches"):
+                        return
+                    match_id = int(parts[2])
+                    match = sim.world.match(match_id, parsed=sim._is_parsed(match_id))
+                    if match is None:
+                        return self._send(404, b'{"error":"Not Found"}')
+                    return self._json(match)
+
+                self._send(404, b'{"error":"Not Found"}')
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                body = self.rfile.read(length) if length else b""
+                parts = [p for p in urlparse(self.path).path.split("/") if p]
+
+                if parts and parts[0] == "webhook":
+                    with sim._lock:
+                        sim.stats["webhook_messages"] += 1
+                        try:
+                            sim.messages.append(json.loads(body).get("content", ""))
+                        except ValueError:
+                            pass
+                    return self._send(204)
+
+                if len(parts) == 3 and parts[:2] == ["api", "request"]:
+                    if self._faulted("request"):
+                        return
+                    with sim._lock:
+                        sim.stats["parse_requests"] += 1
+                        sim.parse_requested.add(int(parts[2]))
+                    return self._json({"job": {"jobId": int(parts[2])}})
+
+                self._send(404, b'{"error":"Not Found"}')
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+def synthetic_roster(count, seed=0):
+    """Deterministic fake account ids -> names, in steam_names.json form."""
+    rng = random.Random(seed)
+    ids = rng.sample(range(10_000_000, 1_500_000_000), count)
+    return {account_id: f"Player{i:04d}" for i, account_id in enumerate(ids)}
+
+def _load_roster(path):
+    with open(path, "r") as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenDota + Discord webhook simulator.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="directory with players/*.json and matches/*.json")
+    parser.add_argument("--roster", default="steam_names.json", help="friends to simulate (ignored with --friends)")
+    parser.add_argument("--friends", type=int, help="generate N synthetic friends instead of --roster")
+    parser.add_argument("--write-roster", metavar="PATH", help="write the simulated roster as a steam_names file")
+    parser.add_argument("--matches", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", default="lognormal:4,0.5", help="fixed:MS | uniform:LO,HI | lognormal:MU,SIGMA")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="chance any request is throttled")
+    parser.add_argument("--storm-every", type=int, default=0, help="every N requests start a 429 storm...")
+    parser.add_argument("--storm-length", type=int, default=0, help="...lasting this many requests")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="chance a request hangs past the client timeout")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="chance a match 404s")
+    parser.add_argument("--unparsed-rate", type=float, default=0.0, help="chance a match starts partially parsed")
+    parser.add_argument("--parse-after", type=int, default=2, help="fetches before an unparsed match is parsed (1 after /request)")
+    parser.add_argument("--private-rate", type=float, default=0.0, help="chance a friend's profile is private")
+    parser.add_argument("--no-etags", action="store_true", help="send no ETags, so clients fall back to body hashes")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        world = FixtureWorld(args.fixtures)
+    else:
+        roster = synthetic_roster(args.friends, args.seed) if args.friends else _load_roster(args.roster)
+        if args.write_roster:
+            with open(args.write_roster, "w") as f:
+                json.dump({str(k): v for k, v in roster.items()}, f, indent=2)
+        world = SyntheticWorld(roster, args.matches, args.seed, args.private_rate,
+                               args.unparsed_rate, args.missing_rate)
+
+    faults = Faults(args.latency, args.rate_429, args.storm_every, args.storm_length,
+                    args.timeout_rate, args.hang_seconds, args.parse_after, args.seed)
+    sim = Simulator(world, faults, etags=not args.no_etags).start(args.host, args.port)
+    print(f"[INFO] Simulator listening on {sim.base_url}")
+    print(f"[INFO]   OPENDOTA_API_URL={sim.base_url}/api")
+    print(f"[INFO]   DISCORD_WEBHOOK={sim.base_url}/webhook")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sim.stop()
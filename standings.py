@@ -0,0 +1,203 @@
+import random
+
+# ---------------- STANDINGS ---------------- #
+# Rankings derived from store["leaderboard"], kept up to date by commit_match
+# as points land instead of re-sorting every player each time we print.
+#
+#   order            RankIndex of (-total_points, seq, steam_id): rank lookup,
+#                    and a points change (one remove + insert), are O(log n)
+#   challenge_counts {challenge name: {steam_id: times triggered}}
+#   hero_points      {hero: {steam_id: points earned on it}}
+#
+# seq is the order players first appeared in the leaderboard, so ties rank
+# the same way the old stable sort did. Nothing here is saved: it is rebuilt
+# from the store once per process (cheap next to loading it) and can't drift
+# from what store_merge.py produces.
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels  # positions from here to next[level] (the end, past the last key, if None)
+
+class RankIndex:
+    """
+    Distinct sorted keys in an indexable skip list: insert, remove and
+    index (how many keys sort before one) in O(log n) expected, and
+    slices by position in O(log n + k).
+    """
+
+    LEVELS = 20  # Plenty up to ~1M keys
+
+    def __init__(self, keys=()):
+        self._head = _Node(None, self.LEVELS)  # Sits at position -1
+        self._size = 0
+        self._rng = random.Random(0)  # Same shape every run
+        for key in sorted(keys):
+            self.insert(key)
+
+    def __len__(self):
+        return self._size
+
+    def _path(self, key):
+        """Per level, the last node before key and its position."""
+        node, pos = self._head, -1
+        chain, positions = [None] * self.LEVELS, [0] * self.LEVELS
+        for level in reversed(range(self.LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+            chain[level], positions[level] = node, pos
+        return chain, positions
+
+    def index(self, key):
+        return self._path(key)[1][0] + 1
+
+    def insert(self, key):
+        chain, positions = self._path(key)
+        levels = 1
+        while levels < self.LEVELS and self._rng.random() < 0.5:
+            levels += 1
+        node = _Node(key, levels)
+        at = positions[0] + 1
+        for level in range(levels):
+            prev = chain[level]
+            node.next[level], prev.next[level] = prev.next[level], node
+            node.width[level] = prev.width[level] - (at - positions[level]) + 1
+            prev.width[level] = at - positions[level]
+        for level in range(levels, self.LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise ValueError(f"{key!r} is not in the index")
+        for level in range(self.LEVELS):
+            prev = chain[level]
+            if prev.next[level] is node:
+                prev.width[level] += node.width[level] - 1
+                prev.next[level] = node.next[level]
+            else:
+                prev.width[level] -= 1
+        self._size -= 1
+
+    def slice(self, start, stop=None):
+        """Keys at positions start..stop-1 (to the end if stop is None)."""
+        stop = self._size if stop is None else min(stop, self._size)
+        node, pos = self._head, -1
+        for level in reversed(range(self.LEVELS)):
+            while node.next[level] is not None and pos + node.width[level] < start:  # Stop just before start
+                pos += node.width[level]
+                node = node.next[level]
+        keys = []
+        for _ in range(max(0, stop - max(start, 0))):
+            node = node.next[0]
+            keys.append(node.key)
+        return keys
+
+class Standings:
+    def __init__(self, leaderboard):
+        self.points = {}
+        self.seq = {}
+        self.challenge_counts = {}
+        self.hero_points = {}
+        for sid, entry in leaderboard.items():
+            self._register(sid, entry.get("total_points", 0))
+            for record in entry.get("matches", {}).values():
+                for c in record.get("challenges", []):
+                    self._count(sid, c["name"], c["points"], record.get("hero"))
+        self.order = RankIndex(self._key(sid) for sid in self.points)
+
+    def _register(self, sid, points):
+        self.seq[sid] = len(self.seq)
+        self.points[sid] = points
+
+    def ensure(self, sid):
+        """Rank a new leaderboard entry (0 points) alongside everyone else."""
+        if sid not in self.points:
+            self._register(sid, 0)
+            self.order.insert(self._key(sid))
+
+    def remove(self, sid):
+        """Forget a player whose leaderboard entry was deleted."""
+        if sid not in self.points:
+            return
+        self.order.remove(self._key(sid))
+        del self.points[sid]
+        for counts in list(self.challenge_counts.values()) + list(self.hero_points.values()):
+            counts.pop(sid, None)
+
+    def _count(self, sid, challenge, points, hero):
+        counts = self.challenge_counts.setdefault(challenge, {})
+        counts[sid] = counts.get(sid, 0) + 1
+        heroes = self.hero_points.setdefault(hero, {})
+        heroes[sid] = heroes.get(sid, 0) + points
+
+    def _key(self, sid):
+        return (-self.points[sid], self.seq[sid], sid)
+
+    def rank(self, sid):
+        """1-based rank, or None for a player with no leaderboard entry."""
+        if sid not in self.points:
+            return None
+        return self.order.index(self._key(sid)) + 1
+
+    def apply(self, sid, challenge, points, hero):
+        """
+        Record one trigger for sid (a leaderboard key). Returns the steam ids
+        sid moved above, best-ranked first (empty unless it climbed).
+        """
+        self.ensure(sid)
+        self._count(sid, challenge, points, hero)
+        if not points:
+            return []
+
+        old = self.order.index(self._key(sid))
+        self.order.remove(self._key(sid))
+        self.points[sid] += points
+        self.order.insert(self._key(sid))
+        new = self.order.index(self._key(sid))
+        if new >= old:
+            return []
+        return [entry[2] for entry in self.order.slice(new + 1, old + 1)]
+
+    def overtaken(self, sid, candidates, points_before):
+        """
+        Of candidates (ids apply() reported), those that were ahead of sid
+        before the match and are behind it now. points_before holds the
+        pre-match totals of everyone whose points the match changed.
+        """
+        def before(s):
+            return (-points_before.get(s, self.points[s]), self.seq[s])
+        mine = self._key(sid)
+        result = []
+        for other in dict.fromkeys(candidates):
+            if before(other) < before(sid) and self._key(other) > mine:
+                result.append(other)
+        return result
+
+    def ranked(self, limit=None):
+        """[(steam_id, total_points)] best first."""
+        return [(sid, -neg) for neg, _, sid in self.order.slice(0, limit)]
+
+    def challenge_ranking(self, challenge):
+        counts = self.challenge_counts.get(challenge, {})
+        return sorted(counts.items(), key=lambda x: (-x[1], self.seq[x[0]]))
+
+    def hero_ranking(self, hero):
+        sums = self.hero_points.get(hero, {})
+        return sorted(sums.items(), key=lambda x: (-x[1], self.seq[x[0]]))
+
+# One Standings per store object: a run loads one store and commits into it
+_current = None
+
+def for_store(store):
+    """The Standings for this store, built on first use."""
+    global _current
+    if _current is None or _current[0] is not store:
+        _current = (store, Standings(store.get("leaderboard", {})))
+    return _current[1]
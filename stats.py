@@ -0,0 +1,255 @@
+import argparse
+import csv
+import heapq
+import sys
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+import codec
+from config import STORE_FILE
+from data import load_store
+
+# ---------------- STATS QUERIES ---------------- #
+# python main.py stats top --challenge "walking ward"
+# python main.py stats player Dreamer --last 20
+# python main.py stats heroes --since 2026-02-01 --format csv
+# python main.py stats duos --player Dreamer
+#
+# Every award in the leaderboard is flattened once into time-sorted lists per
+# player, challenge and hero; a query picks the narrowest list and bisects it
+# for the date range, so it never walks the whole store.
+
+# Award tuple layout, kept as plain tuples to keep the index small
+TS, SID, MATCH, HERO, CHALLENGE, POINTS = range(6)
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M UTC").replace(tzinfo=timezone.utc).timestamp()
+
+class StoreIndex:
+    def __init__(self, store):
+        self.names = {}        # steam id -> display name
+        self.awards = []       # every award, oldest first
+        self.by_player = {}    # steam id -> [award]
+        self.by_challenge = {} # challenge name -> [award]
+        self.by_hero = {}      # hero -> [award]
+        self.matches = {}      # steam id -> [(ts, match_id, record)] oldest first
+        self.duos = store.get("duos")  # duos.DuoMatrix, season totals (no date range)
+
+        for sid, player in store.get("leaderboard", {}).items():
+            self.names[sid] = player.get("name") or sid
+            for match_id, record in player.get("matches", {}).items():
+                if "date" not in record:
+                    continue
+                ts = _parse_date(record["date"])
+                self.matches.setdefault(sid, []).append((ts, match_id, record))
+                for c in record.get("challenges", []):
+                    self.awards.append((ts, sid, match_id, record.get("hero"), c["name"], c["points"]))
+
+        self.awards.sort()
+        for award in self.awards:
+            self.by_player.setdefault(award[SID], []).append(award)
+            self.by_challenge.setdefault(award[CHALLENGE], []).append(award)
+            self.by_hero.setdefault(award[HERO], []).append(award)
+        for entries in self.matches.values():
+            entries.sort(key=lambda e: e[0])
+        self._times = {}  # id(list) -> timestamps, built on first range query
+
+    # ---- lookups ----
+
+    def player_id(self, query):
+        """Steam id for a name (case-insensitive) or an id."""
+        if query in self.names:
+            return query
+        lowered = query.lower()
+        for sid, name in self.names.items():
+            if name.lower() == lowered:
+                return sid
+        raise SystemExit(f"[ERROR] Unknown player: {query}")
+
+    def challenge_names(self, query):
+        """Challenge names containing query, so 'walking ward' also finds bonus variants."""
+        lowered = query.lower()
+        found = [name for name in self.by_challenge if lowered in name.lower()]
+        if not found:
+            raise SystemExit(f"[ERROR] No challenge matching: {query}")
+        return found
+
+    def hero_name(self, query):
+        lowered = query.lower()
+        for hero in self.by_hero:
+            if hero and hero.lower() == lowered:
+                return hero
+        raise SystemExit(f"[ERROR] Unknown hero: {query}")
+
+    def _window(self, entries, since, until):
+        """Slice of a time-sorted list within [since, until)."""
+        if since is None and until is None:
+            return entries
+        times = self._times.get(id(entries))
+        if times is None:
+            times = self._times[id(entries)] = [e[0] for e in entries]
+        lo = bisect_left(times, since) if since is not None else 0
+        hi = bisect_left(times, until) if until is not None else len(entries)
+        return entries[lo:hi]
+
+    def select(self, player=None, challenge=None, hero=None, since=None, until=None):
+        """Awards matching every given filter, oldest first."""
+        sid = self.player_id(player) if player else None
+        hero = self.hero_name(hero) if hero else None
+        names = set(self.challenge_names(challenge)) if challenge else None
+
+        # Start from the narrowest index, then filter what's left of it
+        if sid is not None:
+            awards = self._window(self.by_player.get(sid, []), since, until)
+        elif names is not None:
+            parts = [self._window(self.by_challenge[name], since, until) for name in names]
+            awards = parts[0] if len(parts) == 1 else list(heapq.merge(*parts))
+        elif hero is not None:
+            awards = self._window(self.by_hero[hero], since, until)
+        else:
+            awards = self._window(self.awards, since, until)
+
+        if (sid is not None) + (names is not None) + (hero is not None) > 1:
+            awards = [a for a in awards
+                      if (sid is None or a[SID] == sid)
+                      and (hero is None or a[HERO] == hero)
+                      and (names is None or a[CHALLENGE] in names)]
+        return awards
+
+# ---------------- QUERIES ---------------- #
+# Each returns (columns, rows)
+
+def query_top(index, args):
+    awards = index.select(None, args.challenge, args.hero, args.since, args.until)
+    totals = {}
+    for a in awards:
+        points, count = totals.get(a[SID], (0, 0))
+        totals[a[SID]] = (points + a[POINTS], count + 1)
+    # A challenge query ranks by how often it happened; otherwise by points
+    key = (lambda x: (x[1][1], x[1][0])) if args.challenge else (lambda x: (x[1][0], x[1][1]))
+    ranked = sorted(totals.items(), key=key, reverse=True)[:args.n]
+    rows = [[rank, index.names[sid], points, count] for rank, (sid, (points, count)) in enumerate(ranked, 1)]
+    return ["rank", "player", "points", "awards"], rows
+
+def query_player(index, args):
+    sid = index.player_id(args.name)
+    entries = index._window(index.matches.get(sid, []), args.since, args.until)[-args.last:]
+    rows = []
+    for ts, match_id, record in reversed(entries):
+        challenges = "; ".join(f"{c['name']} ({c['points']:+})" for c in record.get("challenges", []))
+        rows.append([record["date"], match_id, record.get("hero"), record.get("kda"),
+                     "W" if record.get("win") else "L", record.get("points", 0), challenges])
+    return ["date", "match_id", "hero", "kda", "result", "points", "challenges"], rows
+
+def query_heroes(index, args):
+    awards = index.select(args.player, None, None, args.since, args.until)
+    totals = {}
+    for a in awards:
+        points, count = totals.get(a[HERO], (0, 0))
+        totals[a[HERO]] = (points + a[POINTS], count + 1)
+    ranked = sorted(totals.items(), key=lambda x: x[1][0], reverse=True)[:args.n]
+    return ["hero", "points", "awards"], [[hero, points, count] for hero, (points, count) in ranked]
+
+def query_challenges(index, args):
+    awards = index.select(args.player, None, None, args.since, args.until)
+    totals = {}
+    for a in awards:
+        points, count = totals.get(a[CHALLENGE], (0, 0))
+        totals[a[CHALLENGE]] = (points + a[POINTS], count + 1)
+    ranked = sorted(totals.items(), key=lambda x: x[1][1], reverse=True)[:args.n]
+    return ["challenge", "times", "points"], [[name, count, points] for name, (points, count) in ranked]
+
+def _rate(wins, games):
+    return f"{wins / games:.0%}" if games else "-"
+
+def query_duos(index, args):
+    matrix = index.duos
+    if matrix is None or not len(matrix):
+        return ["duo", "games", "wins", "win%", "points"], []
+    if args.player:
+        # One player's partners against their own average: who lifts them, who drags them down
+        sid = index.player_id(args.player)
+        if sid not in matrix.index:
+            return ["partner", "games", "win%", "avg points", "vs overall"], []
+        rows = matrix.partners(sid)
+        _, own_games, _, own_points = rows[0]
+        overall = own_points / own_games
+        ranked = sorted((r for r in rows[1:] if r[1] >= args.min_games), key=lambda r: r[3] / r[1], reverse=True)
+        return ["partner", "games", "win%", "avg points", "vs overall"], [
+            [index.names.get(partner, partner), games, _rate(wins, games), round(points / games, 1),
+             f"{points / games - overall:+.1f}"] for partner, games, wins, points in ranked[:args.n]]
+    pairs = sorted(matrix.duos(args.min_games), key=lambda d: (d[3] / d[2], d[2]), reverse=True)[:args.n]
+    return ["duo", "games", "wins", "win%", "points"], [
+        [f"{index.names.get(a, a)} + {index.names.get(b, b)}", games, wins, _rate(wins, games), pa + pb]
+        for a, b, games, wins, pa, pb in pairs]
+
+QUERIES = {"top": query_top, "player": query_player, "heroes": query_heroes, "challenges": query_challenges,
+           "duos": query_duos}
+
+# ---------------- OUTPUT ---------------- #
+
+def render(columns, rows, fmt, out=sys.stdout):
+    if fmt == "json":
+        codec.dump([dict(zip(columns, row)) for row in rows], out, indent=2, ensure_ascii=False)
+        out.write("\n")
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        widths = [max(len(str(c)), *(len(str(r[i])) for r in rows)) if rows else len(str(c))
+                  for i, c in enumerate(columns)]
+        out.write("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)).rstrip() + "\n")
+        for row in rows:
+            out.write("  ".join(str(v).ljust(w) for v, w in zip(row, widths)).rstrip() + "\n")
+
+def _day(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--store", default=STORE_FILE)
+    common.add_argument("--format", choices=("table", "json", "csv"), default="table")
+    common.add_argument("--since", type=_day, help="YYYY-MM-DD, inclusive")
+    common.add_argument("--until", type=_day, help="YYYY-MM-DD, exclusive")
+
+    parser = argparse.ArgumentParser(prog="main.py stats", description="Query the leaderboard in store.json.")
+    sub = parser.add_subparsers(dest="query", required=True)
+
+    top = sub.add_parser("top", parents=[common], help="players ranked by points (or by count with --challenge)")
+    top.add_argument("--challenge", help="substring of a challenge name")
+    top.add_argument("--hero")
+    top.add_argument("-n", type=int, default=10)
+
+    player = sub.add_parser("player", parents=[common], help="a player's recent matches")
+    player.add_argument("name")
+    player.add_argument("--last", type=int, default=20)
+
+    heroes = sub.add_parser("heroes", parents=[common], help="points per hero")
+    heroes.add_argument("--player")
+    heroes.add_argument("-n", type=int, default=20)
+
+    challenges = sub.add_parser("challenges", parents=[common], help="how often each challenge fired")
+    challenges.add_argument("--player")
+    challenges.add_argument("-n", type=int, default=50)
+
+    duos = sub.add_parser("duos", parents=[common], help="best duos by win rate, or one player's partners (whole season)")
+    duos.add_argument("--player", help="rank this player's partners by their average points together")
+    duos.add_argument("--min-games", type=int, default=3)
+    duos.add_argument("-n", type=int, default=20)
+    return parser
+
+def main(argv):
+    args = build_parser().parse_args(argv)
+    t0 = time.perf_counter()
+    index = StoreIndex(load_store(args.store))
+    t1 = time.perf_counter()
+    columns, rows = QUERIES[args.query](index, args)
+    t2 = time.perf_counter()
+    render(columns, rows, args.format)
+    if args.format == "table":
+        print(f"\n({len(index.awards)} awards indexed in {(t1 - t0) * 1000:.1f} ms, query {(t2 - t1) * 1000:.3f} ms)",
+              file=sys.stderr)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
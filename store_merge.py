@@ -0,0 +1,184 @@
+import argparse
+import codec
+import duos
+import seen
+import streaks
+import windows
+
+# ---------------- SEMANTIC STORE MERGE ---------------- #
+# Two runs that started from the same store.json can both award points. A
+# textual merge of store.json either conflicts or double counts, so merge
+# the meaning instead: union of checked matches, challenge awards deduped by
+# (match_id, steam_id, challenge), totals and time buckets recomputed from
+# per-match records. Checked matches live in store.seen (seen.py), which has
+# its own driver: the union of both indexes.
+
+def _award_key(match_id, award):
+    return (str(match_id), str(award["steam_id"]), award["name"])
+
+def _merge_challenge_log(*logs):
+    merged = {}
+    logged = set()
+    for log in logs:
+        for match_id, awards in log.items():
+            entry = merged.setdefault(match_id, [])
+            for award in awards:
+                key = _award_key(match_id, award)
+                if key not in logged:
+                    logged.add(key)
+                    entry.append(award)
+    return merged
+
+def _union(ours, theirs):
+    """Dict union keeping `ours` order and values; keys only in `theirs` go last."""
+    merged = dict(ours)
+    for key, value in theirs.items():
+        merged.setdefault(key, value)
+    return merged
+
+def _merge_match_record(ours, theirs):
+    record = _union(ours, theirs)
+    names = {c["name"] for c in ours.get("challenges", [])}
+    record["challenges"] = list(ours.get("challenges", [])) + [
+        c for c in theirs.get("challenges", []) if c["name"] not in names
+    ]
+    return record
+
+def _merge_leaderboard(*boards):
+    merged = {}
+    for board in boards:
+        for sid, player in board.items():
+            entry = merged.setdefault(sid, {**player, "matches": {}})
+            for match_id, record in player.get("matches", {}).items():
+                if match_id in entry["matches"]:
+                    entry["matches"][match_id] = _merge_match_record(entry["matches"][match_id], record)
+                else:
+                    entry["matches"][match_id] = dict(record)
+    recompute_totals(merged)
+    return merged
+
+def recompute_totals(leaderboard):
+    """Rebuild match and season totals from the per-match challenge records."""
+    for player in leaderboard.values():
+        total = 0
+        for record in player.get("matches", {}).values():
+            points_key = "total_points_in_match" if "total_points_in_match" in record else "points"
+            record[points_key] = sum(c["points"] for c in record.get("challenges", []))
+            total += record[points_key]
+        player["total_points"] = total
+
+def _merge_pending(key, base, ours, theirs, done):
+    """
+    Three-way merge for queues (unparsed matches, privacy issues): an entry
+    survives unless one side removed it since base or it has been completed.
+    """
+    base_items = base.get(key, {}) if base else {}
+    merged = {}
+    for side, other in ((ours, theirs), (theirs, ours)):
+        for item_id, value in side.get(key, {}).items():
+            removed_by_other = item_id in base_items and item_id not in other.get(key, {})
+            if item_id in done or removed_by_other or item_id in merged:
+                continue
+            merged[item_id] = value
+    return merged
+
+def merge_stores(ours, theirs, base=None):
+    """
+    Merge two versions of a store. `base` (the common ancestor) is optional;
+    without it, queued work is merged as a plain union.
+    Scalar fields not covered below are taken from `ours`.
+    """
+    merged = _union(ours, theirs)
+
+    if "checked_matches" in ours or "checked_matches" in theirs:
+        checked = merged["checked_matches"] = seen.union(ours.get("checked_matches"), theirs.get("checked_matches"))
+    else:
+        # Bare store.json files (git merge driver): a side that logged a match and no longer queues it finished it
+        checked = {match_id for side in (ours, theirs) for match_id in side.get("challenge_log", {})
+                   if match_id not in side.get("unparsed_matches", {})}
+    merged["unparsed_matches"] = _merge_pending("unparsed_matches", base, ours, theirs, checked)
+    if "lost_matches" in ours or "lost_matches" in theirs:
+        merged["lost_matches"] = _union(ours.get("lost_matches", {}), theirs.get("lost_matches", {}))
+    if "privacy_issues" in ours or "privacy_issues" in theirs:
+        merged["privacy_issues"] = _merge_pending("privacy_issues", base, ours, theirs, ())
+
+    merged["challenge_log"] = _merge_challenge_log(ours.get("challenge_log", {}), theirs.get("challenge_log", {}))
+    merged["leaderboard"] = _merge_leaderboard(ours.get("leaderboard", {}), theirs.get("leaderboard", {}))
+    windows.rebuild(merged)  # Buckets are sums over the leaderboard; adding both sides would double count
+    if "duos" in ours or "duos" in theirs:
+        ours_log, theirs_log = ours.get("duo_log", {}), theirs.get("duo_log", {})
+        base_log = base.get("duo_log", {}) if base is not None else {}
+        shared = [entry for match_id, entry in ours_log.items() if match_id in theirs_log and match_id not in base_log]
+        merged["duos"] = duos.merge(ours.get("duos"), theirs.get("duos"),
+                                    base.get("duos", {}) if base is not None else None, shared)
+        if ours_log or theirs_log:
+            merged["duo_log"] = _union(ours_log, theirs_log)
+    if "streaks" in ours or "streaks" in theirs:
+        merged["streaks"] = streaks.merge(ours.get("streaks", {}), theirs.get("streaks", {}))
+    digests = [s["last_digest"] for s in (ours, theirs) if s.get("last_digest")]
+    if digests:
+        merged["last_digest"] = max(digests)
+
+    activity = _union(ours.get("friend_activity", {}), theirs.get("friend_activity", {}))
+    for sid, last_seen in theirs.get("friend_activity", {}).items():
+        activity[sid] = max(last_seen, activity[sid])
+    if activity:
+        merged["friend_activity"] = activity
+
+    pages = {tuple(p) for s in (ours, theirs) for p in s.get("checkpoint", {}).get("pages", [])}
+    if pages:
+        merged["checkpoint"] = _union(ours.get("checkpoint", {}), theirs.get("checkpoint", {}))
+        merged["checkpoint"]["pages"] = [list(p) for p in sorted(pages)]
+
+    return merged
+
+def _read(path):
+    with open(path, "r") as f:
+        text = f.read()
+    return codec.loads(text) if text.strip() else None  # git passes an empty %O for new files
+
+# ---------------- CLI / GIT MERGE DRIVERS ---------------- #
+# git config merge.store.driver "python store_merge.py %A %B --base %O -o %A"
+# git config merge.seen.driver "python store_merge.py --seen %A %B -o %A"
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Semantically merge two store.json versions.")
+    parser.add_argument("ours")
+    parser.add_argument("theirs", nargs="?", help="omit to just recompute totals of OURS")
+    parser.add_argument("--base", help="common ancestor, enables three-way merge of pending queues")
+    parser.add_argument("-o", "--output", help="defaults to overwriting OURS")
+    parser.add_argument("--leaderboard", metavar="TXT", help="also rewrite the leaderboard text file")
+    parser.add_argument("--seen", action="store_true", help="OURS and THEIRS are seen-match indexes (store.seen)")
+    args = parser.parse_args()
+
+    if args.seen:
+        try:
+            merged = seen.union(seen.SeenIndex.load(args.ours), seen.SeenIndex.load(args.theirs))
+        except ValueError as e:
+            print(f"[ERROR] Seen index merge failed: {e}")
+            raise SystemExit(1)
+        merged.save(args.output or args.ours)
+        print(f"[INFO] Merged seen index: {len(merged)} checked matches")
+        raise SystemExit(0)
+
+    base = _read(args.base) if args.base else None
+    try:
+        ours = _read(args.ours)
+        merged = merge_stores(ours, _read(args.theirs), base) if args.theirs else merge_stores(ours, ours)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Store merge failed: {e}")
+        raise SystemExit(1)
+
+    if "checked_matches" in merged:  # Only pre-seen-index files keep it inline
+        merged["checked_matches"] = {str(m): True for m in merged["checked_matches"]}
+    if "duos" in merged:
+        merged["duos"] = merged["duos"].to_json()
+    with open(args.output or args.ours, "w") as f:
+        codec.dump(merged, f, indent=2)
+    print(f"[INFO] Merged store: {len(merged.get('checked_matches', ()))} checked matches, "
+          f"{len(merged['leaderboard'])} players")
+
+    if args.leaderboard:
+        from data import load_steam_names
+        from main import write_leaderboard_txt
+        load_steam_names()
+        write_leaderboard_txt(merged, args.leaderboard)
@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import sys
+import time
+import codec
+import seen
+
+# ---------------- STORE SCHEMA ---------------- #
+# store["schema_version"] says which layout a store file uses:
+#
+#   1  Season 1: checked_matches values are ISO timestamps, match records
+#      keep `total_points_in_match`, no `win` / `challenge_log`.
+#   2  checked_matches values are true, match records keep `points`
+#      (+ `win`), challenge_log, friend_activity, checkpoint.
+#   3  current: checked_matches moves out of the JSON into the binary
+#      seen-match index <store>.seen (seen.py); in memory it is a SeenIndex.
+#
+# Each migration step rewrites one entry at a time and is idempotent, so the
+# same functions upgrade a loaded dict (load_store) or stream a file of any
+# size through `python store_schema.py migrate` without json.load-ing it.
+#
+# check() recomputes everything derived from the per-match records (match
+# points, season totals, daily buckets, queue overlap) and reports drift;
+# it runs on every load_store and costs a few ms for a season's store.
+
+SCHEMA_VERSION = 3
+
+# Top-level maps that are streamed one member at a time
+NESTED = ("checked_matches", "unparsed_matches", "leaderboard", "challenge_log", "daily", "hourly")
+
+def _v1_to_v2(key, member, value):
+    if key == "checked_matches" and not isinstance(value, bool):
+        return True  # Season 1 stored when it was checked; nothing reads that
+    if key == "leaderboard":
+        for record in value.get("matches", {}).values():
+            if "total_points_in_match" in record:
+                record["points"] = record.pop("total_points_in_match")
+    return value
+
+def _v2_to_v3(key, member, value):
+    return value  # Only moves checked_matches; see upgrade() / migrate_file()
+
+# version -> step that upgrades an entry from version-1 to version
+MIGRATIONS = {2: _v1_to_v2, 3: _v2_to_v3}
+
+def detect_version(store):
+    """Version of a loaded store: explicit, else sniffed from Season 1 markers."""
+    if "schema_version" in store:
+        return store["schema_version"]
+    checked = store.get("checked_matches")
+    if isinstance(checked, dict) and any(not isinstance(v, bool) for v in checked.values()):
+        return 1
+    for player in store.get("leaderboard", {}).values():
+        for record in player.get("matches", {}).values():
+            return 1 if "total_points_in_match" in record else 2
+    return SCHEMA_VERSION
+
+def _steps(source, target):
+    if target < source:
+        raise ValueError(f"Cannot downgrade a store from schema {source} to {target}")
+    if target > SCHEMA_VERSION:
+        raise ValueError(f"Unknown schema version {target}")
+    return [MIGRATIONS[v] for v in range(source + 1, target + 1)]
+
+def upgrade(store, target=SCHEMA_VERSION):
+    """Migrate a loaded store in place. Returns the store, schema_version first."""
+    source = detect_version(store)
+    steps = _steps(source, target)
+    for key in NESTED:
+        entries = store.get(key)
+        if not entries or not isinstance(entries, dict):
+            continue
+        for member in list(entries):
+            for step in steps:
+                entries[member] = step(key, member, entries[member])
+    if target >= 3 and isinstance(store.get("checked_matches"), dict):
+        store["checked_matches"] = seen.SeenIndex(store["checked_matches"])
+    if store.get("schema_version") == target:
+        return store
+    migrated = {"schema_version": target, **store}
+    migrated["schema_version"] = target
+    store.clear()
+    store.update(migrated)
+    return store
+
+# ---------------- STREAMING JSON ---------------- #
+
+_decoder = json.JSONDecoder()
+
+class _Reader:
+    """Pulls one JSON value at a time out of a file, reading in chunks."""
+
+    def __init__(self, f, chunk=1 << 16):
+        self.f = f
+        self.chunk = chunk
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Grow geometrically so a value larger than a chunk isn't re-parsed once per chunk
+        data = self.f.read(max(self.chunk, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch):
+        if self._peek() != ch:
+            raise ValueError(f"Expected {ch!r} in store file, found {self._peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def members(self):
+        """Yield the keys of the object at the cursor; consume each value before the next."""
+        self.expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            ch = self._peek()
+            self.pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ValueError(f"Expected ',' or '}}' in store file, found {ch!r}")
+
+class _Writer:
+    """Writes the same bytes as json.dump(store, f, indent=2), one entry at a time."""
+
+    def __init__(self, f):
+        self.f = f
+        self.first = [True]
+
+    def _key(self, key, depth):
+        self.f.write(("\n" if self.first[-1] else ",\n") + "  " * depth + json.dumps(key) + ": ")
+        self.first[-1] = False
+
+    def _value(self, value, depth):
+        self.f.write(codec.dumps(value, indent=2).replace("\n", "\n" + "  " * depth))
+
+    def begin(self):
+        self.f.write("{")
+
+    def item(self, key, value, depth=1):
+        self._key(key, depth)
+        self._value(value, depth)
+
+    def begin_object(self, key):
+        self._key(key, 1)
+        self.f.write("{")
+        self.first.append(True)
+
+    def end_object(self):
+        empty = self.first.pop()
+        self.f.write("}" if empty else "\n  }")
+
+    def end(self):
+        self.f.write("}" if self.first[0] else "\n}")
+
+def _sniff_version(path):
+    """Version of a store file from its first entries, without loading it."""
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _Reader(f)
+        for key in reader.members():
+            if key == "schema_version":
+                return reader.value()
+            if key == "checked_matches":
+                for _ in reader.members():
+                    return 2 if isinstance(reader.value(), bool) else 1
+                continue
+            if key == "leaderboard":
+                for _ in reader.members():
+                    player = reader.value()
+                    for record in player.get("matches", {}).values():
+                        return 1 if "total_points_in_match" in record else 2
+                continue
+            reader.value()
+    return SCHEMA_VERSION
+
+def migrate_file(src, dst, target=SCHEMA_VERSION):
+    """Stream src into dst at schema `target`; memory is bounded by the largest single entry."""
+    source = _sniff_version(src)
+    steps = _steps(source, target)
+    checked = seen.SeenIndex.load(seen.path_for(src)) if source >= 3 else seen.SeenIndex()
+    tmp = dst + ".tmp"
+    with open(src, "r", encoding="utf-8") as fin, open(tmp, "w", encoding="utf-8") as fout:
+        reader, writer = _Reader(fin), _Writer(fout)
+        writer.begin()
+        writer.item("schema_version", target)
+        for key in reader.members():
+            if key == "schema_version":
+                reader.value()
+            elif key == "checked_matches" and target >= 3:
+                for member in reader.members():
+                    reader.value()
+                    checked.add(member)
+            elif key in NESTED and reader._peek() == "{":
+                writer.begin_object(key)
+                for member in reader.members():
+                    value = reader.value()
+                    for step in steps:
+                        value = step(key, member, value)
+                    writer.item(member, value, depth=2)
+                writer.end_object()
+            else:
+                writer.item(key, reader.value())
+        writer.end()
+    if target >= 3:
+        checked.save(seen.path_for(dst))
+    os.replace(tmp, dst)
+
+# ---------------- INTEGRITY ---------------- #
+
+def check(store):
+    """Problems with derived data in a loaded, current-schema store, as readable strings."""
+    issues = []
+    checked = store.get("checked_matches", {})
+    provisional = {m for m, entry in store.get("unparsed_matches", {}).items() if entry.get("provisional")}
+    leaderboard = store.get("leaderboard", {})
+    daily = {}
+    awards_per_match = {}
+
+    for sid, player in leaderboard.items():
+        name = player.get("name", sid)
+        total = 0
+        for match_id, record in player.get("matches", {}).items():
+            points = sum(c["points"] for c in record.get("challenges", []))
+            if record.get("points") != points:
+                issues.append(f"{name} match {match_id}: points {record.get('points')} but challenges add up to {points}")
+            if match_id not in checked and match_id not in provisional:
+                issues.append(f"{name} match {match_id}: scored but missing from checked_matches")
+            total += points
+            awards_per_match[match_id] = awards_per_match.get(match_id, 0) + len(record.get("challenges", []))
+            if "date" in record:
+                day = daily.setdefault(record["date"][:10], {})
+                day[name] = day.get(name, 0) + points
+        if player.get("total_points") != total:
+            issues.append(f"{name}: total_points {player.get('total_points')} but matches add up to {total}")
+
+    for match_id in [m for m in store.get("unparsed_matches", {}) if m in checked]:
+        issues.append(f"match {match_id}: both checked and waiting for parse")
+
+    if "challenge_log" in store:
+        for match_id, count in awards_per_match.items():
+            logged = len(store["challenge_log"].get(match_id, []))
+            if logged != count:
+                issues.append(f"match {match_id}: {count} awards in leaderboard, {logged} in challenge_log")
+
+    if "hourly" in store:  # daily buckets are maintained (see windows.py), so they must agree
+        stored = {d: {n: p for n, p in names.items() if p} for d, names in store.get("daily", {}).items()}
+        rebuilt = {d: {n: p for n, p in names.items() if p} for d, names in daily.items()}
+        for day in sorted(set(stored) | set(rebuilt)):
+            if stored.get(day, {}) != rebuilt.get(day, {}):
+                issues.append(f"daily {day}: buckets disagree with match records")
+    return issues
+
+def repair(store):
+    """Recompute everything check() looks at from the per-match records."""
+    from store_merge import recompute_totals
+    import windows
+    recompute_totals(store.get("leaderboard", {}))
+    checked = store.get("checked_matches", {})
+    for match_id in [m for m in store.get("unparsed_matches", {}) if m in checked]:
+        del store["unparsed_matches"][match_id]
+    if "hourly" in store:
+        windows.rebuild(store)
+
+# ---------------- CLI ---------------- #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate and check store files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    v = sub.add_parser("version", help="print a store file's schema version")
+    v.add_argument("store")
+    m = sub.add_parser("migrate", help="stream a store file to another schema version")
+    m.add_argument("store")
+    m.add_argument("-o", "--output", help="default: rewrite in place")
+    m.add_argument("--to", type=int, default=SCHEMA_VERSION)
+    c = sub.add_parser("check", help="recompute derived data and report drift")
+    c.add_argument("store")
+    c.add_argument("--fix", action="store_true", help="repair and rewrite the file")
+    args = parser.parse_args()
+
+    if args.command == "version":
+        print(_sniff_version(args.store))
+    elif args.command == "migrate":
+        t0 = time.perf_counter()
+        migrate_file(args.store, args.output or args.store, args.to)
+        print(f"[SUCCESS] {args.output or args.store} at schema {args.to} ({time.perf_counter() - t0:.2f}s)")
+    else:
+        from data import load_store, save_store, acquire_store_lease, release_store_lease
+        if args.fix and not acquire_store_lease(args.store):
+            print(f"[WARN] Another run holds {args.store}, not repairing it.")
+            sys.exit(1)
+        try:
+            store = load_store(args.store)
+            t0 = time.perf_counter()
+            issues = check(store)
+            elapsed = (time.perf_counter() - t0) * 1000
+            for issue in issues:
+                print(f"[WARN] {issue}")
+            print(f"[INFO] {len(issues)} issue(s) in {args.store} ({elapsed:.1f} ms)")
+            if issues and args.fix:
+                repair(store)
+                save_store(store, args.store)
+                print(f"[SUCCESS] Repaired {args.store}")
+        finally:
+            if args.fix:
+                release_store_lease(args.store)
+        sys.exit(1 if issues and not args.fix else 0)
@@ -0,0 +1,162 @@
+from bisect import insort
+from datetime import datetime, timezone
+
+# ---------------- STREAKS ---------------- #
+# Running streak state per player, updated once per match in O(1):
+#
+#   store["streaks"][steam id] = {
+#       "current": {"win": 3, "points": -2, "no_kill": 0, "best_win": 5, ...},
+#       "base":    state before the oldest event in "recent",
+#       "recent":  [[start_time, match_id, win, kills, sign], ...]  oldest first
+#       "since":   start_time of the newest event folded into "base" (0 = none)
+#   }
+#
+# "win" and "points" are signed runs: +3 = three wins (or three matches with
+# net positive points) in a row, -2 = two losses (net penalties) in a row.
+# "no_kill" counts consecutive games without a kill. best_* keep the longest
+# runs of the season.
+#
+# Matches normally arrive in start_time order and are one step on "current".
+# A deferred match that gets parsed later lands in "recent" at its place in
+# time and the window is replayed from "base" (at most REPLAY_WINDOW steps).
+# Anything older than the window can't be placed and is left out.
+
+REPLAY_WINDOW = 50  # matches per player kept for out-of-order replay
+
+EMPTY = {"win": 0, "points": 0, "no_kill": 0, "best_win": 0, "best_loss": 0, "best_no_kill": 0}
+
+# Event layout, kept as plain lists so it serialises as-is
+TS, MATCH, WIN, KILLS, SIGN = range(5)
+
+def _run(run, up):
+    """Extend a signed run by one step up (+) or down (-)."""
+    if up:
+        return run + 1 if run > 0 else 1
+    return run - 1 if run < 0 else -1
+
+def step(state, event):
+    """State after one more match."""
+    win = _run(state["win"], event[WIN])
+    points = _run(state["points"], event[SIGN] > 0) if event[SIGN] else 0
+    no_kill = state["no_kill"] + 1 if event[KILLS] == 0 else 0
+    return {
+        "win": win,
+        "points": points,
+        "no_kill": no_kill,
+        "best_win": max(state["best_win"], win),
+        "best_loss": max(state["best_loss"], -win),
+        "best_no_kill": max(state["best_no_kill"], no_kill),
+    }
+
+def _replay(entry):
+    state = entry["base"]
+    for event in entry["recent"]:
+        state = step(state, event)
+    entry["current"] = state
+
+def _fold(entry):
+    """Move events past REPLAY_WINDOW out of the window into base."""
+    while len(entry["recent"]) > REPLAY_WINDOW:
+        event = entry["recent"].pop(0)
+        entry["base"] = step(entry["base"], event)
+        entry["since"] = event[TS]
+
+def record(store, sid, event):
+    """
+    Apply one match for one player. Returns (before, after) when the match
+    extended the streaks in order, None when it was replayed into the
+    window, already recorded, or too old to place.
+    """
+    entry = store.setdefault("streaks", {}).setdefault(str(sid), {
+        "current": dict(EMPTY), "base": dict(EMPTY), "recent": [], "since": 0,
+    })
+    recent = entry["recent"]
+    if any(e[MATCH] == event[MATCH] for e in recent):
+        return None
+    if not recent or (event[TS], event[MATCH]) >= (recent[-1][TS], recent[-1][MATCH]):
+        before = entry["current"]
+        recent.append(event)
+        entry["current"] = step(before, event)
+        _fold(entry)
+        return before, entry["current"]
+    if event[TS] < entry["since"]:
+        print(f"[INFO] Match {event[MATCH]} is older than the streak window for {sid}, streaks unchanged")
+        return None
+    insort(recent, event)
+    _fold(entry)
+    _replay(entry)
+    return None
+
+def event_for(match_time, match_id, player, points):
+    return [int(match_time.timestamp()), int(match_id), int(bool(player.get("win"))),
+            int(player.get("kills", 0) or 0), (points > 0) - (points < 0)]
+
+def record_match(store, match_id, match_time, friends, points_by_player):
+    """Record a match for every tracked friend in it. Returns {sid: (before, after)} for in-order updates."""
+    changes = {}
+    for p in friends:
+        sid = str(p.get("account_id"))
+        change = record(store, sid, event_for(match_time, match_id, p, points_by_player.get(sid, 0)))
+        if change:
+            changes[sid] = change
+    return changes
+
+def amend(store, sid, event):
+    """Swap in a new event for a match already in sid's window (its points changed) and replay."""
+    entry = store.get("streaks", {}).get(str(sid))
+    for i, e in enumerate(entry["recent"] if entry else []):
+        if e[MATCH] == event[MATCH]:
+            if e != event:
+                entry["recent"][i] = event
+                _replay(entry)
+            return True
+    return False
+
+def recorded(store, sid, match_id, start_time):
+    """Whether a match is already in sid's streaks: in the window, or older than it."""
+    entry = store.get("streaks", {}).get(str(sid))
+    if not entry:
+        return False
+    return start_time <= entry["since"] or any(e[MATCH] == int(match_id) for e in entry["recent"])
+
+def current(store, sid):
+    entry = store.get("streaks", {}).get(str(sid))
+    return entry["current"] if entry else dict(EMPTY)
+
+# ---------------- REBUILD / MERGE ---------------- #
+
+def rebuild(store):
+    """
+    Recompute streaks from the leaderboard's match records. Only matches that
+    scored something are recorded there, so this is a best-effort backfill
+    for stores from before streak tracking.
+    """
+    store["streaks"] = {}
+    for sid, player in store.get("leaderboard", {}).items():
+        events = []
+        for match_id, match in player.get("matches", {}).items():
+            if "date" not in match:
+                continue
+            when = datetime.strptime(match["date"], "%Y-%m-%d %H:%M UTC").replace(tzinfo=timezone.utc)
+            kills = (match.get("kda") or "0").split("/")[0]
+            kills = int(kills) if kills.isdigit() else 0  # "?" while a provisional record waits on the parse
+            points = match.get("points", match.get("total_points_in_match", 0))
+            events.append(event_for(when, match_id, {"win": match.get("win"), "kills": kills}, points))
+        for event in sorted(events):
+            record(store, sid, event)
+
+def merge(ours, theirs):
+    """Streaks for a merged store: both sides' windows unioned and replayed from our base."""
+    merged = {}
+    for sid in list(ours) + [s for s in theirs if s not in ours]:
+        a, b = ours.get(sid), theirs.get(sid)
+        if a is None or b is None:
+            merged[sid] = a or b
+            continue
+        entry = {"current": None, "base": a["base"], "since": a["since"], "recent": []}
+        events = {e[MATCH]: e for e in a["recent"] + b["recent"] if e[TS] >= a["since"]}
+        entry["recent"] = sorted(events.values())
+        _fold(entry)
+        _replay(entry)
+        merged[sid] = entry
+    return merged
@@ -1,27 +1,32 @@
+from challenges import RULES, MATCH_FIELDS
 from data import steam_names
 
-def is_match_fully_parsed(match_data, expected_friend_id=None):
+def required_fields(rules=RULES):
+    """(match fields, player fields) the active rules read, in rule order."""
+    match_fields, player_fields = [], []
+    for _, inputs, _ in rules:
+        for field in inputs:
+            fields = match_fields if field in MATCH_FIELDS else player_fields
+            if field not in fields:
+                fields.append(field)
+    return match_fields, player_fields
+
+MATCH_REQUIRED, PLAYER_REQUIRED = required_fields()
+
+def is_match_scorable(match_data, expected_friend_id=None):
     """
-    Validate match data based on specific challenge requirements 
-    rather than just the OpenDota 'version' flag.
+    Whether any rule can be scored yet: the match has all ten players and
+    shows the friend we found it through. Missing stats are for
+    missing_fields; they only hold back the rules that read them.
     """
-    # 1. Essential Match-Level Data
-    # Required for: Speedrunner Vibes, Comeback/Throw (Barracks)
-    essential_fields = [
-        "match_id", 
-        "duration", 
-        "barracks_status_radiant", 
-        "barracks_status_dire"
-    ]
-    for field in essential_fields:
-        if match_data.get(field) is None:
-            return False, f"Waiting for OpenDota to parse {field}"
+    if match_data.get("match_id") is None:
+        return False, "Waiting for OpenDota to parse match_id"
 
     players = match_data.get("players", [])
     if not players or len(players) < 10:
         return False, "Player data incomplete"
 
-    # 2. Identify tracked friends
+    # Identify tracked friends
     friends = [p for p in players if p.get("account_id") in steam_names]
 
     # Privacy Check
@@ -29,22 +34,31 @@ def is_match_fully_parsed(match_data, expected_friend_id=None):
         friend_name = steam_names.get(expected_friend_id, expected_friend_id)
         return False, f"{friend_name} has privacy enabled (Data missing)"
 
-    if not friends:
-        return True, None # No friends to track, no need to wait for parse
-
-    # 3. Deep Player-Level Validation
-    # These fields are required for Pudge/God/Greedy/AFK/Rampage challenges
-    required_player_fields = [
-        "kills", "deaths", "assists", "win", 
-        "tower_damage", "hero_id"
-    ]
-
+    # Every trigger and leaderboard record shows the hero
     for f in friends:
+        if f.get("hero_id") is None:
+            return False, f"Waiting for parse: {steam_names.get(f.get('account_id'), 'Unknown')} hero_id is null"
+    return True, None
+
+def missing_fields(match_data):
+    """Rule inputs OpenDota hasn't filled in yet, as readable strings ("duration", "Alice tower_damage")."""
+    missing = [field for field in MATCH_REQUIRED if match_data.get(field) is None]
+    for f in match_data.get("players", []):
+        if f.get("account_id") not in steam_names:
+            continue
         name = steam_names.get(f.get("account_id"), "Unknown")
-        
-        # Check standard stats
-        for field in required_player_fields:
-            if f.get(field) is None:
-                return False, f"Waiting for parse: {name} {field} is null"
+        missing += [f"{name} {field}" for field in PLAYER_REQUIRED if f.get(field) is None]
+    return missing
 
+def is_match_fully_parsed(match_data, expected_friend_id=None):
+    """
+    Validate match data against what the active rules read (challenges.RULES)
+    rather than just the OpenDota 'version' flag.
+    """
+    scorable, reason = is_match_scorable(match_data, expected_friend_id)
+    if not scorable:
+        return False, reason
+    missing = missing_fields(match_data)
+    if missing:
+        return False, f"Waiting for parse: {', '.join(missing[:3])}{' ...' if len(missing) > 3 else ''} null"
     return True, None
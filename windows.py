@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+
+# ---------------- ROLLING WINDOWS ---------------- #
+# Points per time bucket, so "last 7 days" is a sum over 7 buckets instead of
+# a rescan of every leaderboard[*].matches date string.
+#
+#   store["daily"]   {"YYYY-MM-DD": {player name: points}}   (Season1 schema, kept all season)
+#   store["hourly"]  {"YYYY-MM-DD HH": {player name: points}} (only the last HOURLY_KEEP hours)
+#
+# Awarding points is one bucket update; expiring the 24h window drops the
+# hourly buckets that fell out of it. Both maps are derived from the
+# leaderboard, so store_merge.py rebuilds them rather than merging them.
+
+WINDOWS = {
+    "24h": "LAST 24 HOURS",
+    "7d": "LAST 7 DAYS",
+    "30d": "LAST 30 DAYS",
+    "month": "THIS MONTH",
+}
+HOURLY_KEEP = 25  # hours: a full 24h window plus the bucket in progress
+
+def _day_key(when):
+    return when.strftime("%Y-%m-%d")
+
+def _hour_key(when):
+    return when.strftime("%Y-%m-%d %H")
+
+def record(store, match_time, name, points):
+    """Add one award to its day and hour buckets."""
+    day = store.setdefault("daily", {}).setdefault(_day_key(match_time), {})
+    day[name] = day.get(name, 0) + points
+    hour = store.setdefault("hourly", {}).setdefault(_hour_key(match_time), {})
+    hour[name] = hour.get(name, 0) + points
+
+def expire(store, now=None):
+    """Drop hourly buckets older than the 24h window."""
+    now = now or datetime.now(timezone.utc)
+    cutoff = _hour_key(now - timedelta(hours=HOURLY_KEEP - 1))
+    hourly = store.get("hourly", {})
+    for key in [k for k in hourly if k < cutoff]:
+        del hourly[key]
+
+def rebuild(store, now=None):
+    """Recompute daily/hourly buckets from the per-match records in the leaderboard."""
+    store["daily"] = {}
+    store["hourly"] = {}
+    for player in store.get("leaderboard", {}).values():
+        for match in player.get("matches", {}).values():
+            if "date" not in match:
+                continue
+            match_time = datetime.strptime(match["date"], "%Y-%m-%d %H:%M UTC").replace(tzinfo=timezone.utc)
+            points = sum(c["points"] for c in match.get("challenges", []))
+            record(store, match_time, player.get("name"), points)
+    store["daily"] = dict(sorted(store["daily"].items()))
+    store["hourly"] = dict(sorted(store["hourly"].items()))
+    expire(store, now)
+
+def _bucket_keys(window, now):
+    if window == "24h":
+        return "hourly", [_hour_key(now - timedelta(hours=h)) for h in range(24)]
+    if window == "month":
+        return "daily", [_day_key(now.replace(day=d)) for d in range(1, now.day + 1)]
+    days = {"7d": 7, "30d": 30}[window]
+    return "daily", [_day_key(now - timedelta(days=d)) for d in range(days)]
+
+def totals(store, window, now=None):
+    """[(player name, points)] for one window, best first. Players with no awards in it are left out."""
+    now = now or datetime.now(timezone.utc)
+    kind, keys = _bucket_keys(window, now)
+    buckets = store.get(kind, {})
+    summed = {}
+    for key in keys:
+        for name, points in buckets.get(key, {}).items():
+            summed[name] = summed.get(name, 0) + points
+    return sorted(summed.items(), key=lambda x: x[1], reverse=True)
+
+def title(window, now=None):
+    now = now or datetime.now(timezone.utc)
+    if window == "month":
+        return f"{WINDOWS[window]} ({now.strftime('%B %Y')})"
+    return WINDOWS[window]
+
+# ---------------- DIGEST ---------------- #
+
+def digest(store, now=None, limit=5):
+    """Discord message with the top of each window, None if nobody scored in any."""
+    now = now or datetime.now(timezone.utc)
+    tops = {window: totals(store, window, now)[:limit] for window in WINDOWS}
+    if not any(tops.values()):
+        return None
+    msg = [f"📅 **Leaderboard digest, {now.strftime('%Y-%m-%d')}**", ""]
+    for window in WINDOWS:
+        ranked = tops[window]
+        msg.append(f"**{title(window, now)}**")
+        if not ranked:
+            msg.append("No points yet")
+        for rank, (name, points) in enumerate(ranked, 1):
+            msg.append(f"{rank}. {name}: {points:+} pts")
+        msg.append("")
+    return "\n".join(msg)
+
+def digest_due(store, now=None):
+    """True on the first run of each UTC day; marks the digest as sent."""
+    today = _day_key(now or datetime.now(timezone.utc))
+    if store.get("last_digest") == today:
+        return False
+    store["last_digest"] = today
+    return True